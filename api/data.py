@@ -1,45 +1,227 @@
 """
 API Serverless para buscar dados do dashboard
 Vercel Function
+
+GET /api/data?workbook=<nome> (padrão: 'default')
+GET /api/data?sheets=<nome>,<nome>&include=statistics,column_mapping&fields=NOME,CIDADE
+GET /api/data?format=ndjson (aceita a mesma projeção)
+
+Projeção (listas separadas por vírgula), aplicada no banco:
+  sheets: só essas sheets
+  include: seções de cada sheet entre columns, records, statistics e
+    column_mapping (name e total_records vêm sempre; vazio = só eles)
+  fields: só essas chaves em records e columns
+
+A resposta traz um ETag com a versão dos dados do workbook (muda a cada
+upload). Com If-None-Match igual à versão atual responde 304 sem ler records.
+O JSON vai comprimido (brotli/gzip) conforme o Accept-Encoding; o corpo de
+cada versão é serializado e comprimido uma vez por instância.
+
+O corpo vem do documento gravado no upload (dashboard_payloads), enviado
+como está; sem ele, ou se estiver desatualizado, o documento é montado ao vivo.
+
+Com format=ndjson o documento vai em NDJSON (application/x-ndjson) à medida
+que é lido do banco: uma linha {"workbook": ...}, e por sheet uma linha
+{"sheet": ...} (sem os records) seguida de uma {"record": ...} por record.
+A memória não cresce com o workbook e os primeiros bytes saem antes dos
+records serem lidos; o corpo não passa pelo cache da instância.
 """
 from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from itertools import chain
 import json
+import hashlib
 import sys
 import os
 
 # Adicionar diretório raiz ao path
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
-from database.db import Database
+from database.backends import get_database
+from database.common import DEFAULT_WORKBOOK, read_after_cookie, etag_matches, document_projection
+from database.compression import (
+    IDENTITY, ResponseCache, StreamCompressor, negotiate_encoding, representation_etag, version_etags
+)
+
+# O navegador guarda a resposta, mas revalida (If-None-Match) a cada uso
+CACHE_CONTROL = 'private, no-cache'
+
+# Formatos da resposta (parâmetro format)
+RESPONSE_FORMATS = ('json', 'ndjson')
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+# Corpos por workbook e versão dos dados, reaproveitados enquanto a instância vive
+response_cache = ResponseCache()
+
+def list_param(params, name):
+    """Valores de um parâmetro separados por vírgula (pode se repetir); None se ausente"""
+    if name not in params:
+        return None
+    return [value.strip() for item in params[name] for value in item.split(',')]
+
+def projection_tag(version, projection):
+    """Versão usada no ETag e no cache: a dos dados, mais a projeção pedida"""
+    if projection is None:
+        return version
+    return f"{version}.{hashlib.md5(repr(projection).encode('utf-8')).hexdigest()[:12]}"
+
+def ndjson_tag(version):
+    """Versão usada no ETag do documento em NDJSON (outra representação dos mesmos dados)"""
+    return f"{version}.ndjson"
 
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
         """
-        Retorna todos os dados do dashboard
+        Retorna os dados do dashboard de um workbook
         Formato compatível com all_sheets_data.json
         """
         try:
-            db = Database()
-            data = db.get_all_sheets_data()
+            params = parse_qs(urlparse(self.path).query, keep_blank_values=True)
+            workbook = params.get('workbook', [DEFAULT_WORKBOOK])[0] or DEFAULT_WORKBOOK
+            accept_encoding = self.headers.get('Accept-Encoding')
+            response_format = params.get('format', ['json'])[0] or 'json'
+            if response_format not in RESPONSE_FORMATS:
+                self.send_json_error(400, f"Formato inválido: {response_format}")
+                return
+
+            try:
+                projection = document_projection(
+                    list_param(params, 'sheets'), list_param(params, 'include'), list_param(params, 'fields')
+                )
+            except ValueError as e:
+                self.send_json_error(400, str(e))
+                return
+
+            db = get_database()
+            db.read_after(read_after_cookie(self.headers.get('Cookie')))
+
+            # Só a versão (tabela sheets): os records não são lidos
+            version = projection_tag(db.data_version(workbook), projection)
+            if response_format == 'ndjson':
+                version = ndjson_tag(version)
+            cache_key = (workbook, projection)
+
+            if_none_match = self.headers.get('If-None-Match')
+            for etag in version_etags(version):
+                if etag_matches(if_none_match, etag):
+                    self.send_not_modified(etag)
+                    return
+
+            if response_format == 'ndjson':
+                self.send_ndjson(db.stream_sheets_data(workbook, *(projection or ())), projection, accept_encoding)
+                return
+
+            source = 'cache'
+            cached = response_cache.get(cache_key, version, accept_encoding)
+            if cached is None:
+                # Documento gravado no upload só existe completo (sem projeção)
+                bodies = db.get_dashboard_payload(workbook, version) if projection is None else None
+                if bodies is not None:
+                    source = 'payload'
+                    raw = bodies.pop(IDENTITY)
+                else:
+                    source = 'live'
+                    data = db.get_all_sheets_data(workbook, *(projection or ()))
+                    version = projection_tag(data['data_version'], projection)
+                    raw = json.dumps(data).encode()
+                cached = response_cache.put(cache_key, version, raw, accept_encoding, encoded=bodies)
+            body, encoding, cpu_ms = cached
 
             self.send_response(200)
             self.send_header('Content-type', 'application/json')
             self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('Access-Control-Expose-Headers', 'ETag, Server-Timing')
+            self.send_header('ETag', representation_etag(version, encoding))
+            self.send_header('Cache-Control', CACHE_CONTROL)
+            self.send_header('Vary', 'Accept-Encoding')
+            if encoding:
+                self.send_header('Content-Encoding', encoding)
+            # CPU gasto comprimindo esta resposta (0 quando já estava comprimida)
+            # e origem do corpo: cache da instância, documento gravado ou ao vivo
+            self.send_header('Server-Timing', f'compress;dur={cpu_ms:.2f}, source;desc={source}')
+            self.send_header('Content-Length', str(len(body)))
             self.end_headers()
 
-            self.wfile.write(json.dumps(data).encode())
+            self.wfile.write(body)
         except Exception as e:
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
+            self.send_json_error(500, str(e))
+
+    def send_ndjson(self, chunks, projection, accept_encoding):
+        """
+        Envia os blocos de stream_sheets_data à medida que são gerados
+
+        Em HTTP/1.1 o corpo vai em Transfer-Encoding: chunked; em HTTP/1.0
+        termina com o fechamento da conexão. O ETag é o da versão lida no
+        snapshot do stream (primeira linha). Com o corpo já iniciado o status
+        não pode mais mudar: um erro só interrompe o corpo (sem o chunk final).
+        """
+        try:
+            first = next(chunks)
+            version = ndjson_tag(projection_tag(json.loads(first)['workbook']['data_version'], projection))
+            encoding = negotiate_encoding(accept_encoding)
+            compressor = StreamCompressor(encoding) if encoding else None
+            chunked = self.request_version == 'HTTP/1.1'
+            if chunked:
+                self.protocol_version = 'HTTP/1.1'
+
+            self.send_response(200)
+            self.send_header('Content-type', NDJSON_CONTENT_TYPE)
             self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('Access-Control-Expose-Headers', 'ETag, Server-Timing')
+            self.send_header('ETag', representation_etag(version, encoding))
+            self.send_header('Cache-Control', CACHE_CONTROL)
+            self.send_header('Vary', 'Accept-Encoding')
+            if encoding:
+                self.send_header('Content-Encoding', encoding)
+            self.send_header('Server-Timing', 'source;desc=stream')
+            if chunked:
+                self.send_header('Transfer-Encoding', 'chunked')
+            self.send_header('Connection', 'close')
             self.end_headers()
 
-            error_response = {'error': str(e)}
-            self.wfile.write(json.dumps(error_response).encode())
+            try:
+                for chunk in chain([first], chunks):
+                    self.write_chunk(compressor.compress(chunk) if compressor else chunk, chunked)
+                if compressor:
+                    self.write_chunk(compressor.finish(), chunked)
+                if chunked:
+                    self.wfile.write(b'0\r\n\r\n')
+            except Exception as e:
+                print(f"[ERRO] Stream do documento interrompido: {e}")
+        finally:
+            chunks.close()
+
+    def write_chunk(self, data, chunked):
+        """Escreve e descarrega um bloco do corpo (como chunk HTTP, se chunked)"""
+        if not data:
+            return
+        if chunked:
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        else:
+            self.wfile.write(data)
+        self.wfile.flush()
+
+    def send_json_error(self, status_code, message):
+        """Erro em JSON: {"error": message}"""
+        self.send_response(status_code)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(json.dumps({'error': message}).encode())
+
+    def send_not_modified(self, etag):
+        """304 sem corpo: o cliente já tem a versão atual"""
+        self.send_response(304)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Expose-Headers', 'ETag')
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', CACHE_CONTROL)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.end_headers()
 
     def do_OPTIONS(self):
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, If-None-Match')
         self.end_headers()
@@ -0,0 +1,109 @@
+"""
+API Serverless para exportar os records de uma sheet em CSV ou XLSX
+Vercel Function
+
+GET /api/export?sheet=<nome>&format=csv|xlsx&workbook=<nome>
+
+Aceita os mesmos filtros de /api/records: cidade, tipo, grupo, nome,
+tem_contrato=true|false, data_contato_de=AAAA-MM-DD, data_contato_ate=AAAA-MM-DD
+"""
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, quote
+import json
+import sys
+import os
+
+# Adicionar diretório raiz ao path
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from database.backends import get_database
+from database.common import DEFAULT_WORKBOOK, RECORD_FILTERS, read_after_cookie
+from database.export import EXPORT_FORMATS, export_filename
+
+
+class _DownloadWriter:
+    """
+    Stream da resposta que envia os cabeçalhos no primeiro write: se a
+    sheet não existir nada foi enviado e ainda dá para responder 404
+    """
+
+    def __init__(self, handler, content_type, filename):
+        self.handler = handler
+        self.content_type = content_type
+        self.filename = filename
+        self.started = False
+
+    def write(self, data):
+        if not self.started:
+            self.started = True
+            self.handler.send_response(200)
+            self.handler.send_header('Content-Type', self.content_type)
+            self.handler.send_header(
+                'Content-Disposition',
+                f"attachment; filename*=UTF-8''{quote(self.filename)}"
+            )
+            self.handler.send_header('Access-Control-Allow-Origin', '*')
+            self.handler.end_headers()
+        self.handler.wfile.write(data)
+        return len(data)
+
+    def flush(self):
+        self.handler.wfile.flush()
+
+
+class handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        """Baixa os records (filtrados) da sheet, na ordem das colunas gravada"""
+        writer = None
+        try:
+            params = parse_qs(urlparse(self.path).query)
+            sheet_name = params.get('sheet', [None])[0]
+            if not sheet_name:
+                self.send_json_response(400, {'error': "Parâmetro 'sheet' é obrigatório"})
+                return
+
+            export_format = params.get('format', ['csv'])[0].lower()
+            if export_format not in EXPORT_FORMATS:
+                self.send_json_response(400, {'error': f"Formato inválido: {export_format}"})
+                return
+
+            writer = _DownloadWriter(
+                self, EXPORT_FORMATS[export_format], export_filename(sheet_name, export_format)
+            )
+            db = get_database()
+            db.read_after(read_after_cookie(self.headers.get('Cookie')))
+            try:
+                count = db.export_records(
+                    sheet_name, writer, export_format,
+                    filters={name: params[name][0] for name in RECORD_FILTERS if name in params},
+                    workbook=params.get('workbook', [DEFAULT_WORKBOOK])[0]
+                )
+            except ValueError as e:
+                if writer.started:
+                    raise
+                self.send_json_response(400, {'error': str(e)})
+                return
+
+            if count is None:
+                self.send_json_response(404, {'error': f"Sheet '{sheet_name}' não encontrada"})
+        except Exception as e:
+            # Com o download já iniciado o status não pode mais mudar
+            if writer is not None and writer.started:
+                print(f"[ERRO] Exportação interrompida: {e}")
+                return
+            self.send_json_response(500, {'error': str(e)})
+
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.end_headers()
+
+    def send_json_response(self, status_code, data):
+        """Helper to send JSON response"""
+        self.send_response(status_code)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(json.dumps(data).encode())
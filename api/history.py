@@ -0,0 +1,62 @@
+"""
+API Serverless para o histórico das estatísticas (tendência entre uploads)
+Vercel Function
+
+GET /api/history?workbook=<nome>&sheet=<nome>&since=AAAA-MM-DD
+
+Cada ponto é um upload: total_records, com_contrato, sem_contrato,
+contatos_realizados e contatos_pendentes da sheet naquele momento.
+"""
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import json
+import sys
+import os
+
+# Adicionar diretório raiz ao path
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from database.backends import get_database
+from database.common import DEFAULT_WORKBOOK, read_after_cookie
+from database.compression import encode_body
+
+class handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        """Retorna uma série por sheet, em ordem cronológica"""
+        try:
+            params = parse_qs(urlparse(self.path).query)
+            db = get_database()
+            db.read_after(read_after_cookie(self.headers.get('Cookie')))
+            try:
+                series = db.get_statistics_history(
+                    workbook=params.get('workbook', [DEFAULT_WORKBOOK])[0],
+                    sheet_name=params.get('sheet', [None])[0],
+                    since=params.get('since', [None])[0]
+                )
+            except ValueError as e:
+                self.send_json_response(400, {'error': str(e)})
+                return
+
+            self.send_json_response(200, {'sheets': series})
+        except Exception as e:
+            self.send_json_response(500, {'error': str(e)})
+
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.end_headers()
+
+    def send_json_response(self, status_code, data):
+        """Helper to send JSON response (comprimido conforme o Accept-Encoding)"""
+        body, encoding, _ = encode_body(json.dumps(data, default=str).encode(), self.headers.get('Accept-Encoding'))
+        self.send_response(status_code)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Vary', 'Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
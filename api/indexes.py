@@ -0,0 +1,46 @@
+"""
+API Serverless com o estado dos índices automáticos por chave do JSONB
+Vercel Function
+
+GET /api/indexes?workbook=<nome>  -> estado dos índices (todos os workbooks sem o parâmetro)
+
+Somente leitura: os índices são criados/removidos por /api/maintenance
+(Vercel Cron, com CRON_SECRET) e por migrate_to_neon.py, não pelo upload.
+Depois de um upload que muda o mapeamento, ficam defasados até a próxima
+execução do cron (até 24 h).
+"""
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import json
+import sys
+import os
+
+# Adicionar diretório raiz ao path
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from database.backends import get_database
+
+class handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        """Lista os índices com tamanho, uso e a cardinalidade que os justificou"""
+        try:
+            workbook = parse_qs(urlparse(self.path).query).get('workbook', [None])[0]
+            db = get_database()
+            self.send_json_response(200, {'indexes': db.record_index_status(workbook)})
+        except Exception as e:
+            self.send_json_response(500, {'error': str(e)})
+
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.end_headers()
+
+    def send_json_response(self, status_code, data):
+        """Helper to send JSON response"""
+        self.send_response(status_code)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(json.dumps(data, default=str).encode())
@@ -0,0 +1,72 @@
+"""
+API Serverless de manutenção do banco, chamada pelo Vercel Cron
+Vercel Function
+
+GET /api/maintenance  (Authorization: Bearer <CRON_SECRET>)
+
+Remove os records das versões substituídas pelos uploads, recalcula as
+estatísticas marcadas como desatualizadas (as leituras do dashboard servem o
+cache como está) e sincroniza os índices automáticos por chave do JSONB
+(CREATE/DROP INDEX CONCURRENTLY). Roda fora do upload, que não espera pela
+coleta nem pelos índices; o agendamento fica em vercel.json ("crons"). Sem CRON_SECRET configurada, recusa tudo.
+"""
+from http.server import BaseHTTPRequestHandler
+import hmac
+import json
+import sys
+import os
+
+# Adicionar diretório raiz ao path
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from database.backends import get_database
+
+def authorized(authorization):
+    """True se o cabeçalho Authorization traz o CRON_SECRET (enviado pelo Vercel Cron)"""
+    secret = os.getenv('CRON_SECRET')
+    if not secret or not authorization:
+        return False
+    return hmac.compare_digest(authorization, f"Bearer {secret}")
+
+class handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        """Executa as tarefas; cada uma roda mesmo se a anterior falhar"""
+        if not authorized(self.headers.get('Authorization')):
+            self.send_json_response(401, {'error': 'Não autorizado'})
+            return
+
+        result, errors = {}, {}
+        try:
+            db = get_database()
+        except Exception as e:
+            self.send_json_response(500, {'error': str(e)})
+            return
+
+        try:
+            result['removed_records'] = db.collect_old_versions()
+        except Exception as e:
+            print(f"[AVISO] Coleta de versões antigas falhou: {e}")
+            errors['collect_old_versions'] = str(e)
+
+        try:
+            result['refreshed_statistics'] = db.refresh_statistics()
+        except Exception as e:
+            print(f"[AVISO] Recálculo das estatísticas falhou: {e}")
+            errors['refresh_statistics'] = str(e)
+
+        try:
+            result['index_actions'] = db.sync_record_indexes()
+        except Exception as e:
+            print(f"[AVISO] Atualização dos índices por chave falhou: {e}")
+            errors['sync_record_indexes'] = str(e)
+
+        if errors:
+            result['errors'] = errors
+        self.send_json_response(500 if errors else 200, result)
+
+    def send_json_response(self, status_code, data):
+        """Helper to send JSON response"""
+        self.send_response(status_code)
+        self.send_header('Content-type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(data, default=str).encode())
@@ -0,0 +1,96 @@
+"""
+API Serverless para paginar os records de uma sheet
+Vercel Function
+
+GET /api/records?sheet=<nome>&after=<cursor>&limit=<n>&sort=<coluna>&order=asc|desc
+GET /api/records?sheet=<nome>&q=<busca>&offset=<n>&limit=<n>
+
+Em ambos, workbook=<nome> escolhe o workbook da sheet (padrão: 'default').
+
+Filtros (colunas tipadas, com índice): cidade, tipo, grupo, nome,
+tem_contrato=true|false, data_contato_de=AAAA-MM-DD, data_contato_ate=AAAA-MM-DD
+"""
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import json
+import sys
+import os
+
+# Adicionar diretório raiz ao path
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from database.backends import get_database
+from database.common import DEFAULT_PAGE_SIZE, DEFAULT_WORKBOOK, RECORD_FILTERS, read_after_cookie
+from database.compression import encode_body
+
+class handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        """
+        Retorna uma página de records da sheet
+        Use next_after da resposta como 'after' para buscar a próxima página
+        Com 'q', retorna os records que casam com a busca (ordenados por relevância)
+        """
+        try:
+            params = parse_qs(urlparse(self.path).query)
+            sheet_name = params.get('sheet', [None])[0]
+            if not sheet_name:
+                self.send_json_response(400, {'error': "Parâmetro 'sheet' é obrigatório"})
+                return
+
+            try:
+                limit = int(params.get('limit', [DEFAULT_PAGE_SIZE])[0])
+                offset = int(params.get('offset', [0])[0])
+            except ValueError:
+                self.send_json_response(400, {'error': "Parâmetros 'limit'/'offset' inválidos"})
+                return
+
+            workbook = params.get('workbook', [DEFAULT_WORKBOOK])[0]
+            db = get_database()
+            db.read_after(read_after_cookie(self.headers.get('Cookie')))
+            search = params.get('q', [''])[0].strip()
+            try:
+                if search:
+                    page = db.search_records(
+                        sheet_name, search, limit=limit, offset=offset, workbook=workbook
+                    )
+                else:
+                    page = db.get_sheet_records(
+                        sheet_name,
+                        after=params.get('after', [None])[0],
+                        limit=limit,
+                        sort=params.get('sort', [None])[0],
+                        descending=params.get('order', ['asc'])[0].lower() == 'desc',
+                        filters={name: params[name][0] for name in RECORD_FILTERS if name in params},
+                        workbook=workbook
+                    )
+            except ValueError as e:
+                self.send_json_response(400, {'error': str(e)})
+                return
+
+            if page is None:
+                self.send_json_response(404, {'error': f"Sheet '{sheet_name}' não encontrada"})
+                return
+
+            self.send_json_response(200, page)
+        except Exception as e:
+            self.send_json_response(500, {'error': str(e)})
+
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.end_headers()
+
+    def send_json_response(self, status_code, data):
+        """Helper to send JSON response (comprimido conforme o Accept-Encoding)"""
+        body, encoding, _ = encode_body(json.dumps(data).encode(), self.headers.get('Accept-Encoding'))
+        self.send_response(status_code)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Vary', 'Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
@@ -1,6 +1,9 @@
 """
 API Serverless para upload e processamento de Excel
 Vercel Function
+
+POST multipart com 'file' e, opcionalmente, 'workbook' (padrão: 'default'):
+as sheets do arquivo substituem as do workbook, sem afetar os demais.
 """
 from http.server import BaseHTTPRequestHandler
 import json
@@ -8,6 +11,7 @@ import sys
 import os
 import cgi
 import io
+import time
 import tempfile
 import pandas as pd
 from datetime import datetime, timedelta
@@ -16,7 +20,8 @@ import numpy as np
 # Adicionar diretório raiz ao path
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
-from database.db import Database
+from database.backends import get_database
+from database.common import DEFAULT_WORKBOOK, READ_AFTER_COOKIE, READ_AFTER_MAX_AGE
 
 ALLOWED_EXTENSIONS = {'xlsx', 'xls'}
 
@@ -145,6 +150,11 @@ class handler(BaseHTTPRequestHandler):
                 self.send_json_response(400, {'success': False, 'error': 'Nenhum arquivo enviado'})
                 return
 
+            workbook = (form.getfirst('workbook') or DEFAULT_WORKBOOK).strip() or DEFAULT_WORKBOOK
+            if len(workbook) > 255:
+                self.send_json_response(400, {'success': False, 'error': 'Nome de workbook muito longo'})
+                return
+
             file_item = form['file']
             if not file_item.filename:
                 self.send_json_response(400, {'success': False, 'error': 'Nenhum arquivo selecionado'})
@@ -163,9 +173,8 @@ class handler(BaseHTTPRequestHandler):
 
             # Process Excel
             excel_file = pd.ExcelFile(tmp_path)
-            db = Database()
-            sheets_processed = 0
-
+            db = get_database()
+            sheets = []
             for sheet_name in excel_file.sheet_names:
                 df = pd.read_excel(excel_file, sheet_name=sheet_name)
                 df.columns = df.columns.str.strip()
@@ -188,20 +197,60 @@ class handler(BaseHTTPRequestHandler):
                     'column_mapping': column_info,
                     'source_file': filename
                 }
-
-                sheet_data_clean = clean_nan(sheet_data)
-                db.save_sheet_data(sheet_data_clean)
-                sheets_processed += 1
+                sheets.append(clean_nan(sheet_data))
+
+            # Sheets gravadas em paralelo e publicadas juntas (tudo ou nada);
+            # uploads concorrentes do workbook são serializados
+            start = time.perf_counter()
+            results = db.save_workbook(sheets, mode='sync', refresh_stats=False, workbook=workbook)
+            load_seconds = time.perf_counter() - start
+
+            sheets_processed = len(results)
+            rows_loaded = sum(result['load_stats']['rows'] for result in results)
+            sync_totals = {'added': 0, 'changed': 0, 'removed': 0, 'unchanged': 0}
+            for result in results:
+                for key, count in result['sync_stats'].items():
+                    sync_totals[key] += count
+
+            # Recalcular no banco só as estatísticas desatualizadas do workbook
+            # (sheets com versão nova ou records alterados; os demais workbooks
+            # e as sheets sem mudança não são recalculados)
+            db.refresh_statistics(workbook=workbook)
+
+            # Documento do dashboard serializado uma vez; /api/data o envia pronto
+            try:
+                payload = db.store_dashboard_payload(workbook)
+                if payload:
+                    print(f"[OK] Documento do dashboard gravado: {payload['identity']} bytes")
+            except Exception as e:
+                print(f"[AVISO] Gravação do documento do dashboard falhou: {e}")
 
             # Remove temporary file
             os.unlink(tmp_path)
 
+            # Leituras seguintes deste navegador (outras instâncias da função)
+            # só usam a réplica depois que ela aplicar este upload
+            headers = {}
+            try:
+                position = db.write_position()
+                if position:
+                    headers['Set-Cookie'] = (f"{READ_AFTER_COOKIE}={position}; Max-Age={READ_AFTER_MAX_AGE}; "
+                                             "Path=/; SameSite=Lax")
+            except Exception as e:
+                print(f"[AVISO] Posição do WAL indisponível, cookie {READ_AFTER_COOKIE} não enviado: {e}")
+
             self.send_json_response(200, {
                 'success': True,
                 'message': 'Arquivo processado com sucesso',
-                'sheets_count': sheets_processed
-            })
-
+                'workbook': workbook,
+                'sheets_count': sheets_processed,
+                'sync_stats': sync_totals,
+                'load_stats': {
+                    'rows': rows_loaded,
+                    'seconds': round(load_seconds, 4),
+                    'rows_per_sec': round(rows_loaded / load_seconds, 1) if load_seconds > 0 else None
+                }
+            }, headers)
         except Exception as e:
             self.send_json_response(500, {'success': False, 'error': str(e)})
 
@@ -212,10 +261,12 @@ class handler(BaseHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
         self.end_headers()
 
-    def send_json_response(self, status_code, data):
+    def send_json_response(self, status_code, data, headers=None):
         """Helper to send JSON response"""
         self.send_response(status_code)
         self.send_header('Content-type', 'application/json')
         self.send_header('Access-Control-Allow-Origin', '*')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
         self.end_headers()
         self.wfile.write(json.dumps(data).encode())
@@ -0,0 +1,41 @@
+"""
+API Serverless para listar os workbooks carregados
+Vercel Function
+
+GET /api/workbooks
+"""
+from http.server import BaseHTTPRequestHandler
+import json
+import sys
+import os
+
+# Adicionar diretório raiz ao path
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from database.backends import get_database
+from database.common import read_after_cookie
+
+class handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        """Retorna os workbooks com quantidade de sheets e de records"""
+        try:
+            db = get_database()
+            db.read_after(read_after_cookie(self.headers.get('Cookie')))
+            self.send_json_response(200, {'workbooks': db.list_workbooks()})
+        except Exception as e:
+            self.send_json_response(500, {'error': str(e)})
+
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'GET, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.end_headers()
+
+    def send_json_response(self, status_code, data):
+        """Helper to send JSON response"""
+        self.send_response(status_code)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(json.dumps(data, default=str).encode())
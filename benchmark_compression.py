@@ -0,0 +1,98 @@
+"""
+Benchmark da compressão do documento do dashboard (/api/data)
+
+Monta o documento de um workbook com get_all_sheets_data e mede, para
+gzip e brotli (se instalado) em alguns níveis, o tamanho comprimido, os
+bytes economizados e o tempo de CPU (mediana) por compressão. A linha
+"cache" é o custo de uma resposta servida pelo ResponseCache da API.
+
+Uso: python benchmark_compression.py [workbook] [execuções]
+"""
+import os
+import sys
+import json
+import time
+import statistics
+from database.backends import get_database
+from database.common import DEFAULT_WORKBOOK
+from database.compression import (
+    ResponseCache, available_encodings, compress, DEFAULT_GZIP_LEVEL, DEFAULT_BROTLI_QUALITY
+)
+
+# Carregar variáveis do arquivo .env
+def load_env():
+    """Carrega variáveis de ambiente do arquivo .env"""
+    if os.path.exists('.env'):
+        with open('.env', 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#') and '=' in line:
+                    key, value = line.split('=', 1)
+                    os.environ[key.strip()] = value.strip()
+
+load_env()
+
+# Níveis comparados por codificação (o padrão da API está marcado com *)
+LEVELS = {
+    'gzip': (1, DEFAULT_GZIP_LEVEL, 9),
+    'br': (1, DEFAULT_BROTLI_QUALITY, 9, 11),
+}
+
+def cpu_timed(fn, runs):
+    """Executa fn várias vezes e retorna (mediana de CPU da thread em ms, último resultado)"""
+    timings = []
+    result = None
+    for _ in range(runs):
+        start = time.thread_time()
+        result = fn()
+        timings.append((time.thread_time() - start) * 1000)
+    return statistics.median(timings), result
+
+def main():
+    workbook = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_WORKBOOK
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    db = get_database()
+    data = db.get_all_sheets_data(workbook)
+    if not data['sheets']:
+        print(f"[ERRO] Workbook '{workbook}' sem sheets publicadas")
+        return 1
+
+    serialize_ms, raw = cpu_timed(lambda: json.dumps(data).encode(), runs)
+    records = sum(len(sheet['records']) for sheet in data['sheets'])
+
+    print("\n" + "="*60)
+    print(f"BENCHMARK DE COMPRESSÃO: '{workbook}' ({runs} execuções)")
+    print("="*60)
+    print(f"  {len(data['sheets'])} sheets, {records} records, JSON: {len(raw)} bytes "
+          f"(json.dumps: {serialize_ms:.2f} ms)")
+    print(f"\n  {'codificação':14s} {'bytes':>10s} {'razão':>8s} {'economia':>10s} {'CPU':>11s}")
+
+    for encoding in available_encodings():
+        for level in LEVELS[encoding]:
+            if encoding == 'gzip':
+                os.environ['HTTP_GZIP_LEVEL'] = str(level)
+                default = level == DEFAULT_GZIP_LEVEL
+            else:
+                os.environ['HTTP_BROTLI_QUALITY'] = str(level)
+                default = level == DEFAULT_BROTLI_QUALITY
+            cpu_ms, body = cpu_timed(lambda: compress(raw, encoding), runs)
+            label = f"{encoding}-{level}{'*' if default else ''}"
+            print(f"  {label:14s} {len(body):10d} {len(body) / len(raw):8.3f} "
+                  f"{len(raw) - len(body):10d} {cpu_ms:8.2f} ms")
+    os.environ.pop('HTTP_GZIP_LEVEL', None)
+    os.environ.pop('HTTP_BROTLI_QUALITY', None)
+
+    if 'br' not in available_encodings():
+        print("\n[AVISO] brotli não instalado (pip install Brotli): só gzip foi medido")
+
+    cache = ResponseCache()
+    accept = ', '.join(available_encodings())
+    cache.put(workbook, data['data_version'], raw, accept)
+    hit_ms, _ = cpu_timed(lambda: cache.get(workbook, data['data_version'], accept), runs)
+    print(f"\n  {'cache':14s} {'':10s} {'':8s} {'':10s} {hit_ms:8.2f} ms")
+    print("\n[OK] Resposta do cache evita json.dumps + compressão a cada requisição")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
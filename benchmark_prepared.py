@@ -0,0 +1,96 @@
+"""
+Benchmark dos prepared statements: latência por chamada com e sem PREPARE
+
+Executa os statements frequentes do registro (database/prepared.py) na
+mesma conexão, primeiro como SQL simples (parse + plano a cada chamada) e
+depois pelo nome (EXECUTE), e mostra a mediana por chamada de cada um.
+As gravações rodam dentro de uma transação desfeita no final.
+
+Uso: python benchmark_prepared.py "<sheet>" [execuções]
+"""
+import os
+import sys
+import time
+import statistics
+from psycopg2.extras import Json
+from database.db import Database
+from database.prepared import execute_prepared
+from database.common import DEFAULT_WORKBOOK
+
+# Carregar variáveis do arquivo .env
+def load_env():
+    """Carrega variáveis de ambiente do arquivo .env"""
+    if os.path.exists('.env'):
+        with open('.env', 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#') and '=' in line:
+                    key, value = line.split('=', 1)
+                    os.environ[key.strip()] = value.strip()
+
+load_env()
+
+def timed(fn, runs):
+    """Executa fn várias vezes e retorna a mediana em ms"""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return 1
+
+    sheet_name = sys.argv[1]
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    db = Database(use_pool=False)
+    conn = db.get_connection()
+    try:
+        with conn.cursor() as cur:
+            execute_prepared(cur, 'sheet_by_name', (DEFAULT_WORKBOOK, sheet_name), enabled=False)
+            sheet = cur.fetchone()
+            if not sheet:
+                print(f"[ERRO] Sheet '{sheet_name}' não encontrada")
+                return 1
+            sheet_id = sheet[0]
+
+            cases = (
+                ('sheet_by_name', (DEFAULT_WORKBOOK, sheet_name)),
+                ('records_page_asc', (sheet_id, 0, 101)),
+                ('upsert_statistics', (sheet_id, Json({'benchmark': True}))),
+                ('dashboard_document', (DEFAULT_WORKBOOK, None, None)),
+            )
+
+            print("\n" + "="*60)
+            print(f"BENCHMARK DE PREPARED STATEMENTS: '{sheet_name}' ({runs} execuções)")
+            print("="*60)
+            print(f"  {'statement':22s} {'SQL simples':>12s} {'preparado':>12s} {'economia':>10s}")
+
+            total_saved = 0.0
+            for name, params in cases:
+                def run(enabled):
+                    execute_prepared(cur, name, params, enabled=enabled)
+                    if cur.description:
+                        cur.fetchall()
+
+                run(True)  # PREPARE (uma vez por conexão)
+                plain_ms = timed(lambda: run(False), runs)
+                prepared_ms = timed(lambda: run(True), runs)
+                saved = plain_ms - prepared_ms
+                total_saved += saved
+                print(f"  {name:22s} {plain_ms:9.3f} ms {prepared_ms:9.3f} ms {saved:7.3f} ms")
+
+            print(f"\n[OK] Economia somada por rodada dos {len(cases)} statements: {total_saved:.3f} ms")
+            conn.rollback()
+    finally:
+        conn.rollback()
+        db.release_connection(conn)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""
+Benchmark da busca de records: trigramas sem acento x índice GIN em data
+
+Compara, para uma sheet e um termo:
+  1. search_records (coluna search_text + índice idx_records_search_trgm)
+  2. data::text ILIKE (o que dá para fazer com o GIN atual em data:
+     ele só acelera containment/existência de chaves, não substring)
+  3. data @> {"coluna": "valor"} (uso real do GIN em data: só igualdade exata)
+
+Uso: python benchmark_search.py "<sheet>" "<termo>" [execuções] [coluna]
+"""
+import os
+import sys
+import time
+import statistics
+from psycopg2.extras import Json
+from database.db import Database, escape_like
+
+# Carregar variáveis do arquivo .env
+def load_env():
+    """Carrega variáveis de ambiente do arquivo .env"""
+    if os.path.exists('.env'):
+        with open('.env', 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#') and '=' in line:
+                    key, value = line.split('=', 1)
+                    os.environ[key.strip()] = value.strip()
+
+load_env()
+
+def timed(fn, runs):
+    """Executa fn várias vezes e retorna (mediana em ms, último resultado)"""
+    timings = []
+    result = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), result
+
+def main():
+    if len(sys.argv) < 3:
+        print(__doc__)
+        return 1
+
+    sheet_name, term = sys.argv[1], sys.argv[2]
+    runs = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    column = sys.argv[4] if len(sys.argv) > 4 else 'NOME'
+
+    db = Database()
+    sheet = db.execute_query("SELECT id FROM sheets WHERE name = %s", (sheet_name,), fetch=True)
+    if not sheet:
+        print(f"[ERRO] Sheet '{sheet_name}' não encontrada")
+        return 1
+    sheet_id = sheet[0]['id']
+
+    def trigram():
+        return db.search_records(sheet_name, term, limit=100)['records']
+
+    def gin_ilike():
+        return db.execute_query("""
+            SELECT data FROM records
+            WHERE sheet_id = %s AND data::text ILIKE %s
+            ORDER BY id LIMIT 101
+        """, (sheet_id, '%' + escape_like(term) + '%'), fetch=True)
+
+    def gin_containment():
+        return db.execute_query("""
+            SELECT data FROM records
+            WHERE sheet_id = %s AND data @> %s
+            ORDER BY id LIMIT 101
+        """, (sheet_id, Json({column: term})), fetch=True)
+
+    print("\n" + "="*60)
+    print(f"BENCHMARK DE BUSCA: '{term}' em '{sheet_name}' ({runs} execuções)")
+    print("="*60)
+
+    for label, fn in (
+        ("Trigramas sem acento (search_text)", trigram),
+        ("GIN em data + data::text ILIKE", gin_ilike),
+        (f"GIN em data + data @> {{{column}: termo}}", gin_containment),
+    ):
+        median_ms, rows = timed(fn, runs)
+        print(f"  {label:45s} {median_ms:9.2f} ms  ({len(rows)} resultados)")
+
+    print("\n[EXPLAIN] Busca por trigramas:")
+    plan = db.execute_query("""
+        EXPLAIN (ANALYZE, BUFFERS)
+        SELECT data FROM records
+        WHERE sheet_id = %s
+          AND search_text LIKE '%%' || search_normalize(%s) || '%%'
+    """, (sheet_id, escape_like(term)), fetch=True)
+    for row in plan:
+        print("  " + row['QUERY PLAN'])
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
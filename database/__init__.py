@@ -2,5 +2,13 @@
 Database module for Dashboard Comercial
 """
 from .db import Database
+from .sqlite_db import SQLiteDatabase
+from .backends import get_database
+from .pool import get_pool_stats, close_all_pools
+from .instrumentation import get_query_timings, reset_query_timings
+from .compression import get_compression_stats, reset_compression_stats
 
-__all__ = ['Database']
+__all__ = [
+    'Database', 'SQLiteDatabase', 'get_database', 'get_pool_stats', 'close_all_pools',
+    'get_query_timings', 'reset_query_timings', 'get_compression_stats', 'reset_compression_stats'
+]
@@ -0,0 +1,20 @@
+"""
+Escolha do backend de armazenamento pela connection string
+"""
+import os
+from .sqlite_db import SQLiteDatabase, is_sqlite_url
+
+
+def get_database(connection_string=None, **kwargs):
+    """
+    Retorna o backend adequado para a connection string (env var DATABASE_URL)
+
+    sqlite:///caminho.db usa o SQLiteDatabase embutido; qualquer outra
+    URL usa o Database (PostgreSQL/Neon). kwargs vão para o construtor.
+    """
+    connection_string = connection_string or os.getenv('DATABASE_URL')
+    if is_sqlite_url(connection_string):
+        return SQLiteDatabase(connection_string, **kwargs)
+
+    from .db import Database
+    return Database(connection_string, **kwargs)
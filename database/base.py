@@ -0,0 +1,129 @@
+"""
+Interface comum dos backends de armazenamento do dashboard
+
+Database (PostgreSQL/Neon) e SQLiteDatabase implementam os mesmos métodos,
+com a mesma semântica, para que api/*.py e os scripts funcionem com
+qualquer um deles (veja database.get_database). As sheets pertencem a um
+workbook (DEFAULT_WORKBOOK quando omitido); workbooks são gravados, lidos e
+têm as estatísticas recalculadas de forma independente.
+"""
+from abc import ABC, abstractmethod
+from .common import DEFAULT_WORKBOOK
+
+
+class StorageBackend(ABC):
+    """Operações de leitura e gravação usadas pelo dashboard"""
+
+    @abstractmethod
+    def init_database(self, schema_file=None):
+        """Cria as tabelas (idempotente)"""
+
+    @abstractmethod
+    def execute_query(self, query, params=None, fetch=False):
+        """Executa SQL no dialeto do backend"""
+
+    @abstractmethod
+    def save_sheet_data(self, sheet_data, batch_size=None, mode='replace', refresh_stats=True,
+                        workbook=DEFAULT_WORKBOOK):
+        """Grava uma sheet completa; retorna o sheet_id"""
+
+    @abstractmethod
+    def save_workbook(self, sheets, batch_size=None, mode='replace', refresh_stats=True,
+                      max_workers=None, workbook=DEFAULT_WORKBOOK):
+        """Grava várias sheets com tudo ou nada; retorna as métricas por sheet"""
+
+    @abstractmethod
+    def sheet_checksum(self, sheet_name, workbook=DEFAULT_WORKBOOK):
+        """Contagem e checksum (md5 dos row_hash em ordem) dos records publicados"""
+
+    @abstractmethod
+    def refresh_statistics(self, force=False, workbook=None):
+        """Recalcula as estatísticas derivadas dos records (de um workbook ou de todos)"""
+
+    @abstractmethod
+    def get_all_sheets_data(self, workbook=DEFAULT_WORKBOOK, sheets=None, include=None, fields=None):
+        """
+        Documento do dashboard de um workbook (formato do all_sheets_data.json),
+        opcionalmente só com algumas sheets, seções e chaves dos records
+        """
+
+    @abstractmethod
+    def data_version(self, workbook=DEFAULT_WORKBOOK):
+        """Identificador do conteúdo de get_all_sheets_data (muda a cada upload)"""
+
+    @abstractmethod
+    def stream_sheets_data(self, workbook=DEFAULT_WORKBOOK, sheets=None, include=None, fields=None):
+        """Documento de get_all_sheets_data em NDJSON, gerado em blocos de bytes"""
+
+    @abstractmethod
+    def get_statistics_history(self, workbook=DEFAULT_WORKBOOK, sheet_name=None, since=None):
+        """Totais das estatísticas a cada upload, por sheet (séries de tendência)"""
+
+    @abstractmethod
+    def get_sheet_records(self, sheet_name, after=None, limit=None,
+                          sort=None, descending=False, filters=None, workbook=DEFAULT_WORKBOOK):
+        """Página de records de uma sheet (paginação keyset)"""
+
+    @abstractmethod
+    def search_records(self, sheet_name, query, limit=None, offset=0, workbook=DEFAULT_WORKBOOK):
+        """Busca sem acentos nos records de uma sheet"""
+
+    @abstractmethod
+    def export_records(self, sheet_name, out, export_format='csv', filters=None,
+                       workbook=DEFAULT_WORKBOOK):
+        """Escreve os records da sheet em CSV/XLSX no stream out; None se não existe"""
+
+    @abstractmethod
+    def list_workbooks(self):
+        """Workbooks com sheets publicadas: workbook, sheets, total_records, last_updated"""
+
+    @abstractmethod
+    def delete_all_data(self, workbook=None):
+        """Remove todas as sheets e records (ou só as de um workbook)"""
+
+    def pool_stats(self):
+        """Contadores do pool de conexões (None se o backend não usa pool)"""
+        return None
+
+    def write_position(self):
+        """Posição das escritas para read_after (None se o backend não tem réplica)"""
+        return None
+
+    def read_after(self, position):
+        """Leituras seguintes enxergam as escritas até position (no-op sem réplica)"""
+
+    def store_dashboard_payload(self, workbook=DEFAULT_WORKBOOK):
+        """Grava o documento do dashboard pronto para envio (None se o backend não guarda)"""
+        return None
+
+    def get_dashboard_payload(self, workbook=DEFAULT_WORKBOOK, version=None):
+        """Corpos gravados do documento por codificação, se da versão atual; senão None"""
+        return None
+
+    def collect_old_versions(self):
+        """Remove versões antigas dos records; retorna quantos foram removidos"""
+        return 0
+
+    def sync_record_indexes(self, workbook=None, min_rows=None):
+        """Cria/remove os índices automáticos por chave do JSONB; retorna as ações"""
+        return []
+
+    def record_index_status(self, workbook=None):
+        """Estado dos índices automáticos por chave do JSONB"""
+        return []
+
+    def load_workbook_stream(self, sheets, checkpoint=None, batch_size=None, max_workers=None,
+                             workbook=DEFAULT_WORKBOOK, on_batch=None):
+        """
+        save_workbook com os records lidos sob demanda (sheet_data['read_rows'])
+
+        Backends sem carga retomável leem cada sheet inteira e gravam com
+        save_workbook; checkpoint e on_batch são ignorados.
+        """
+        workbook_sheets = []
+        for sheet_data in sheets:
+            sheet_data = dict(sheet_data)
+            sheet_data['records'] = [record for _, _, record in sheet_data.pop('read_rows')(0)]
+            workbook_sheets.append(sheet_data)
+        return self.save_workbook(workbook_sheets, batch_size, refresh_stats=False,
+                                  max_workers=max_workers, workbook=workbook)
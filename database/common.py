@@ -0,0 +1,352 @@
+"""
+Funções e constantes compartilhadas pelos backends de armazenamento
+(PostgreSQL e SQLite): fingerprints, diff de records, colunas tipadas,
+cursores de paginação e normalização de busca
+"""
+import re
+import json
+import base64
+import hashlib
+from datetime import date
+from http.cookies import SimpleCookie, CookieError
+
+# Tamanho padrão dos lotes na carga em massa de records (env var DB_BATCH_SIZE)
+DEFAULT_BATCH_SIZE = 1000
+
+# Maior id possível de um record (coluna integer no Postgres); também é o
+# cursor inicial da paginação decrescente
+MAX_RECORD_ID = 2 ** 31 - 1
+
+# Tamanho de página padrão/máximo da paginação de records
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Workbook usado quando nenhum é informado (bancos de antes dos workbooks)
+DEFAULT_WORKBOOK = 'default'
+
+# Modos de gravação dos records de uma sheet
+# replace: apaga e recarrega tudo | sync: aplica só o diff por fingerprint
+SAVE_MODES = ('replace', 'sync')
+
+# Colunas tipadas de records, preenchidas a partir do column_mapping detectado
+TYPED_COLUMNS = ('nome', 'tipo', 'cidade', 'data_contato', 'tem_contrato', 'grupo')
+
+# Colunas tipadas que aceitam filtro por igualdade em get_sheet_records
+TEXT_FILTERS = ('nome', 'tipo', 'cidade', 'grupo')
+
+# Todos os filtros aceitos por get_sheet_records/export_records
+RECORD_FILTERS = TEXT_FILTERS + ('tem_contrato', 'data_contato_de', 'data_contato_ate')
+
+# Seções opcionais de cada sheet no documento do dashboard (projeção de
+# get_all_sheets_data); name e total_records vêm sempre
+DOCUMENT_SECTIONS = ('columns', 'records', 'statistics', 'column_mapping')
+
+# Cookie com a posição do primário após um upload (Database.write_position):
+# as leituras do mesmo navegador só usam a réplica quando ela chegou lá
+READ_AFTER_COOKIE = 'db_read_after'
+READ_AFTER_MAX_AGE = 300
+
+# Totais das estatísticas guardados em statistics_history a cada upload
+HISTORY_METRICS = ('com_contrato', 'sem_contrato', 'contatos_realizados', 'contatos_pendentes')
+
+# Colunas gravadas pela carga em massa (COPY/INSERT)
+RECORD_COLUMNS = ('sheet_id', 'version', 'data', 'row_key', 'row_hash') + TYPED_COLUMNS
+
+# Formatos de data aceitos (mesmos da função safe_to_date do schema)
+_ISO_DATE = re.compile(r'^\s*(\d{4})-(\d{1,2})-(\d{1,2})')
+_BR_DATE = re.compile(r'^\s*(\d{1,2})/(\d{1,2})/(\d{4})')
+
+# Mapeamento de acentos da busca (mesmo da função search_normalize do schema)
+_ACCENTS = str.maketrans('áàâãäåéèêëíìîïóòôõöúùûüçñý', 'aaaaaaeeeeiiiiooooouuuucny')
+
+
+def record_hash(record):
+    """Fingerprint estável do conteúdo de um record (independe da ordem das chaves)"""
+    canonical = json.dumps(record, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.md5(canonical.encode('utf-8')).hexdigest()
+
+
+def fingerprint_records(records, key_column=None, use_key=None):
+    """
+    Calcula (row_key, row_hash, record) para cada record
+
+    row_key usa o valor de key_column (ex: a coluna 'nome' detectada) quando
+    todos os records o possuem; caso contrário cai para o próprio hash.
+    use_key: decisão já tomada sobre todos os records da sheet (ao calcular
+    em lotes); None decide a partir dos records recebidos.
+    """
+    records = list(records)
+    if use_key is None:
+        use_key = bool(key_column) and all(
+            record.get(key_column) not in (None, '') for record in records
+        )
+
+    rows = []
+    for record in records:
+        row_hash = record_hash(record)
+        if use_key:
+            row_key = 'k:' + str(record[key_column])
+        else:
+            row_key = 'h:' + row_hash
+        rows.append((row_key, row_hash, record))
+    return rows
+
+
+def diff_records(rows, existing_rows, key_column=None):
+    """
+    Compara os records novos com os gravados (base do modo sync)
+
+    Args:
+        rows: saída de fingerprint_records para os records novos
+        existing_rows: (id, row_key, row_hash, data) dos records gravados;
+            data só é necessário quando row_hash é NULL (records antigos)
+        key_column: coluna-chave usada em fingerprint_records
+
+    Returns:
+        (added, changed, removed, unchanged): rows novas, tuplas
+        (id, row_key, row_hash, record) alteradas, ids removidos e a
+        quantidade de records iguais
+    """
+    key_prefix = rows[0][0][:2] if rows else None
+
+    existing = {}
+    for record_id, row_key, row_hash, data in existing_rows:
+        if row_hash is None:
+            # Records gravados antes dos fingerprints: calcula a partir do data
+            use_key = key_column if key_prefix == 'k:' else None
+            row_key, row_hash, _ = fingerprint_records([data], use_key)[0]
+        elif key_prefix == 'h:':
+            # Sem coluna-chave utilizável: casa apenas pelo conteúdo
+            row_key = 'h:' + row_hash
+        existing.setdefault(row_key, []).append((record_id, row_hash))
+
+    added, changed = [], []
+    unchanged = 0
+    for row_key, row_hash, record in rows:
+        matches = existing.get(row_key)
+        if not matches:
+            added.append((row_key, row_hash, record))
+            continue
+
+        record_id, old_hash = matches.pop(0)
+        if old_hash == row_hash:
+            unchanged += 1
+        else:
+            changed.append((record_id, row_key, row_hash, record))
+
+    removed = [record_id for matches in existing.values() for record_id, _ in matches]
+    return added, changed, removed, unchanged
+
+
+def search_normalize(text):
+    """Minúsculas e sem acentos (mesmo resultado da função search_normalize do schema)"""
+    return text.lower().translate(_ACCENTS)
+
+
+def json_text(value):
+    """Valor como texto, como o operador ->> do Postgres o devolveria"""
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return json.dumps(value, default=str, ensure_ascii=False)
+
+
+def parse_date(text):
+    """Converte texto em date (ISO ou DD/MM/AAAA); None se inválido"""
+    if not text:
+        return None
+    match = _ISO_DATE.match(text)
+    if match:
+        year, month, day = match.groups()
+    else:
+        match = _BR_DATE.match(text)
+        if not match:
+            return None
+        day, month, year = match.groups()
+    try:
+        return date(int(year), int(month), int(day))
+    except ValueError:
+        return None
+
+
+def read_after_cookie(cookie_header):
+    """Valor do cookie READ_AFTER_COOKIE no cabeçalho Cookie (None se ausente)"""
+    if not cookie_header:
+        return None
+    cookies = SimpleCookie()
+    try:
+        cookies.load(cookie_header)
+    except CookieError:
+        return None
+    morsel = cookies.get(READ_AFTER_COOKIE)
+    return morsel.value if morsel else None
+
+
+def etag_matches(if_none_match, etag):
+    """
+    True se o cabeçalho If-None-Match cobre etag (comparação fraca, RFC 9110):
+    o cliente já tem essa versão e a resposta pode ser 304
+    """
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return etag in (tag[2:] if tag.startswith('W/') else tag for tag in candidates)
+
+
+def document_projection(sheets=None, include=None, fields=None):
+    """
+    Normaliza a projeção do documento do dashboard
+
+    Args:
+        sheets: nomes das sheets (None = todas)
+        include: seções de DOCUMENT_SECTIONS (None = todas)
+        fields: chaves dos records, em records e columns (None = todas)
+
+    Returns:
+        (sheets, include, fields) como tuplas sem repetição, ou None para o
+        documento completo; seções desconhecidas geram ValueError
+    """
+    def unique(values):
+        return tuple(dict.fromkeys(value for value in values if value)) if values is not None else None
+
+    sheets, include, fields = unique(sheets), unique(include), unique(fields)
+    for section in include or ():
+        if section not in DOCUMENT_SECTIONS:
+            raise ValueError(f"Seção inválida: {section}")
+    if include is not None:
+        include = tuple(section for section in DOCUMENT_SECTIONS if section in include)
+    if sheets is None and fields is None and include in (None, DOCUMENT_SECTIONS):
+        return None
+    return sheets, include if include is not None else DOCUMENT_SECTIONS, fields
+
+
+def ndjson_line(kind, value):
+    """
+    Linha do documento em NDJSON ({kind: value}), em bytes
+
+    O documento em stream (stream_sheets_data) é uma linha 'workbook' e, por
+    sheet, uma linha 'sheet' (sem os records) seguida de uma 'record' por record.
+    """
+    return (json.dumps({kind: value}) + '\n').encode('utf-8')
+
+
+def ndjson_record(data):
+    """Linha 'record' a partir do JSON do record já em texto (sem decodificá-lo)"""
+    return b'{"record": ' + data.encode('utf-8') + b'}\n'
+
+
+def iso_date_param(text):
+    """Parâmetro de data opcional (ISO ou DD/MM/AAAA) em ISO; ValueError se inválido"""
+    if not text:
+        return None
+    value = parse_date(text)
+    if value is None:
+        raise ValueError(f"Data inválida: {text}")
+    return value.isoformat()
+
+
+def typed_values(record, column_mapping):
+    """
+    Valores das colunas tipadas (TYPED_COLUMNS) de um record
+
+    Segue o column_mapping de detect_column_types: textos para nome, tipo,
+    cidade e grupo, data do contato e se o contrato está preenchido.
+    """
+    column_mapping = column_mapping or {}
+
+    def text(field):
+        column = column_mapping.get(field)
+        return json_text(record.get(column)) if column else None
+
+    tem_contrato = None
+    if column_mapping.get('contrato'):
+        tem_contrato = text('contrato') is not None
+
+    return (
+        text('nome'),
+        text('tipo'),
+        text('cidade'),
+        parse_date(text('data_contato')),
+        tem_contrato,
+        text('grupo')
+    )
+
+
+def typed_filters_sql(filters, placeholder='%({})s', date_cast='::date'):
+    """
+    Monta as condições SQL (e parâmetros nomeados) dos filtros sobre as
+    colunas tipadas de records; filtros desconhecidos e datas inválidas
+    geram ValueError (antes de qualquer query ou byte da exportação)
+
+    placeholder/date_cast adaptam o SQL ao driver (psycopg2 ou sqlite3)
+    """
+    conditions, params = [], {}
+    for name, value in (filters or {}).items():
+        if value is None or value == '':
+            continue
+        param = f"filter_{name}"
+        if name in TEXT_FILTERS:
+            conditions.append(f"{name} = {placeholder.format(param)}")
+        elif name == 'tem_contrato':
+            conditions.append(f"tem_contrato = {placeholder.format(param)}")
+            value = value if isinstance(value, bool) else str(value).lower() in ('1', 'true', 'sim')
+        elif name == 'data_contato_de':
+            conditions.append(f"data_contato >= {placeholder.format(param)}{date_cast}")
+            value = iso_date_param(value)
+        elif name == 'data_contato_ate':
+            conditions.append(f"data_contato <= {placeholder.format(param)}{date_cast}")
+            value = iso_date_param(value)
+        else:
+            raise ValueError(f"Filtro inválido: {name}")
+        params[param] = value
+    return ''.join(f" AND {condition}" for condition in conditions), params
+
+
+def encode_cursor(sort_value, record_id):
+    """Cursor opaco da paginação keyset com ordenação por coluna"""
+    payload = json.dumps([sort_value, record_id], ensure_ascii=False)
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Inverso de encode_cursor: retorna (sort_value, record_id)"""
+    try:
+        sort_value, record_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        sort_value, record_id = str(sort_value), int(record_id)
+    except Exception:
+        raise ValueError(f"Cursor inválido: {cursor}")
+    return sort_value, _record_id(record_id, cursor)
+
+
+def decode_id_cursor(cursor):
+    """Cursor da paginação por id (o próprio id do record); ValueError se inválido"""
+    try:
+        record_id = int(cursor)
+    except (TypeError, ValueError):
+        raise ValueError(f"Cursor inválido: {cursor}")
+    return _record_id(record_id, cursor)
+
+
+def _record_id(record_id, cursor):
+    """record_id dentro da faixa da coluna id (integer no Postgres)"""
+    if not 0 <= record_id <= MAX_RECORD_ID:
+        raise ValueError(f"Cursor inválido: {cursor}")
+    return record_id
+
+
+def escape_like(term):
+    """Escapa os curingas do LIKE em um termo de busca"""
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def history_metrics(statistics):
+    """Valores de HISTORY_METRICS nas estatísticas do upload (None se ausentes)"""
+    statistics = statistics or {}
+    values = []
+    for name in HISTORY_METRICS:
+        value = statistics.get(name)
+        values.append(int(value) if isinstance(value, (int, float)) else None)
+    return tuple(values)
@@ -0,0 +1,297 @@
+"""
+Compressão das respostas JSON da API (gzip e, se instalado, brotli)
+
+O documento do dashboard repete o nome de cada coluna em cada record e
+comprime muito bem. encode_body escolhe a codificação pelo Accept-Encoding;
+ResponseCache guarda o corpo já comprimido por versão dos dados, para que a
+mesma versão não seja serializada nem comprimida de novo na mesma instância.
+StreamCompressor comprime um corpo enviado em blocos (NDJSON em stream).
+
+Bytes economizados e tempo de CPU por codificação ficam em um registro no
+nível do módulo, lido com get_compression_stats() (veja também
+benchmark_compression.py).
+"""
+import os
+import gzip
+import time
+import zlib
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Corpos menores que isso (bytes) vão sem compressão (env var HTTP_COMPRESS_MIN_BYTES)
+DEFAULT_MIN_BYTES = 1024
+
+# Níveis padrão: rápidos o bastante para respostas dinâmicas
+# (env vars HTTP_GZIP_LEVEL / HTTP_BROTLI_QUALITY)
+DEFAULT_GZIP_LEVEL = 6
+DEFAULT_BROTLI_QUALITY = 5
+
+# Níveis máximos, para corpos comprimidos uma vez e servidos muitas vezes
+# (documento gravado no upload)
+MAX_LEVELS = {'gzip': 9, 'br': 11}
+
+# Versões guardadas em ResponseCache (uma por chave; env var HTTP_CACHE_ENTRIES)
+DEFAULT_CACHE_ENTRIES = 8
+
+IDENTITY = 'identity'
+
+
+def available_encodings():
+    """Codificações suportadas, na ordem de preferência"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate_encoding(accept_encoding):
+    """
+    Codificação a usar para o cabeçalho Accept-Encoding (None = sem compressão)
+
+    Respeita q=0 e os pesos; em empate vale a ordem de available_encodings.
+    """
+    if not accept_encoding:
+        return None
+
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        name = name.strip().lower()
+        weight = 1.0
+        params = params.strip().lower()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        if name:
+            weights[name] = weight
+
+    candidates = []
+    for preference, encoding in enumerate(available_encodings()):
+        weight = weights.get(encoding, weights.get('*', 0.0))
+        if weight > 0:
+            candidates.append((-weight, preference, encoding))
+    return min(candidates)[2] if candidates else None
+
+
+def compress(body, encoding, level=None):
+    """Corpo comprimido com encoding ('br' ou 'gzip'); level sobrepõe o nível do env"""
+    if encoding == 'br':
+        quality = level or int(os.getenv('HTTP_BROTLI_QUALITY') or DEFAULT_BROTLI_QUALITY)
+        return brotli.compress(body, quality=quality)
+    if encoding == 'gzip':
+        level = level or int(os.getenv('HTTP_GZIP_LEVEL') or DEFAULT_GZIP_LEVEL)
+        return gzip.compress(body, compresslevel=level, mtime=0)
+    raise ValueError(f"Codificação inválida: {encoding}")
+
+
+class CompressionStats:
+    """Agregados de bytes e tempo de CPU por codificação"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Zera todos os agregados"""
+        with self._lock:
+            self.encodings = {}
+
+    def _entry(self, encoding):
+        return self.encodings.setdefault(encoding, {
+            'responses': 0, 'cache_hits': 0, 'compressions': 0,
+            'bytes_in': 0, 'bytes_out': 0, 'cpu_ms': 0.0, 'max_cpu_ms': 0.0
+        })
+
+    def record_compression(self, encoding, cpu_ms):
+        with self._lock:
+            entry = self._entry(encoding)
+            entry['compressions'] += 1
+            entry['cpu_ms'] += cpu_ms
+            entry['max_cpu_ms'] = max(entry['max_cpu_ms'], cpu_ms)
+
+    def record_response(self, encoding, bytes_in, bytes_out, cache_hit=False):
+        with self._lock:
+            entry = self._entry(encoding or IDENTITY)
+            entry['responses'] += 1
+            entry['cache_hits'] += int(cache_hit)
+            entry['bytes_in'] += bytes_in
+            entry['bytes_out'] += bytes_out
+
+    def snapshot(self):
+        """Cópia dos agregados, com bytes economizados e CPU média por compressão"""
+        with self._lock:
+            result = {}
+            for encoding, entry in self.encodings.items():
+                item = dict(entry)
+                item['bytes_saved'] = entry['bytes_in'] - entry['bytes_out']
+                if entry['bytes_in']:
+                    item['ratio'] = round(entry['bytes_out'] / entry['bytes_in'], 4)
+                if entry['compressions']:
+                    item['avg_cpu_ms'] = round(entry['cpu_ms'] / entry['compressions'], 3)
+                item['cpu_ms'] = round(entry['cpu_ms'], 3)
+                item['max_cpu_ms'] = round(entry['max_cpu_ms'], 3)
+                result[encoding] = item
+            return result
+
+
+compression_stats = CompressionStats()
+
+
+def timed_compress(body, encoding):
+    """compress medindo o tempo de CPU da thread; retorna (corpo, ms)"""
+    start = time.thread_time()
+    compressed = compress(body, encoding)
+    cpu_ms = (time.thread_time() - start) * 1000
+    compression_stats.record_compression(encoding, cpu_ms)
+    return compressed, cpu_ms
+
+
+def representation_etag(version, encoding=None):
+    """ETag forte de uma codificação da versão (cada codificação tem bytes próprios)"""
+    return f'"{version}-{encoding}"' if encoding else f'"{version}"'
+
+
+def version_etags(version):
+    """ETags de todas as codificações da versão (qualquer uma permite 304)"""
+    return [representation_etag(version, encoding) for encoding in (None,) + available_encodings()]
+
+
+def _too_small(body):
+    return len(body) < int(os.getenv('HTTP_COMPRESS_MIN_BYTES') or DEFAULT_MIN_BYTES)
+
+
+def encode_body(body, accept_encoding):
+    """
+    Corpo da resposta para o Accept-Encoding do cliente, sem cache
+
+    Returns:
+        (corpo, codificação ou None, ms de CPU na compressão)
+    """
+    encoding = negotiate_encoding(accept_encoding)
+    if encoding is None or _too_small(body):
+        compression_stats.record_response(None, len(body), len(body))
+        return body, None, 0.0
+
+    compressed, cpu_ms = timed_compress(body, encoding)
+    compression_stats.record_response(encoding, len(body), len(compressed))
+    return compressed, encoding, cpu_ms
+
+
+class StreamCompressor:
+    """
+    Compressão incremental de um corpo enviado em blocos, sem tamanho conhecido
+
+    Cada bloco sai comprimido e descarregado (sync flush), para o cliente
+    receber as linhas à medida que são geradas; finish() fecha o stream e
+    registra bytes e CPU da resposta em compression_stats.
+    """
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu_ms = 0.0
+        if encoding == 'br':
+            quality = int(os.getenv('HTTP_BROTLI_QUALITY') or DEFAULT_BROTLI_QUALITY)
+            self._compressor = brotli.Compressor(quality=quality)
+        elif encoding == 'gzip':
+            level = int(os.getenv('HTTP_GZIP_LEVEL') or DEFAULT_GZIP_LEVEL)
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        else:
+            raise ValueError(f"Codificação inválida: {encoding}")
+
+    def compress(self, data):
+        """Bloco comprimido de data, já descarregado"""
+        return self._timed(data, final=False)
+
+    def finish(self):
+        """Final do stream comprimido"""
+        tail = self._timed(b'', final=True)
+        compression_stats.record_compression(self.encoding, self.cpu_ms)
+        compression_stats.record_response(self.encoding, self.bytes_in, self.bytes_out)
+        return tail
+
+    def _timed(self, data, final):
+        start = time.thread_time()
+        if self.encoding == 'br':
+            body = self._compressor.process(data) + (
+                self._compressor.finish() if final else self._compressor.flush()
+            )
+        else:
+            body = self._compressor.compress(data) + self._compressor.flush(
+                zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH
+            )
+        self.cpu_ms += (time.thread_time() - start) * 1000
+        self.bytes_in += len(data)
+        self.bytes_out += len(body)
+        return body
+
+
+class ResponseCache:
+    """
+    Corpos de resposta por chave (ex: workbook) e versão dos dados
+
+    Guarda só a versão mais recente de cada chave, com o JSON original e as
+    codificações já pedidas; as chaves menos usadas saem quando passa de
+    max_entries.
+    """
+
+    def __init__(self, max_entries=None):
+        self.max_entries = int(max_entries or os.getenv('HTTP_CACHE_ENTRIES') or DEFAULT_CACHE_ENTRIES)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key, version, accept_encoding):
+        """
+        (corpo, codificação, ms de CPU) da versão em cache, comprimindo e
+        guardando a codificação pedida se ainda não existe; None se a versão
+        não está em cache
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+        return self._body(entry[1], accept_encoding, cached=True)
+
+    def put(self, key, version, raw, accept_encoding, encoded=None):
+        """
+        Guarda o JSON de uma versão (e, em encoded, corpos já comprimidos por
+        codificação); retorna o mesmo que get para accept_encoding
+        """
+        bodies = dict(encoded or {}, **{IDENTITY: raw})
+        with self._lock:
+            self._entries[key] = (version, bodies)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return self._body(bodies, accept_encoding, cached=False)
+
+    def _body(self, bodies, accept_encoding, cached):
+        raw = bodies[IDENTITY]
+        encoding = negotiate_encoding(accept_encoding)
+        if encoding is None or _too_small(raw):
+            compression_stats.record_response(None, len(raw), len(raw), cache_hit=cached)
+            return raw, None, 0.0
+
+        body, cpu_ms = bodies.get(encoding), 0.0
+        if body is None:
+            body, cpu_ms = timed_compress(raw, encoding)
+            bodies[encoding] = body
+            cached = False
+        compression_stats.record_response(encoding, len(raw), len(body), cache_hit=cached)
+        return body, encoding, cpu_ms
+
+
+def get_compression_stats():
+    """Agregados de bytes e CPU por codificação"""
+    return compression_stats.snapshot()
+
+
+def reset_compression_stats():
+    """Zera os agregados de compressão"""
+    compression_stats.reset()
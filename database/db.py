@@ -2,27 +2,362 @@
 Módulo de interação com banco de dados Neon PostgreSQL
 """
 import os
+import io
+import re
+import csv
 import json
+import time
+import threading
 import psycopg2
-from psycopg2.extras import RealDictCursor, Json
-from datetime import datetime
+import hashlib
+from psycopg2 import sql
+from contextlib import contextmanager, ExitStack
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2.extras import RealDictCursor, Json, execute_values
+from .base import StorageBackend
+from .pool import get_pool
+from .instrumentation import timed_connect, get_query_timings, reset_query_timings
+from .prepared import execute_prepared, prepared_enabled, register_statement, PREPARED_STATEMENTS
+from .export import EXPORT_FORMATS, CSV_BOM, write_xlsx
+from .compression import IDENTITY, MAX_LEVELS, available_encodings, compress
+from .common import (
+    DEFAULT_BATCH_SIZE, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, SAVE_MODES, DEFAULT_WORKBOOK,
+    HISTORY_METRICS, history_metrics, DOCUMENT_SECTIONS, document_projection,
+    ndjson_line, ndjson_record,
+    TYPED_COLUMNS, RECORD_COLUMNS,
+    fingerprint_records, diff_records, typed_values, iso_date_param,
+    typed_filters_sql, encode_cursor, decode_cursor, decode_id_cursor, escape_like, MAX_RECORD_ID
+)
 
-class Database:
-    def __init__(self, connection_string=None):
+# Métodos de carga em massa suportados
+LOAD_METHODS = ('copy', 'values', 'prepared')
+
+# Sheets gravadas ao mesmo tempo por save_workbook (env var DB_SAVE_CONCURRENCY)
+DEFAULT_SAVE_CONCURRENCY = 4
+
+# Namespaces dos advisory locks de escrita (pg_advisory_lock(namespace, hashtext(chave)));
+# a chave da sheet é "workbook/nome" (também usada por collect_sheet_versions()
+# no schema) e a do workbook é o próprio nome
+WRITER_LOCK_SHEET = 1
+WRITER_LOCK_WORKBOOK = 2
+
+# Segundos após uma escrita deste processo em que as leituras vão ao primário
+# mesmo com réplica configurada (env var DB_READ_FALLBACK_SECONDS)
+DEFAULT_READ_FALLBACK_SECONDS = 10
+
+# Última escrita deste processo por connection string do primário
+_last_writes = {}
+_last_writes_lock = threading.Lock()
+
+_LSN = re.compile(r'^[0-9A-Fa-f]{1,8}/[0-9A-Fa-f]{1,8}$')
+
+# Índices automáticos por chave do JSONB (sync_record_indexes): só em sheets
+# com ao menos DB_KEY_INDEX_MIN_ROWS records e chaves com 2+ valores distintos
+DEFAULT_KEY_INDEX_MIN_ROWS = 1000
+KEY_INDEX_PREFIX = 'idx_records_key_'
+
+# Versão publicada da sheet, lida no mesmo statement que os records (um
+# upload publicado entre a busca da sheet e a dos records não quebra a página)
+ACTIVE_VERSION = "(SELECT active_version FROM sheets WHERE id = %(sheet_id)s)"
+
+# Versão dos dados de um workbook (ETag de /api/data) e data da última
+# publicação. Muda quando uma sheet é publicada (active_version), removida
+# ou recriada (id), quando records da versão publicada são alterados fora do
+# upload (stale) e quando suas estatísticas são recalculadas (refreshed_at).
+DATA_VERSION_COLUMNS = """
+    md5(COALESCE(string_agg(
+        s.id || ':' || s.active_version || ':' || COALESCE(ss.refreshed_at::text, '')
+            || ':' || COALESCE(ss.stale::text, ''),
+        ',' ORDER BY s.id
+    ), '')) AS data_version,
+    max(s.last_updated) AS last_updated
+"""
+
+# Seções do documento do dashboard (DOCUMENT_SECTIONS): expressão no
+# json_build_object de cada sheet e o join de que ela depende.
+# 'columns' segue a ordem das chaves do primeiro record (mesma ordem que o
+# psycopg2 devolve ao decodificar o JSONB). 'statistics' vem do cache
+# sheet_statistics, com o blob gravado no upload como fallback.
+# $2 (nomes das sheets) e $3 (chaves dos records) são NULL no documento
+# completo; com $3 os records saem só com essas chaves, filtradas no Postgres.
+_SELECTED_SHEET = "($2::text[] IS NULL OR s.name = ANY($2))"
+_DOCUMENT_SECTIONS_SQL = {
+    'columns': (
+        """COALESCE((
+            SELECT json_agg(k.key ORDER BY k.ord)
+            FROM jsonb_object_keys(fr.data) WITH ORDINALITY AS k(key, ord)
+            WHERE $3::text[] IS NULL OR k.key = ANY($3)
+        ), '[]'::json)""",
+        """LEFT JOIN LATERAL (
+        SELECT data
+        FROM records
+        WHERE sheet_id = s.id AND version = s.active_version AND """ + _SELECTED_SHEET + """
+        ORDER BY id
+        LIMIT 1
+    ) fr ON true"""
+    ),
+    'records': (
+        "COALESCE(r.records, '[]'::json)",
+        """LEFT JOIN LATERAL (
+        SELECT json_agg(CASE WHEN $3::text[] IS NULL THEN data ELSE (
+            SELECT COALESCE(jsonb_object_agg(e.key, e.value), '{}'::jsonb)
+            FROM jsonb_each(data) AS e
+            WHERE e.key = ANY($3)
+        ) END ORDER BY id) AS records
+        FROM records
+        WHERE sheet_id = s.id AND version = s.active_version AND """ + _SELECTED_SHEET + """
+    ) r ON true"""
+    ),
+    'statistics': (
+        "COALESCE(ss.stats_data, st.stats_data, '{}'::jsonb)",
+        "LEFT JOIN statistics st ON s.id = st.sheet_id"
+    ),
+    'column_mapping': (
+        "COALESCE(cm.mapping, '{}'::jsonb)",
+        "LEFT JOIN column_mappings cm ON s.id = cm.sheet_id"
+    ),
+}
+DOCUMENT_PARAM_TYPES = ('text', 'text[]', 'text[]')
+
+
+def dashboard_document_query(include=DOCUMENT_SECTIONS):
+    """
+    Documento do dashboard em um único round trip, só com as seções include
+
+    Só as sheets do workbook $1 e só a versão publicada de cada uma são lidas;
+    sheets ainda sem versão publicada (primeiro upload em andamento) ficam de
+    fora. As sheets fora de $2 não entram no documento nem têm records lidos,
+    mas contam em data_version (a versão é sempre a do workbook inteiro).
+    """
+    sections = ''.join(f",\n        '{section}', {_DOCUMENT_SECTIONS_SQL[section][0]}" for section in include)
+    joins = ''.join(f"\n    {_DOCUMENT_SECTIONS_SQL[section][1]}" for section in include)
+    return f"""
+    SELECT COALESCE(json_agg(json_build_object(
+        'name', s.name,
+        'total_records', s.total_records{sections}
+    ) ORDER BY s.name) FILTER (WHERE {_SELECTED_SHEET}), '[]'::json) AS sheets,{DATA_VERSION_COLUMNS}
+    FROM sheets s
+    LEFT JOIN sheet_statistics ss ON s.id = ss.sheet_id{joins}
+    WHERE s.workbook = $1 AND s.active_version IS NOT NULL
+"""
+
+
+def document_statement(include=DOCUMENT_SECTIONS):
+    """Nome do statement do documento com as seções include (registrado no primeiro uso)"""
+    if include == DOCUMENT_SECTIONS:
+        return 'dashboard_document'
+    name = 'dashboard_document_' + ('_'.join(include) or 'totals')
+    if name not in PREPARED_STATEMENTS:
+        register_statement(name, dashboard_document_query(include), DOCUMENT_PARAM_TYPES)
+    return name
+
+
+DASHBOARD_DOCUMENT_QUERY = dashboard_document_query()
+register_statement('dashboard_document', DASHBOARD_DOCUMENT_QUERY, DOCUMENT_PARAM_TYPES)
+# O mesmo documento como texto JSON montado no Postgres (sem decodificar os
+# records no Python), para gravar em dashboard_payloads; last_updated no
+# formato de datetime.isoformat(), como no documento montado ao vivo
+register_statement('dashboard_payload', """
+    SELECT json_build_object(
+        'sheets', d.sheets,
+        'last_updated', CASE
+            WHEN date_part('microseconds', d.last_updated)::integer % 1000000 = 0
+            THEN to_char(d.last_updated, 'YYYY-MM-DD"T"HH24:MI:SS')
+            ELSE to_char(d.last_updated, 'YYYY-MM-DD"T"HH24:MI:SS.US')
+        END,
+        'data_version', d.data_version
+    )::text AS document, d.data_version
+    FROM (""" + DASHBOARD_DOCUMENT_QUERY + """) d
+""", DOCUMENT_PARAM_TYPES)
+register_statement('data_version', """
+    SELECT""" + DATA_VERSION_COLUMNS + """
+    FROM sheets s
+    LEFT JOIN sheet_statistics ss ON s.id = ss.sheet_id
+    WHERE s.workbook = $1 AND s.active_version IS NOT NULL
+""", ('text',))
+
+# Record do documento em stream, como texto: inteiro ou só as chaves em fields
+STREAM_RECORD = "data::text"
+STREAM_RECORD_FIELDS = """(
+    SELECT COALESCE(jsonb_object_agg(e.key, e.value), '{}'::jsonb)
+    FROM jsonb_each(data) AS e
+    WHERE e.key = ANY(%(fields)s)
+)::text"""
+
+
+def _records_to_csv(sheet_id, version, rows, column_mapping):
+    """Serializa um lote de (row_key, row_hash, record) em CSV para o COPY (NULL = \\N)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row_key, row_hash, record in rows:
+        values = (sheet_id, version, json.dumps(record, default=str), row_key, row_hash)
+        values += typed_values(record, column_mapping)
+        writer.writerow(['\\N' if value is None else value for value in values])
+    buffer.seek(0)
+    return buffer
+
+
+class Database(StorageBackend):
+    def __init__(self, connection_string=None, batch_size=None, load_method='copy',
+                 use_pool=True, pool_min=None, pool_max=None, prepared=None,
+                 read_connection_string=None):
         """
         Inicializa conexão com o banco
         connection_string: URL de conexão do Neon (env var DATABASE_URL)
+        read_connection_string: URL somente leitura (réplica) para as
+            leituras do dashboard (env var DATABASE_READ_URL; opcional)
+        batch_size: registros por lote na carga em massa (env var DB_BATCH_SIZE)
+        load_method: 'copy' (COPY ... FROM STDIN), 'values' (INSERT multi-linha)
+            ou 'prepared' (INSERT preparado com arrays por coluna)
+        use_pool: reutiliza conexões do pool do módulo entre chamadas
+        pool_min/pool_max: tamanho do pool (env vars DB_POOL_MIN / DB_POOL_MAX)
+        prepared: executa as queries frequentes como prepared statements
+            (env var DB_PREPARED_STATEMENTS; padrão: ligado, exceto no pooler do Neon)
         """
         self.connection_string = connection_string or os.getenv('DATABASE_URL')
         if not self.connection_string:
             raise ValueError("DATABASE_URL não configurada")
 
-    def get_connection(self):
-        """Retorna uma conexão com o banco"""
-        return psycopg2.connect(self.connection_string)
+        self.batch_size = int(batch_size or os.getenv('DB_BATCH_SIZE') or DEFAULT_BATCH_SIZE)
+        if self.batch_size <= 0:
+            raise ValueError("batch_size deve ser maior que zero")
+
+        if load_method not in LOAD_METHODS:
+            raise ValueError(f"load_method inválido: {load_method}")
+        self.load_method = load_method
+
+        # Métricas da última carga de records (rows, seconds, rows_per_sec)
+        self.last_load_stats = None
+        # Contagens do último save em modo sync (added, changed, removed, unchanged)
+        self.last_sync_stats = None
+
+        self.use_pool = use_pool
+        self.pool_min = pool_min
+        self.pool_max = pool_max
+        self.prepared = prepared_enabled(self.connection_string) if prepared is None else prepared
+
+        self.read_connection_string = read_connection_string or os.getenv('DATABASE_READ_URL') or None
+        self.read_prepared = (prepared_enabled(self.read_connection_string)
+                              if prepared is None else prepared)
+        # Posição (LSN) do primário que a réplica precisa ter aplicado (read_after)
+        self.min_read_lsn = None
+
+    def get_connection(self, read=False):
+        """
+        Retorna uma conexão com o banco (do pool, se habilitado)
+
+        read=True usa a réplica de leitura, se configurada, exceto logo após
+        uma escrita deste processo, se a réplica ainda não aplicou a posição
+        de read_after ou se ela estiver indisponível: nesses casos a leitura
+        vai ao primário e enxerga as próprias escritas.
+        """
+        if read and self.read_connection_string and not self._recent_write():
+            try:
+                conn = self._connect(self.read_connection_string)
+            except psycopg2.OperationalError as e:
+                print(f"[AVISO] Réplica de leitura indisponível, usando o primário: {e}")
+            else:
+                if self._replica_caught_up(conn):
+                    return conn
+                self.release_connection(conn)
+        return self._connect(self.connection_string)
+
+    def _connect(self, dsn):
+        """Conexão nova ou do pool de dsn, marcada com a sua origem"""
+        if not self.use_pool:
+            conn = timed_connect(psycopg2.connect, dsn)
+        else:
+            conn = get_pool(dsn, self.pool_min, self.pool_max).acquire()
+        conn.source_dsn = dsn
+        return conn
+
+    def release_connection(self, conn):
+        """Devolve a conexão ao pool de origem (ou fecha, se o pool estiver desabilitado)"""
+        if not self.use_pool:
+            conn.close()
+            return
+        dsn = getattr(conn, 'source_dsn', self.connection_string)
+        get_pool(dsn, self.pool_min, self.pool_max).release(conn)
+
+    def _is_replica(self, conn):
+        """True se a conexão veio da réplica de leitura"""
+        if not self.read_connection_string:
+            return False
+        return getattr(conn, 'source_dsn', None) == self.read_connection_string
+
+    def _mark_write(self):
+        """Registra uma escrita no primário (leituras seguintes deste processo vão a ele)"""
+        with _last_writes_lock:
+            _last_writes[self.connection_string] = time.monotonic()
+
+    def _recent_write(self):
+        window = float(os.getenv('DB_READ_FALLBACK_SECONDS') or DEFAULT_READ_FALLBACK_SECONDS)
+        last = _last_writes.get(self.connection_string)
+        return last is not None and time.monotonic() - last < window
+
+    def _replica_caught_up(self, conn):
+        """True se a réplica já aplicou min_read_lsn (ou se não é um standby)"""
+        if not self.min_read_lsn:
+            return True
+        with conn.cursor() as cur:
+            cur.execute(
+                """SELECT pg_last_wal_replay_lsn() IS NULL
+                          OR pg_last_wal_replay_lsn() >= %s::pg_lsn""",
+                (self.min_read_lsn,)
+            )
+            caught_up = cur.fetchone()[0]
+        conn.commit()
+        return caught_up
+
+    def write_position(self):
+        """
+        Posição atual do WAL no primário, para read_after em outro processo
+        (ex: devolvida ao navegador em um cookie após o upload). None sem
+        réplica de leitura configurada: não há atraso a compensar.
+        """
+        if not self.read_connection_string:
+            return None
+        conn = self._connect(self.connection_string)
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_current_wal_lsn()::text")
+                position = cur.fetchone()[0]
+            conn.commit()
+            return position
+        finally:
+            self.release_connection(conn)
+
+    def read_after(self, position):
+        """
+        Leituras desta instância só usam a réplica quando ela tiver aplicado
+        position (de write_position); posições inválidas são ignoradas
+        """
+        self.min_read_lsn = position if position and _LSN.match(position) else None
+
+    def pool_stats(self):
+        """Contadores de hits/misses do pool desta connection string"""
+        if not self.use_pool:
+            return None
+        return get_pool(self.connection_string, self.pool_min, self.pool_max).stats()
+
+    def query_timings(self):
+        """
+        Agregados de tempo por statement (chamadas, ms total/médio/máximo,
+        linhas, bytes enviados/recebidos), tempo de conexão e queries lentas
+        """
+        return get_query_timings()
+
+    def reset_query_timings(self):
+        """Zera os agregados de tempo das queries"""
+        reset_query_timings()
+
+    def _execute(self, cur, name, params=(), prefix=''):
+        """Executa um statement do registro de database.prepared"""
+        enabled = self.read_prepared if self._is_replica(cur.connection) else self.prepared
+        execute_prepared(cur, name, params, enabled=enabled, prefix=prefix)
 
     def execute_query(self, query, params=None, fetch=False):
-        """Executa uma query SQL"""
+        """Executa uma query SQL (no primário)"""
         conn = self.get_connection()
         try:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
@@ -30,145 +365,1306 @@ class Database:
                 if fetch:
                     return cur.fetchall()
                 conn.commit()
+                self._mark_write()
                 return cur.rowcount
         finally:
-            conn.close()
+            self.release_connection(conn)
+
+    def _read_query(self, query, params=None):
+        """SELECT do dashboard, na réplica de leitura quando disponível"""
+        conn = self.get_connection(read=True)
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(query, params or ())
+                rows = cur.fetchall()
+            conn.commit()
+            return rows
+        finally:
+            self.release_connection(conn)
+
+    def bulk_insert_records(self, cur, sheet_id, records, batch_size=None, column_mapping=None,
+                            version=1):
+        """
+        Carrega records em massa na tabela records, em lotes
+
+        Usa COPY ... FROM STDIN (load_method='copy'), INSERT com múltiplas
+        linhas por statement (load_method='values') ou o INSERT preparado
+        insert_records com um array por coluna (load_method='prepared'),
+        evitando um round trip por registro.
+
+        Returns:
+            dict com rows, batches, seconds e rows_per_sec
+        """
+        key_column = (column_mapping or {}).get('nome')
+        return self._insert_rows(
+            cur, sheet_id, fingerprint_records(records, key_column), batch_size, column_mapping,
+            version
+        )
+
+    def _insert_rows(self, cur, sheet_id, rows, batch_size=None, column_mapping=None, version=1):
+        """Insere em lotes uma lista de (row_key, row_hash, record) na versão indicada"""
+        batch_size = batch_size or self.batch_size
+        start = time.perf_counter()
+        batches = 0
+
+        for offset in range(0, len(rows), batch_size):
+            batch = rows[offset:offset + batch_size]
+            if self.load_method == 'copy':
+                cur.copy_expert(
+                    f"COPY records ({', '.join(RECORD_COLUMNS)}) "
+                    "FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                    _records_to_csv(sheet_id, version, batch, column_mapping)
+                )
+            elif self.load_method == 'prepared':
+                columns = list(zip(*[
+                    (json.dumps(record, default=str), row_key, row_hash)
+                    + typed_values(record, column_mapping)
+                    for row_key, row_hash, record in batch
+                ]))
+                self._execute(cur, 'insert_records', [sheet_id, version] + [list(c) for c in columns])
+            else:
+                execute_values(
+                    cur,
+                    f"INSERT INTO records ({', '.join(RECORD_COLUMNS)}) VALUES %s",
+                    [(sheet_id, version, Json(record), row_key, row_hash)
+                     + typed_values(record, column_mapping)
+                     for row_key, row_hash, record in batch],
+                    page_size=batch_size
+                )
+            batches += 1
+
+        seconds = time.perf_counter() - start
+        return {
+            'rows': len(rows),
+            'batches': batches,
+            'seconds': round(seconds, 4),
+            'rows_per_sec': round(len(rows) / seconds, 1) if seconds > 0 else None
+        }
+
+    def sync_records(self, cur, sheet_id, records, batch_size=None, column_mapping=None,
+                     version=1, base_version=None):
+        """
+        Monta a versão `version` da sheet a partir de base_version aplicando o diff
+
+        Compara o fingerprint de cada record com os da versão base: os
+        iguais são copiados dentro do Postgres (INSERT ... SELECT, sem
+        trafegar pela rede) e só os alterados e novos são enviados. A ordem
+        por id da versão base é mantida; records adicionados entram no fim.
+        As métricas da carga dos novos ficam em self.last_load_stats.
+
+        Returns:
+            dict com added, changed, removed e unchanged
+        """
+        sync_stats, self.last_load_stats = self._sync_version(
+            cur, sheet_id, records, batch_size, column_mapping, version, base_version
+        )
+        return sync_stats
+
+    def _sync_version(self, cur, sheet_id, records, batch_size, column_mapping,
+                      version, base_version):
+        """sync_records sem efeitos na instância: retorna (sync_stats, load_stats)"""
+        key_column = (column_mapping or {}).get('nome')
+        rows = fingerprint_records(records, key_column)
+
+        cur.execute("""
+            SELECT id, row_key, row_hash,
+                   CASE WHEN row_hash IS NULL THEN data END AS data
+            FROM records
+            WHERE sheet_id = %s AND version = %s
+            ORDER BY id
+        """, (sheet_id, base_version))
+
+        added, changed, removed, unchanged = diff_records(rows, cur.fetchall(), key_column)
+
+        # Alterados vão para uma tabela temporária e entram na nova versão na
+        # posição (id) do record original
+        cur.execute("""
+            DROP TABLE IF EXISTS sync_changed;
+            CREATE TEMP TABLE sync_changed (
+                id INTEGER, data JSONB, row_key TEXT, row_hash CHAR(32),
+                nome TEXT, tipo TEXT, cidade TEXT, data_contato DATE,
+                tem_contrato BOOLEAN, grupo TEXT
+            ) ON COMMIT DROP
+        """)
+        if changed:
+            execute_values(
+                cur, "INSERT INTO sync_changed VALUES %s",
+                [(record_id, Json(record), row_key, row_hash) + typed_values(record, column_mapping)
+                 for record_id, row_key, row_hash, record in changed],
+                page_size=batch_size or self.batch_size
+            )
+
+        skipped = removed + [record_id for record_id, _, _, _ in changed]
+        typed = ', '.join(('data', 'row_key', 'row_hash') + TYPED_COLUMNS)
+        cur.execute(f"""
+            INSERT INTO records (sheet_id, version, {typed})
+            SELECT %(sheet_id)s, %(version)s, {typed}
+            FROM (
+                SELECT id, {typed}
+                FROM records
+                WHERE sheet_id = %(sheet_id)s AND version = %(base_version)s
+                  AND NOT (id = ANY(%(skipped)s))
+                UNION ALL
+                SELECT id, {typed}
+                FROM sync_changed
+            ) kept
+            ORDER BY id
+        """, {
+            'sheet_id': sheet_id, 'version': version, 'base_version': base_version,
+            'skipped': skipped
+        })
+
+        load_stats = self._insert_rows(cur, sheet_id, added, batch_size, column_mapping, version)
+
+        return {
+            'added': len(added),
+            'changed': len(changed),
+            'removed': len(removed),
+            'unchanged': unchanged
+        }, load_stats
+
+    @contextmanager
+    def _advisory_lock(self, conn, namespace, name):
+        """
+        Advisory lock de sessão (pg_advisory_lock) mantido durante o bloco
 
-    def save_sheet_data(self, sheet_data):
+        O lock sobrevive a commits; se não for possível liberá-lo a conexão
+        é fechada (encerrar a sessão libera o lock) em vez de voltar ao pool.
+        """
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s, hashtext(%s))", (namespace, name))
+        conn.commit()
+        try:
+            yield
+        finally:
+            try:
+                conn.rollback()
+                with conn.cursor() as cur:
+                    cur.execute("SELECT pg_advisory_unlock(%s, hashtext(%s))", (namespace, name))
+                conn.commit()
+            except Exception:
+                conn.close()
+
+    def save_sheet_data(self, sheet_data, batch_size=None, mode='replace', refresh_stats=True,
+                        workbook=DEFAULT_WORKBOOK):
         """
         Salva dados de uma sheet completa no banco
 
+        Os records são gravados em uma nova versão (snapshot) da sheet, que
+        só fica visível quando sheets.active_version é trocado, em uma
+        transação curta no final; até lá os leitores continuam vendo a versão
+        anterior inteira, sem esperar por locks. Gravações da mesma sheet são
+        serializadas por advisory lock. A versão substituída é removida depois
+        por collect_old_versions().
+
         Args:
             sheet_data: dict com keys: name, total_records, records, statistics, column_mapping
+            batch_size: sobrescreve o tamanho de lote da carga em massa
+            mode: 'replace' (recarrega tudo) ou 'sync' (envia só o diff)
+            refresh_stats: atualiza as estatísticas do workbook após o commit (use
+                False ao salvar várias sheets e chame refresh_statistics() no final)
+            workbook: workbook da sheet (o nome é único dentro dele)
+
+        Returns:
+            sheet_id: ID da sheet salva (métricas da carga em self.last_load_stats
+            e, no modo sync, contagens do diff em self.last_sync_stats)
+        """
+        if mode not in SAVE_MODES:
+            raise ValueError(f"mode inválido: {mode}")
+
+        conn = self.get_connection()
+        try:
+            with self._advisory_lock(conn, WRITER_LOCK_SHEET, f"{workbook}/{sheet_data['name']}"), \
+                    conn.cursor() as cur:
+                pending = self._build_version(conn, cur, sheet_data, batch_size, mode, workbook)
+                self._publish_version(cur, sheet_data, pending)
+                conn.commit()
+                self._mark_write()
+                self.last_load_stats = pending['load_stats']
+                self.last_sync_stats = pending['sync_stats']
+        except Exception as e:
+            if not conn.closed:
+                conn.rollback()
+            raise e
+        finally:
+            self.release_connection(conn)
+
+        if refresh_stats:
+            self.refresh_statistics(workbook=workbook)
+        return pending['sheet_id']
+
+    def _build_version(self, conn, cur, sheet_data, batch_size=None, mode='replace',
+                       workbook=DEFAULT_WORKBOOK):
+        """
+        Passos 1 e 2 do save: reserva uma nova versão da sheet e grava os
+        records nela (commits próprios; nada fica visível aos leitores).
+        O chamador deve manter o advisory lock da sheet até publicar.
+
+        Returns:
+            dict com sheet_id, version, mapping_changed, load_stats e sync_stats
+        """
+        column_mapping = sheet_data.get('column_mapping') or {}
+
+        # 1. Inserir a sheet (ou reservar uma nova versão da existente)
+        sheet_id, active_version, version = self._reserve_version(conn, cur, sheet_data, workbook)
+
+        # 2. Gravar os records da nova versão (invisível aos leitores)
+        if mode == 'sync':
+            cur.execute("SELECT mapping FROM column_mappings WHERE sheet_id = %s", (sheet_id,))
+            previous = cur.fetchone()
+            mapping_changed = previous is not None and previous[0] != column_mapping
+
+            sync_stats, load_stats = self._sync_version(
+                cur, sheet_id, sheet_data.get('records', []), batch_size, column_mapping,
+                version, active_version
+            )
+        else:
+            key_column = column_mapping.get('nome')
+            load_stats = self._insert_rows(
+                cur, sheet_id, fingerprint_records(sheet_data.get('records', []), key_column),
+                batch_size, column_mapping, version
+            )
+            sync_stats = None
+            mapping_changed = False
+        conn.commit()
+
+        return {
+            'sheet_id': sheet_id,
+            'version': version,
+            'base_version': active_version,
+            'mapping_changed': mapping_changed,
+            'load_stats': load_stats,
+            'sync_stats': sync_stats
+        }
+
+    def _reserve_version(self, conn, cur, sheet_data, workbook=DEFAULT_WORKBOOK):
+        """Cria a sheet ou reserva uma nova versão dela; retorna (sheet_id, active_version, version)"""
+        self._execute(cur, 'reserve_sheet_version', (
+            workbook,
+            sheet_data['name'],
+            sheet_data['total_records'],
+            sheet_data.get('source_file', '')
+        ))
+        sheet_id, active_version, version = cur.fetchone()
+        conn.commit()
+
+        # Layout particionado: partição própria para a nova versão, em uma
+        # transação separada (o ATTACH espera as escritas em sheets de outras
+        # transações; junto com a reserva daria deadlock entre sheets paralelas)
+        cur.execute("SELECT prepare_records_partition(%s, %s)", (sheet_id, version))
+        conn.commit()
+        return sheet_id, active_version, version
+
+    def _publish_version(self, cur, sheet_data, pending):
+        """
+        Passo 3 do save: statistics, histórico, column_mapping e troca da
+        versão ativa (sem commit; várias sheets podem ser publicadas na mesma
+        transação)
+        """
+        sheet_id, version = pending['sheet_id'], pending['version']
+
+        if sheet_data.get('statistics'):
+            self._execute(cur, 'upsert_statistics', (
+                sheet_id, Json(sheet_data['statistics'])
+            ))
+
+        # Uma linha de histórico por upload, com os totais da versão publicada
+        self._execute(cur, 'insert_statistics_history', (
+            sheet_id, version, sheet_data['total_records'],
+            *history_metrics(sheet_data.get('statistics'))
+        ))
+
+        if sheet_data.get('column_mapping'):
+            self._execute(cur, 'upsert_column_mapping', (
+                sheet_id, Json(sheet_data['column_mapping'])
+            ))
+
+        # Mapeamento mudou: recalcular colunas tipadas dos records copiados
+        if pending['mapping_changed']:
+            cur.execute("SELECT refresh_record_typed_columns(%s, %s)", (sheet_id, version))
+
+        self._execute(cur, 'publish_sheet_version', (
+            version, sheet_data['total_records'], sheet_id
+        ))
+
+        # Sync sem diferenças: a nova versão tem os mesmos records e o mesmo
+        # mapeamento, então as estatísticas da anterior continuam valendo e a
+        # sheet não entra no próximo refresh_statistics
+        sync_stats = pending.get('sync_stats')
+        if (sync_stats and not pending['mapping_changed']
+                and not (sync_stats['added'] or sync_stats['changed'] or sync_stats['removed'])):
+            cur.execute(
+                "UPDATE sheet_statistics SET version = %s WHERE sheet_id = %s AND version = %s AND NOT stale",
+                (version, sheet_id, pending.get('base_version'))
+            )
+
+    def save_workbook(self, sheets, batch_size=None, mode='replace', refresh_stats=True,
+                      max_workers=None, workbook=DEFAULT_WORKBOOK):
+        """
+        Salva várias sheets em paralelo, com tudo ou nada para o workbook
+
+        Os records de cada sheet são gravados em uma nova versão por até
+        max_workers conexões simultâneas (env var DB_SAVE_CONCURRENCY); só se
+        todas derem certo as versões são publicadas juntas, em uma única
+        transação. Se alguma falhar nada é publicado (as versões gravadas
+        ficam para collect_old_versions) e a primeira exceção é relançada.
+
+        Args:
+            sheets: lista de sheet_data (mesmo formato de save_sheet_data)
+            max_workers: limite de sheets gravadas ao mesmo tempo
+            workbook: workbook das sheets; também é a chave do lock de escrita do workbook
+                que serializa uploads concorrentes dele
+
+        Returns:
+            lista, na ordem de sheets, de dicts com name, sheet_id,
+            load_stats e sync_stats
+        """
+        if mode not in SAVE_MODES:
+            raise ValueError(f"mode inválido: {mode}")
+
+        def build(conn, cur, sheet_data):
+            return self._build_version(conn, cur, sheet_data, batch_size, mode, workbook)
+
+        pending = self._save_versions(sheets, build, max_workers, workbook)
+
+        if refresh_stats:
+            self.refresh_statistics(workbook=workbook)
+
+        return [
+            {
+                'name': sheet_data['name'],
+                'sheet_id': item['sheet_id'],
+                'load_stats': item['load_stats'],
+                'sync_stats': item['sync_stats']
+            }
+            for sheet_data, item in zip(sheets, pending)
+        ]
+
+    def load_workbook_stream(self, sheets, checkpoint=None, batch_size=None, max_workers=None,
+                             workbook=DEFAULT_WORKBOOK, on_batch=None):
+        """
+        save_workbook retomável, para cargas grandes (ex: migrate_to_neon.py)
+
+        Os records de cada sheet são lidos sob demanda e gravados em lotes,
+        com commit por lote. O checkpoint guarda a versão em construção de
+        cada sheet; numa nova execução, se ela ainda é a última reservada, a
+        carga continua a partir dos records já gravados nela (contados no
+        banco), senão começa uma nova versão. A publicação continua sendo
+        tudo ou nada, no final.
+
+        Args:
+            sheets: sheet_data sem 'records' e com 'read_rows': função
+                start -> iterável de (row_key, row_hash, record) a partir do
+                record de índice start (ex: database.migration.iter_rows)
+            checkpoint: objeto com get(name) e set(name, state), que
+                persiste {'sheet_id', 'version'} entre execuções (None: sem retomada)
+            on_batch: função (name, gravados) chamada após cada lote
+
+        Returns:
+            lista, na ordem de sheets, de dicts com name, sheet_id,
+            version, resumed_from e load_stats
+        """
+        batch_size = batch_size or self.batch_size
+
+        def build(conn, cur, sheet_data):
+            name = sheet_data['name']
+            column_mapping = sheet_data.get('column_mapping') or {}
+            state = checkpoint.get(name) if checkpoint else None
+            loaded = self._resume_version(conn, cur, workbook, name, state)
+
+            if loaded is None:
+                sheet_id, _, version = self._reserve_version(conn, cur, sheet_data, workbook)
+                loaded = 0
+                if checkpoint:
+                    checkpoint.set(name, {'sheet_id': sheet_id, 'version': version})
+            else:
+                sheet_id, version = state['sheet_id'], state['version']
+            resumed_from = loaded
+
+            start = time.perf_counter()
+            batches = 0
+            batch = []
+            for row in sheet_data['read_rows'](loaded):
+                batch.append(row)
+                if len(batch) < batch_size:
+                    continue
+                self._insert_rows(cur, sheet_id, batch, batch_size, column_mapping, version)
+                conn.commit()
+                loaded += len(batch)
+                batches += 1
+                batch = []
+                if on_batch:
+                    on_batch(name, loaded)
+            if batch:
+                self._insert_rows(cur, sheet_id, batch, batch_size, column_mapping, version)
+                conn.commit()
+                loaded += len(batch)
+                batches += 1
+                if on_batch:
+                    on_batch(name, loaded)
+
+            seconds = time.perf_counter() - start
+            rows = loaded - resumed_from
+            return {
+                'sheet_id': sheet_id,
+                'version': version,
+                'mapping_changed': False,
+                'resumed_from': resumed_from,
+                'load_stats': {
+                    'rows': rows,
+                    'batches': batches,
+                    'seconds': round(seconds, 4),
+                    'rows_per_sec': round(rows / seconds, 1) if seconds > 0 else None
+                },
+                'sync_stats': None
+            }
+
+        pending = self._save_versions(sheets, build, max_workers, workbook)
+
+        return [
+            {
+                'name': sheet_data['name'],
+                'sheet_id': item['sheet_id'],
+                'version': item['version'],
+                'resumed_from': item['resumed_from'],
+                'load_stats': item['load_stats']
+            }
+            for sheet_data, item in zip(sheets, pending)
+        ]
+
+    def _resume_version(self, conn, cur, workbook, name, state):
+        """
+        Records já gravados na versão do checkpoint, ou None se ela não pode
+        ser retomada (outra versão foi reservada depois dela)
+        """
+        if not state:
+            return None
+
+        cur.execute(
+            "SELECT last_version FROM sheets WHERE id = %s AND workbook = %s AND name = %s",
+            (state['sheet_id'], workbook, name)
+        )
+        row = cur.fetchone()
+        if not row or row[0] != state['version']:
+            conn.commit()
+            return None
+
+        # A partição pode ter sido removida por collect_old_versions
+        cur.execute("SELECT prepare_records_partition(%s, %s)", (state['sheet_id'], state['version']))
+        cur.execute(
+            "SELECT count(*) FROM records WHERE sheet_id = %s AND version = %s",
+            (state['sheet_id'], state['version'])
+        )
+        loaded = cur.fetchone()[0]
+        conn.commit()
+        return loaded
+
+    def _save_versions(self, sheets, build, max_workers=None, workbook=DEFAULT_WORKBOOK):
+        """
+        Núcleo de save_workbook: trava workbook e sheets, executa
+        build(conn, cur, sheet_data) em paralelo e publica tudo junto
+
+        Returns:
+            lista, na ordem de sheets, do retorno de build
+        """
+        names = [sheet_data['name'] for sheet_data in sheets]
+        if len(set(names)) != len(names):
+            raise ValueError("Nomes de sheet repetidos no workbook")
+
+        max_workers = int(max_workers or os.getenv('DB_SAVE_CONCURRENCY') or DEFAULT_SAVE_CONCURRENCY)
+        if max_workers <= 0:
+            raise ValueError("max_workers deve ser maior que zero")
+        if self.use_pool:
+            # Uma conexão do pool fica com os locks e a publicação
+            pool = get_pool(self.connection_string, self.pool_min, self.pool_max)
+            max_workers = max(1, min(max_workers, pool.maxconn - 1))
+
+        def run(sheet_data):
+            conn = self.get_connection()
+            try:
+                with conn.cursor() as cur:
+                    return build(conn, cur, sheet_data)
+            except Exception:
+                if not conn.closed:
+                    conn.rollback()
+                raise
+            finally:
+                self.release_connection(conn)
+
+        conn = self.get_connection()
+        try:
+            with ExitStack() as locks:
+                # Locks de workbook e de todas as sheets nesta conexão (em ordem
+                # de nome, para não haver deadlock com outro save_workbook);
+                # ficam com ela até a publicação
+                locks.enter_context(self._advisory_lock(conn, WRITER_LOCK_WORKBOOK, workbook))
+                for name in sorted(names):
+                    locks.enter_context(
+                        self._advisory_lock(conn, WRITER_LOCK_SHEET, f"{workbook}/{name}")
+                    )
+
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    futures = [executor.submit(run, sheet_data) for sheet_data in sheets]
+                    try:
+                        pending = [future.result() for future in futures]
+                    except Exception:
+                        for future in futures:
+                            future.cancel()
+                        raise
+
+                with conn.cursor() as cur:
+                    for sheet_data, item in zip(sheets, pending):
+                        self._publish_version(cur, sheet_data, item)
+                conn.commit()
+                self._mark_write()
+        except Exception as e:
+            if not conn.closed:
+                conn.rollback()
+            raise e
+        finally:
+            self.release_connection(conn)
+
+        return pending
+
+    def sheet_checksum(self, sheet_name, workbook=DEFAULT_WORKBOOK):
+        """
+        Contagem e checksum dos records publicados de uma sheet
+
+        O checksum é o md5 da concatenação dos row_hash em ordem de id,
+        calculado no Postgres (só o resultado trafega); compare com o
+        checksum de database.migration.scan_sheets para os records de origem.
+
+        Returns:
+            dict com total_records (da tabela sheets), count e checksum,
+            ou None se a sheet não existe ou não tem versão publicada
+        """
+        rows = self.execute_query("""
+            SELECT s.total_records, count(r.id) AS count,
+                   md5(COALESCE(string_agg(r.row_hash, '' ORDER BY r.id), '')) AS checksum
+            FROM sheets s
+            LEFT JOIN records r ON r.sheet_id = s.id AND r.version = s.active_version
+            WHERE s.workbook = %s AND s.name = %s AND s.active_version IS NOT NULL
+            GROUP BY s.id, s.total_records
+        """, (workbook, sheet_name), fetch=True)
+        return dict(rows[0]) if rows else None
+
+    def collect_old_versions(self):
+        """
+        Remove os records de versões substituídas ou de uploads interrompidos
+
+        Pode rodar a qualquer momento (ex: depois de responder o upload):
+        sheets com gravação em andamento são puladas.
+
+        Returns:
+            quantidade de records removidos
+        """
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT collect_sheet_versions()")
+                removed = cur.fetchone()[0]
+                conn.commit()
+                self._mark_write()
+                return removed
+        except Exception as e:
+            conn.rollback()
+            raise e
+        finally:
+            self.release_connection(conn)
+
+    def sync_record_indexes(self, workbook=None, min_rows=None):
+        """
+        Cria ou remove índices de expressão para as chaves quentes do JSONB
+
+        Para cada sheet publicada (do workbook, ou de todos com None), as
+        colunas do column_mapping com 2 ou mais valores distintos na versão
+        ativa ganham um índice de ordenação por COALESCE(data->>chave, ''),
+        parcial por sheet (sheet_id = N; no layout particionado, na partição
+        da sheet), usado por get_sheet_records com sort. Filtros por
+        igualdade/intervalo já usam as colunas tipadas. Sheets com menos de
+        min_rows records (env var DB_KEY_INDEX_MIN_ROWS) não são indexadas;
+        índices que deixaram de valer (mapeamento mudou, sheet encolheu ou
+        foi removida) são removidos. Idempotente: rodar de novo sem mudanças
+        não cria nem remove nada.
 
         Returns:
-            sheet_id: ID da sheet salva
+            lista de dicts com action ('created'/'dropped'), index_name,
+            sheet_id e column_key
         """
+        min_rows = int(min_rows or os.getenv('DB_KEY_INDEX_MIN_ROWS') or DEFAULT_KEY_INDEX_MIN_ROWS)
+
         conn = self.get_connection()
         try:
             with conn.cursor() as cur:
-                # 1. Inserir ou atualizar sheet
+                cur.execute("SELECT records_is_partitioned()")
+                partitioned = cur.fetchone()[0]
+
+                # Cardinalidade observada das colunas mapeadas, em uma leitura por sheet
                 cur.execute("""
-                    INSERT INTO sheets (name, total_records, source_file)
-                    VALUES (%s, %s, %s)
-                    ON CONFLICT (name) DO UPDATE
-                    SET total_records = EXCLUDED.total_records,
-                        last_updated = CURRENT_TIMESTAMP
-                    RETURNING id
-                """, (
-                    sheet_data['name'],
-                    sheet_data['total_records'],
-                    sheet_data.get('source_file', '')
-                ))
-                sheet_id = cur.fetchone()[0]
-
-                # 2. Deletar records antigos
-                cur.execute("DELETE FROM records WHERE sheet_id = %s", (sheet_id,))
-
-                # 3. Inserir novos records
-                for record in sheet_data.get('records', []):
+                    SELECT s.id, s.total_records, s.active_version, cm.mapping
+                    FROM sheets s
+                    JOIN column_mappings cm ON cm.sheet_id = s.id
+                    WHERE s.active_version IS NOT NULL
+                      AND (%(workbook)s::text IS NULL OR s.workbook = %(workbook)s)
+                """, {'workbook': workbook})
+                desired = {}
+                for sheet_id, total_records, version, mapping in cur.fetchall():
+                    keys = sorted({key for key in (mapping or {}).values() if key})
+                    if total_records < min_rows or not keys:
+                        continue
                     cur.execute("""
-                        INSERT INTO records (sheet_id, data)
-                        VALUES (%s, %s)
-                    """, (sheet_id, Json(record)))
+                        SELECT e.key, count(DISTINCT e.value)
+                        FROM records r, jsonb_each_text(r.data) e
+                        WHERE r.sheet_id = %s AND r.version = %s
+                          AND e.key = ANY(%s) AND e.value <> ''
+                        GROUP BY e.key
+                    """, (sheet_id, version, keys))
+                    for key, distinct_values in cur.fetchall():
+                        if distinct_values >= 2:
+                            desired[self._key_index_name(sheet_id, key)] = (
+                                sheet_id, key, total_records, distinct_values
+                            )
 
-                # 4. Salvar/atualizar statistics
-                if sheet_data.get('statistics'):
-                    cur.execute("""
-                        INSERT INTO statistics (sheet_id, stats_data)
-                        VALUES (%s, %s)
-                        ON CONFLICT (sheet_id) DO UPDATE
-                        SET stats_data = EXCLUDED.stats_data,
-                            created_at = CURRENT_TIMESTAMP
-                    """, (sheet_id, Json(sheet_data['statistics'])))
-
-                # 5. Salvar/atualizar column_mapping
-                if sheet_data.get('column_mapping'):
+                cur.execute("""
+                    SELECT k.index_name, i.indisvalid
+                    FROM record_key_indexes k
+                    JOIN sheets s ON s.id = k.sheet_id
+                    LEFT JOIN pg_class c ON c.relname = k.index_name
+                         AND c.relnamespace = current_schema()::regnamespace
+                    LEFT JOIN pg_index i ON i.indexrelid = c.oid
+                    WHERE %(workbook)s::text IS NULL OR s.workbook = %(workbook)s
+                """, {'workbook': workbook})
+                registered = dict(cur.fetchall())
+
+                # Índices sem registro (sheet removida): de qualquer workbook
+                cur.execute("""
+                    SELECT c.relname
+                    FROM pg_class c
+                    JOIN pg_index i ON i.indexrelid = c.oid
+                    WHERE c.relnamespace = current_schema()::regnamespace
+                      AND c.relname LIKE %s
+                      AND NOT EXISTS (SELECT 1 FROM record_key_indexes k WHERE k.index_name = c.relname)
+                """, (KEY_INDEX_PREFIX.replace('_', '\\_') + '%',))
+                orphans = [row[0] for row in cur.fetchall()]
+            conn.commit()
+
+            actions = []
+            # CREATE/DROP INDEX CONCURRENTLY não rodam em transação
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                for index_name in orphans + [name for name in registered if name not in desired]:
+                    self._drop_key_index(cur, index_name, partitioned)
+                    actions.append({'action': 'dropped', 'index_name': index_name})
+
+                for index_name, (sheet_id, key, total_records, distinct_values) in desired.items():
+                    if not registered.get(index_name):
+                        # Inexistente ou inválido (build CONCURRENTLY interrompido)
+                        if index_name in registered:
+                            self._drop_key_index(cur, index_name, partitioned)
+                        self._create_key_index(cur, index_name, sheet_id, key, partitioned)
+                        actions.append({'action': 'created', 'index_name': index_name,
+                                        'sheet_id': sheet_id, 'column_key': key})
                     cur.execute("""
-                        INSERT INTO column_mappings (sheet_id, mapping)
-                        VALUES (%s, %s)
-                        ON CONFLICT (sheet_id) DO UPDATE
-                        SET mapping = EXCLUDED.mapping,
-                            created_at = CURRENT_TIMESTAMP
-                    """, (sheet_id, Json(sheet_data['column_mapping'])))
+                        INSERT INTO record_key_indexes
+                            (index_name, sheet_id, column_key, total_records, distinct_values)
+                        VALUES (%s, %s, %s, %s, %s)
+                        ON CONFLICT (index_name) DO UPDATE
+                        SET total_records = EXCLUDED.total_records,
+                            distinct_values = EXCLUDED.distinct_values,
+                            checked_at = CURRENT_TIMESTAMP
+                    """, (index_name, sheet_id, key, total_records, distinct_values))
+            return actions
+        finally:
+            if not conn.closed:
+                conn.autocommit = False
+            self.release_connection(conn)
+
+    @staticmethod
+    def _key_index_name(sheet_id, key):
+        """Nome estável (até 63 caracteres) do índice de uma chave da sheet"""
+        return f"{KEY_INDEX_PREFIX}{sheet_id}_{hashlib.md5(key.encode('utf-8')).hexdigest()[:12]}"
+
+    def _create_key_index(self, cur, index_name, sheet_id, key, partitioned):
+        """Índice de ordenação por data->>key da sheet (mesma expressão de get_sheet_records)"""
+        expression = sql.SQL("(COALESCE(data->>{}, '')), id").format(sql.Literal(key))
+        if partitioned:
+            # Partição da sheet (subparticionada por versão): o índice é
+            # propagado para as versões atuais e futuras; sem CONCURRENTLY
+            query = sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} ({})").format(
+                sql.Identifier(index_name), sql.Identifier(f"records_s{sheet_id}"), expression
+            )
+        else:
+            query = sql.SQL(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON records (version, {}) WHERE sheet_id = {}"
+            ).format(sql.Identifier(index_name), expression, sql.Literal(sheet_id))
+        # Texto pronto: a instrumentação de queries agrupa por string de SQL
+        cur.execute(query.as_string(cur))
 
+    def _drop_key_index(self, cur, index_name, partitioned):
+        """Remove o índice e o seu registro"""
+        concurrently = sql.SQL('') if partitioned else sql.SQL('CONCURRENTLY ')
+        cur.execute(sql.SQL("DROP INDEX {}IF EXISTS {}").format(
+            concurrently, sql.Identifier(index_name)
+        ).as_string(cur))
+        cur.execute("DELETE FROM record_key_indexes WHERE index_name = %s", (index_name,))
+
+    def record_index_status(self, workbook=None):
+        """
+        Estado dos índices automáticos de sync_record_indexes
+
+        Returns:
+            lista de dicts com workbook, sheet, column_key, index_name,
+            total_records e distinct_values (no último sync), valid, size_bytes,
+            scans (uso desde o último reset de estatísticas), created_at e checked_at
+        """
+        return self.execute_query("""
+            SELECT s.workbook, s.name AS sheet, k.column_key, k.index_name,
+                   k.total_records, k.distinct_values,
+                   COALESCE(i.indisvalid, false) AS valid,
+                   COALESCE(tree.size_bytes, 0) AS size_bytes,
+                   COALESCE(tree.scans, 0) AS scans,
+                   k.created_at, k.checked_at
+            FROM record_key_indexes k
+            JOIN sheets s ON s.id = k.sheet_id
+            LEFT JOIN pg_class c ON c.relname = k.index_name
+                 AND c.relnamespace = current_schema()::regnamespace
+            LEFT JOIN pg_index i ON i.indexrelid = c.oid
+            LEFT JOIN LATERAL (
+                SELECT sum(pg_relation_size(t.relid))::bigint AS size_bytes,
+                       sum(st.idx_scan)::bigint AS scans
+                FROM (
+                    -- Índice particionado: soma dos índices das partições
+                    SELECT relid FROM pg_partition_tree(c.oid) WHERE c.relkind = 'I'
+                    UNION ALL
+                    -- Índice comum: o próprio índice
+                    SELECT c.oid WHERE c.relkind <> 'I'
+                ) t
+                LEFT JOIN pg_stat_user_indexes st ON st.indexrelid = t.relid
+            ) tree ON c.oid IS NOT NULL
+            WHERE %(workbook)s::text IS NULL OR s.workbook = %(workbook)s
+            ORDER BY s.workbook, s.name, k.column_key
+        """, {'workbook': workbook}, fetch=True)
+
+    def refresh_statistics(self, force=False, workbook=None):
+        """
+        Recalcula as estatísticas no Postgres (cache sheet_statistics)
+
+        Por padrão só recalcula as sheets que publicaram outra versão ou
+        mudaram o column_mapping desde o último cálculo. Com workbook, só as
+        sheets dele são verificadas; None verifica todos os workbooks.
+
+        Returns:
+            True se alguma sheet foi recalculada
+        """
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT refresh_sheet_statistics(%s, %s)", (force, workbook))
+                refreshed = cur.fetchone()[0]
                 conn.commit()
-                return sheet_id
+                if refreshed:
+                    self._mark_write()
+                return refreshed
         except Exception as e:
             conn.rollback()
             raise e
         finally:
-            conn.close()
+            self.release_connection(conn)
 
-    def get_all_sheets_data(self):
+    def get_all_sheets_data(self, workbook=DEFAULT_WORKBOOK, sheets=None, include=None, fields=None):
         """
-        Retorna todos os dados em formato compatível com o dashboard
+        Retorna os dados de um workbook em formato compatível com o dashboard
         (mesmo formato do all_sheets_data.json)
+
+        O documento inteiro é montado no Postgres em uma única query, com
+        json_agg por sheet, em vez de uma query de records por sheet. Só
+        leitura: as estatísticas vêm do cache sheet_statistics como estão
+        (recalculado no upload, na migração e em /api/maintenance), mesmo
+        que alguma sheet esteja marcada como desatualizada.
+
+        last_updated é a última publicação do workbook e data_version
+        identifica o conteúdo (veja data_version), calculada na mesma query.
+
+        Projeção (veja document_projection), aplicada no SQL: só as sheets
+        em sheets, só as seções em include e, nos records, só as chaves em
+        fields são lidas e serializadas.
         """
-        conn = self.get_connection()
+        sheets, include, fields = document_projection(sheets, include, fields) or (None, DOCUMENT_SECTIONS, None)
+        params = (
+            workbook,
+            list(sheets) if sheets is not None else None,
+            list(fields) if fields is not None else None
+        )
+
+        conn = self.get_connection(read=True)
         try:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                # Buscar todas as sheets com suas estatísticas
-                cur.execute("""
-                    SELECT
-                        s.id,
-                        s.name,
-                        s.total_records,
-                        s.last_updated,
-                        s.source_file,
-                        st.stats_data as statistics,
-                        cm.mapping as column_mapping
-                    FROM sheets s
-                    LEFT JOIN statistics st ON s.id = st.sheet_id
-                    LEFT JOIN column_mappings cm ON s.id = cm.sheet_id
-                    ORDER BY s.name
-                """)
-                sheets = cur.fetchall()
-
-                # Para cada sheet, buscar seus records
-                result = {
-                    'sheets': [],
-                    'last_updated': datetime.now().isoformat()
+                self._execute(cur, document_statement(include), params)
+                row = cur.fetchone()
+                conn.commit()
+
+                return {
+                    'sheets': row['sheets'],
+                    'last_updated': row['last_updated'].isoformat() if row['last_updated'] else None,
+                    'data_version': row['data_version']
                 }
+        finally:
+            self.release_connection(conn)
 
-                for sheet in sheets:
-                    cur.execute("""
-                        SELECT data FROM records
-                        WHERE sheet_id = %s
+    def stream_sheets_data(self, workbook=DEFAULT_WORKBOOK, sheets=None, include=None, fields=None):
+        """
+        O documento de get_all_sheets_data (mesma projeção) em NDJSON, em
+        blocos de bytes (veja ndjson_line)
+
+        As linhas 'sheet' vêm da query do documento sem a seção records; os
+        records de cada sheet são lidos por um cursor nomeado (itersize =
+        batch_size) e saem como o texto do JSONB, sem virar dicts no Python.
+        A memória fica limitada a um lote e o primeiro bloco, só com a linha
+        'workbook', sai antes de qualquer record ser lido. Tudo vem do mesmo
+        snapshot (REPEATABLE READ), mesmo com um upload publicado no meio.
+
+        Cada bloco seguinte é uma linha 'sheet' ou até batch_size records.
+        A conexão fica com o gerador até ele terminar ou ser fechado.
+        """
+        selected, include, fields = document_projection(sheets, include, fields) or (None, DOCUMENT_SECTIONS, None)
+        params = (
+            workbook,
+            list(selected) if selected is not None else None,
+            list(fields) if fields is not None else None
+        )
+        record = STREAM_RECORD if fields is None else STREAM_RECORD_FIELDS
+
+        conn = self.get_connection(read=True)
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+                headers = tuple(section for section in include if section != 'records')
+                self._execute(cur, document_statement(headers), params)
+                document = cur.fetchone()
+                cur.execute(
+                    """SELECT name, id, active_version FROM sheets
+                       WHERE workbook = %s AND active_version IS NOT NULL""",
+                    (workbook,)
+                )
+                versions = {row['name']: row for row in cur.fetchall()}
+
+            yield ndjson_line('workbook', {
+                'name': workbook,
+                'last_updated': document['last_updated'].isoformat() if document['last_updated'] else None,
+                'data_version': document['data_version']
+            })
+            for sheet in document['sheets']:
+                yield ndjson_line('sheet', sheet)
+                if 'records' not in include:
+                    continue
+
+                with conn.cursor(name='stream_records') as cur:
+                    cur.itersize = self.batch_size
+                    cur.execute(f"""
+                        SELECT {record} FROM records
+                        WHERE sheet_id = %(sheet_id)s AND version = %(version)s
                         ORDER BY id
-                    """, (sheet['id'],))
-                    records = [r['data'] for r in cur.fetchall()]
-
-                    # Buscar colunas únicas dos records
-                    columns = []
-                    if records:
-                        columns = list(records[0].keys())
-
-                    result['sheets'].append({
-                        'name': sheet['name'],
-                        'total_records': sheet['total_records'],
-                        'columns': columns,
-                        'records': records,
-                        'statistics': sheet['statistics'] or {},
-                        'column_mapping': sheet['column_mapping'] or {}
+                    """, {
+                        'sheet_id': versions[sheet['name']]['id'],
+                        'version': versions[sheet['name']]['active_version'],
+                        'fields': params[2]
                     })
+                    lines = []
+                    for (data,) in cur:
+                        lines.append(ndjson_record(data))
+                        if len(lines) == self.batch_size:
+                            yield b''.join(lines)
+                            lines = []
+                    if lines:
+                        yield b''.join(lines)
+            conn.commit()
+        finally:
+            self.release_connection(conn)
 
-                return result
+    def data_version(self, workbook=DEFAULT_WORKBOOK):
+        """
+        Versão dos dados de um workbook, a mesma de data_version em
+        get_all_sheets_data; lê só sheets e sheet_statistics, sem records
+        """
+        conn = self.get_connection(read=True)
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                self._execute(cur, 'data_version', (workbook,))
+                version = cur.fetchone()['data_version']
+            conn.commit()
+            return version
         finally:
-            conn.close()
+            self.release_connection(conn)
+
+    def store_dashboard_payload(self, workbook=DEFAULT_WORKBOOK):
+        """
+        Grava em dashboard_payloads o documento do workbook pronto para envio
+
+        O JSON é montado no Postgres e chega como texto; é comprimido aqui uma
+        vez, no nível máximo (gzip e, se instalado, brotli), já que será
+        servido muitas vezes. Chamado após o upload.
 
-    def delete_all_data(self):
-        """Limpa todos os dados (útil para testes)"""
+        Returns:
+            dict com data_version e o tamanho de cada corpo gravado
+        """
         conn = self.get_connection()
         try:
             with conn.cursor() as cur:
-                cur.execute("TRUNCATE sheets CASCADE")
+                # Estatísticas desatualizadas do workbook recalculadas no mesmo
+                # round trip; '%' escapado: o prefixo passa pela interpolação
+                # de parâmetros do EXECUTE
+                refresh = cur.mogrify(
+                    "SELECT refresh_sheet_statistics(false, %s);", (workbook,)
+                ).decode().replace('%', '%%')
+                self._execute(cur, 'dashboard_payload', (workbook, None, None), prefix=refresh)
+                document, version = cur.fetchone()
+
+                body = document.encode('utf-8')
+                encoded = {encoding: compress(body, encoding, MAX_LEVELS[encoding])
+                           for encoding in available_encodings()}
+                cur.execute("""
+                    INSERT INTO dashboard_payloads (workbook, data_version, body, body_gzip, body_br)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON CONFLICT (workbook) DO UPDATE
+                    SET data_version = EXCLUDED.data_version,
+                        body = EXCLUDED.body,
+                        body_gzip = EXCLUDED.body_gzip,
+                        body_br = EXCLUDED.body_br,
+                        created_at = CURRENT_TIMESTAMP
+                """, (workbook, version, body, encoded.get('gzip'), encoded.get('br')))
+            conn.commit()
+            self._mark_write()
+            sizes = {encoding: len(data) for encoding, data in encoded.items()}
+            return dict(sizes, data_version=version, identity=len(body))
+        finally:
+            self.release_connection(conn)
+
+    def get_dashboard_payload(self, workbook=DEFAULT_WORKBOOK, version=None):
+        """
+        Corpos gravados por store_dashboard_payload, por codificação
+        (IDENTITY, 'gzip', 'br'), se forem da versão `version` dos dados;
+        None se não existem ou estão desatualizados
+        """
+        rows = self._read_query("""
+            SELECT body, body_gzip, body_br FROM dashboard_payloads
+            WHERE workbook = %s AND data_version = %s
+        """, (workbook, version))
+        if not rows:
+            return None
+        columns = {IDENTITY: 'body', 'gzip': 'body_gzip', 'br': 'body_br'}
+        return {encoding: bytes(rows[0][column])
+                for encoding, column in columns.items() if rows[0][column] is not None}
+
+    def get_statistics_history(self, workbook=DEFAULT_WORKBOOK, sheet_name=None, since=None):
+        """
+        Séries de tendência das estatísticas, uma por sheet do workbook
+
+        Lê só statistics_history (uma linha por upload), sem tocar em records.
+
+        Args:
+            sheet_name: restringe a uma sheet
+            since: data ISO (AAAA-MM-DD); só uploads a partir dela
+
+        Returns:
+            lista de dicts com sheet e history (pontos em ordem cronológica,
+            com recorded_at, version, total_records e HISTORY_METRICS)
+        """
+        since = iso_date_param(since)
+        metrics = ', '.join(f"h.{name}" for name in HISTORY_METRICS)
+        rows = self._read_query(f"""
+            SELECT s.name AS sheet, h.recorded_at, h.version, h.total_records, {metrics}
+            FROM sheets s
+            JOIN statistics_history h ON h.sheet_id = s.id
+            WHERE s.workbook = %(workbook)s
+              AND (%(sheet)s::text IS NULL OR s.name = %(sheet)s)
+              AND (%(since)s::date IS NULL OR h.recorded_at >= %(since)s::date)
+            ORDER BY s.name, h.recorded_at, h.id
+        """, {'workbook': workbook, 'sheet': sheet_name, 'since': since})
+
+        series = {}
+        for row in rows:
+            point = dict(row)
+            series.setdefault(point.pop('sheet'), []).append(point)
+        return [{'sheet': name, 'history': history} for name, history in series.items()]
+
+    def get_sheet_records(self, sheet_name, after=None, limit=DEFAULT_PAGE_SIZE,
+                          sort=None, descending=False, filters=None, workbook=DEFAULT_WORKBOOK):
+        """
+        Retorna uma página de records de uma sheet (paginação keyset)
+
+        Args:
+            sheet_name: nome da sheet
+            after: cursor retornado em next_after pela página anterior
+            limit: records por página (máximo MAX_PAGE_SIZE)
+            sort: coluna (chave do JSONB) para ordenar; padrão é records.id
+            descending: ordem decrescente
+            filters: dict sobre as colunas tipadas (índices btree): nome, tipo,
+                cidade, grupo (igualdade), tem_contrato (bool) e
+                data_contato_de/data_contato_ate (datas ISO, inclusivas)
+            workbook: workbook da sheet
+
+        Returns:
+            dict com sheet, total_records, records, next_after e has_more,
+            ou None se a sheet não existir
+        """
+        limit = max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+        direction = 'DESC' if descending else 'ASC'
+        comparison = '<' if descending else '>'
+
+        conn = self.get_connection(read=True)
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                self._execute(cur, 'sheet_by_name', (workbook, sheet_name))
+                sheet = cur.fetchone()
+                if not sheet:
+                    return None
+
+                filter_sql, filter_params = typed_filters_sql(filters)
+
+                if not sort and not filter_sql:
+                    # Página simples por id (caso mais frequente): prepared statement
+                    if after:
+                        after_id = decode_id_cursor(after)
+                    else:
+                        after_id = MAX_RECORD_ID if descending else 0
+                    self._execute(
+                        cur, 'records_page_desc' if descending else 'records_page_asc',
+                        (sheet['id'], after_id, limit + 1)
+                    )
+                elif sort:
+                    # Ordena por (valor da coluna, id) para a chave ser única
+                    sort_expr = "COALESCE(data->>%(sort)s, '')"
+                    where = filter_sql
+                    if after:
+                        after_value, after_id = decode_cursor(after)
+                        where += f" AND ({sort_expr}, id) {comparison} (%(after_value)s, %(after_id)s)"
+                    else:
+                        after_value, after_id = None, None
+                    query = f"""
+                        SELECT id, data, {sort_expr} AS sort_value
+                        FROM records
+                        WHERE sheet_id = %(sheet_id)s AND version = {ACTIVE_VERSION} {where}
+                        ORDER BY {sort_expr} {direction}, id {direction}
+                        LIMIT %(limit)s
+                    """
+                    params = {
+                        'sheet_id': sheet['id'], 'sort': sort, 'limit': limit + 1,
+                        'after_value': after_value, 'after_id': after_id
+                    }
+                    params.update(filter_params)
+                    cur.execute(query, params)
+                else:
+                    where = filter_sql
+                    if after:
+                        where += f" AND id {comparison} %(after_id)s"
+                    query = f"""
+                        SELECT id, data
+                        FROM records
+                        WHERE sheet_id = %(sheet_id)s AND version = {ACTIVE_VERSION} {where}
+                        ORDER BY id {direction}
+                        LIMIT %(limit)s
+                    """
+                    params = {
+                        'sheet_id': sheet['id'], 'limit': limit + 1,
+                        'after_id': decode_id_cursor(after) if after else None
+                    }
+                    params.update(filter_params)
+                    cur.execute(query, params)
+
+                rows = cur.fetchall()
+
+                has_more = len(rows) > limit
+                rows = rows[:limit]
+
+                next_after = None
+                if has_more:
+                    last = rows[-1]
+                    if sort:
+                        next_after = encode_cursor(last['sort_value'], last['id'])
+                    else:
+                        next_after = str(last['id'])
+
+                return {
+                    'sheet': sheet_name,
+                    'total_records': sheet['total_records'],
+                    'records': [row['data'] for row in rows],
+                    'next_after': next_after,
+                    'has_more': has_more
+                }
+        finally:
+            self.release_connection(conn)
+
+    def search_records(self, sheet_name, query, limit=DEFAULT_PAGE_SIZE, offset=0,
+                       workbook=DEFAULT_WORKBOOK):
+        """
+        Busca records de uma sheet por substring, sem diferenciar acentos
+
+        Usa a coluna gerada records.search_text e o índice de trigramas
+        idx_records_search_trgm; os resultados são ordenados por relevância
+        (word_similarity) e depois por id.
+
+        Returns:
+            dict com sheet, query, records, offset e has_more,
+            ou None se a sheet não existir
+        """
+        limit = max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+        offset = max(0, int(offset or 0))
+
+        conn = self.get_connection(read=True)
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                self._execute(cur, 'sheet_by_name', (workbook, sheet_name))
+                sheet = cur.fetchone()
+                if not sheet:
+                    return None
+
+                cur.execute(f"""
+                    SELECT data,
+                           word_similarity(search_normalize(%(term)s), search_text) AS rank
+                    FROM records
+                    WHERE sheet_id = %(sheet_id)s AND version = {ACTIVE_VERSION}
+                      AND search_text LIKE '%%' || search_normalize(%(pattern)s) || '%%'
+                    ORDER BY rank DESC, id
+                    LIMIT %(limit)s OFFSET %(offset)s
+                """, {
+                    'sheet_id': sheet['id'],
+                    'term': query,
+                    'pattern': escape_like(query),
+                    'limit': limit + 1,
+                    'offset': offset
+                })
+                rows = cur.fetchall()
+
+                return {
+                    'sheet': sheet_name,
+                    'query': query,
+                    'records': [row['data'] for row in rows[:limit]],
+                    'offset': offset,
+                    'has_more': len(rows) > limit
+                }
+        finally:
+            self.release_connection(conn)
+
+    def export_records(self, sheet_name, out, export_format='csv', filters=None,
+                       workbook=DEFAULT_WORKBOOK):
+        """
+        Exporta os records publicados de uma sheet (opcionalmente filtrados)
+
+        CSV sai do próprio Postgres (COPY ... TO STDOUT) direto para out;
+        XLSX é lido por um cursor nomeado, em lotes, e escrito pelo openpyxl
+        em modo write-only. Nos dois casos a memória não depende da
+        quantidade de records. Colunas e records vêm do mesmo snapshot
+        (transação REPEATABLE READ), mesmo com um upload publicado no meio.
+
+        Args:
+            out: stream binário de saída (ex: self.wfile do handler)
+            export_format: 'csv' ou 'xlsx'
+            filters: mesmos filtros de get_sheet_records
+
+        Returns:
+            quantidade de records exportados, ou None se a sheet não existe
+            (nesse caso nada é escrito em out)
+        """
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Formato inválido: {export_format}")
+        filter_sql, filter_params = typed_filters_sql(filters)
+
+        conn = self.get_connection(read=True)
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+                cur.execute(
+                    """SELECT id, active_version FROM sheets
+                       WHERE workbook = %s AND name = %s AND active_version IS NOT NULL""",
+                    (workbook, sheet_name)
+                )
+                sheet = cur.fetchone()
+                if not sheet:
+                    return None
+                params = {'sheet_id': sheet[0], 'version': sheet[1]}
+                params.update(filter_params)
+
+                # Ordem das chaves do primeiro record da sheet (como 'columns' do dashboard)
+                cur.execute("""
+                    SELECT COALESCE(json_agg(k.key ORDER BY k.ord), '[]'::json)
+                    FROM (
+                        SELECT data FROM records
+                        WHERE sheet_id = %(sheet_id)s AND version = %(version)s
+                        ORDER BY id LIMIT 1
+                    ) first_record,
+                    jsonb_object_keys(first_record.data) WITH ORDINALITY AS k(key, ord)
+                """, params)
+                columns = cur.fetchone()[0]
+                where = f"sheet_id = %(sheet_id)s AND version = %(version)s {filter_sql}"
+
+                if export_format == 'csv':
+                    out.write(CSV_BOM)
+                    if not columns:
+                        return 0
+                    header = io.StringIO()
+                    csv.writer(header, lineterminator='\n').writerow(columns)
+                    out.write(header.getvalue().encode('utf-8'))
+
+                    # Nomes de coluna como parâmetros; o COPY não aceita parâmetros,
+                    # então o SQL vai interpolado pelo mogrify
+                    for index, column in enumerate(columns):
+                        params[f'column_{index}'] = column
+                    select = ', '.join(f"data->>%(column_{index})s" for index in range(len(columns)))
+                    query = cur.mogrify(
+                        f"SELECT {select} FROM records WHERE {where} ORDER BY id", params
+                    ).decode('utf-8')
+                    cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv)", out)
+                    return cur.rowcount
+
+            with conn.cursor(name='export_records') as cur:
+                cur.itersize = self.batch_size
+                cur.execute(f"SELECT data FROM records WHERE {where} ORDER BY id", params)
+                return write_xlsx(out, sheet_name, columns, (row[0] for row in cur))
+        finally:
+            self.release_connection(conn)
+
+    def list_workbooks(self):
+        """
+        Workbooks com ao menos uma sheet publicada
+
+        Returns:
+            lista de dicts com workbook, sheets, total_records e last_updated
+        """
+        return self._read_query("""
+            SELECT workbook, count(*) AS sheets, sum(total_records)::int AS total_records,
+                   max(last_updated) AS last_updated
+            FROM sheets
+            WHERE active_version IS NOT NULL
+            GROUP BY workbook
+            ORDER BY workbook
+        """)
+
+    def delete_all_data(self, workbook=None):
+        """Limpa todos os dados, ou só os de um workbook (útil para testes)"""
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cur:
+                if workbook is None:
+                    cur.execute("TRUNCATE sheets, dashboard_payloads CASCADE")
+                else:
+                    cur.execute("DELETE FROM sheets WHERE workbook = %s", (workbook,))
+                    cur.execute("DELETE FROM dashboard_payloads WHERE workbook = %s", (workbook,))
                 conn.commit()
+                self._mark_write()
         finally:
-            conn.close()
+            self.release_connection(conn)
+
+    def init_database(self, schema_file='database/schema.sql', partitioned=None):
+        """
+        Inicializa o banco com o schema
+
+        partitioned: migra records para o layout particionado por sheet
+        (env var DB_PARTITIONED_RECORDS); a migração é feita uma vez e o
+        schema é reaplicado para recriar views e triggers sobre a nova tabela
+        """
+        if partitioned is None:
+            partitioned = os.getenv('DB_PARTITIONED_RECORDS', '').lower() in ('1', 'true', 'sim', 'yes')
 
-    def init_database(self, schema_file='database/schema.sql'):
-        """Inicializa o banco com o schema"""
         with open(schema_file, 'r', encoding='utf-8') as f:
             schema = f.read()
 
@@ -176,7 +1672,12 @@ class Database:
         try:
             with conn.cursor() as cur:
                 cur.execute(schema)
+                if partitioned:
+                    cur.execute("SELECT partition_records()")
+                    if cur.fetchone()[0]:
+                        cur.execute(schema)
+                        print("[OK] Tabela records migrada para o layout particionado por sheet")
                 conn.commit()
                 print("[OK] Database inicializado com sucesso!")
         finally:
-            conn.close()
+            self.release_connection(conn)
@@ -0,0 +1,65 @@
+"""
+Exportação dos records de uma sheet em CSV ou XLSX
+
+Os backends leem os records em streaming (COPY ... TO STDOUT ou cursor
+nomeado no Postgres, cursor no SQLite) e escrevem direto no arquivo de
+saída, sem acumular a sheet em memória. As colunas seguem a ordem das
+chaves do primeiro record, a mesma de 'columns' no documento do dashboard.
+"""
+import re
+import codecs
+from .common import json_text
+
+# Formato -> Content-Type da resposta
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# Marca de UTF-8 no início do CSV (o Excel abre os acentos corretamente)
+CSV_BOM = codecs.BOM_UTF8
+
+_INVALID_TITLE = re.compile(r'[\\/*?:\[\]]')
+
+
+def _cell_value(value):
+    """Valor de célula: escalares como estão, listas/objetos como JSON"""
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+    if isinstance(value, (dict, list)):
+        value = json_text(value)
+    if isinstance(value, str):
+        return ILLEGAL_CHARACTERS_RE.sub('', value)
+    return value
+
+
+def write_xlsx(out, sheet_name, columns, records):
+    """
+    Escreve um XLSX com o cabeçalho `columns` e um record (dict) por linha
+
+    Usa o modo write-only do openpyxl: as linhas vão para um arquivo
+    temporário à medida que chegam, e a memória não cresce com a sheet.
+    `out` pode ser um stream sem seek (ex: a resposta HTTP).
+
+    Returns:
+        quantidade de records escritos
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(title=_INVALID_TITLE.sub(' ', sheet_name)[:31] or 'Sheet')
+    worksheet.append(columns)
+
+    count = 0
+    for record in records:
+        worksheet.append([_cell_value(record.get(column)) for column in columns])
+        count += 1
+
+    workbook.save(out)
+    return count
+
+
+def export_filename(sheet_name, export_format):
+    """Nome do arquivo baixado (sem caracteres inválidos em nomes de arquivo)"""
+    name = re.sub(r'[\\/:*?"<>|]+', ' ', sheet_name).strip() or 'sheet'
+    return f"{name}.{export_format}"
@@ -0,0 +1,300 @@
+"""
+Instrumentação das queries do Database: tempo por statement, linhas,
+bytes trafegados, tempo de conexão e log de queries lentas
+
+As conexões são criadas com InstrumentedConnection, que troca a
+cursor_factory pedida por uma subclasse com medição. Os agregados ficam em
+um registro no nível do módulo (compartilhado pelo pool) e podem ser lidos
+com get_query_timings().
+"""
+import os
+import re
+import json
+import time
+import logging
+import threading
+from psycopg2.extensions import connection as _connection, cursor as _cursor
+from psycopg2.extras import register_default_json, register_default_jsonb
+
+logger = logging.getLogger(__name__)
+
+# Statements acima disso (ms) vão para o log de queries lentas (env var DB_SLOW_QUERY_MS)
+DEFAULT_SLOW_QUERY_MS = 500
+
+# Máximo de statements distintos no registro; o excedente é agrupado
+MAX_TRACKED_STATEMENTS = 200
+OTHER_STATEMENTS = '<outros>'
+
+_WHITESPACE = re.compile(r'\s+')
+_VALUES_LIST = re.compile(r'\bVALUES\b.*', re.IGNORECASE | re.DOTALL)
+
+
+def statement_key(query):
+    """Texto normalizado do statement, usado para agregar as medições"""
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    query = _VALUES_LIST.sub('VALUES ...', query)
+    return _WHITESPACE.sub(' ', query).strip()[:300]
+
+
+def _env_flag(name):
+    return os.getenv(name, '').lower() in ('1', 'true', 'sim', 'yes')
+
+
+class QueryStats:
+    """Agregados de tempo, linhas e bytes por statement"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+        self.slow_query_ms = float(os.getenv('DB_SLOW_QUERY_MS') or DEFAULT_SLOW_QUERY_MS)
+        self.explain_slow = _env_flag('DB_SLOW_QUERY_EXPLAIN')
+
+    def reset(self):
+        """Zera todos os agregados"""
+        with self._lock:
+            self.statements = {}
+            self.connects = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+            self.slow_queries = []
+
+    def record_connect(self, elapsed_ms):
+        with self._lock:
+            self.connects['count'] += 1
+            self.connects['total_ms'] += elapsed_ms
+            self.connects['max_ms'] = max(self.connects['max_ms'], elapsed_ms)
+
+    def record_statement(self, key, elapsed_ms, rows, bytes_sent):
+        with self._lock:
+            if key not in self.statements and len(self.statements) >= MAX_TRACKED_STATEMENTS:
+                key = OTHER_STATEMENTS
+            entry = self.statements.setdefault(key, {
+                'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                'rows': 0, 'bytes_sent': 0, 'bytes_received': 0
+            })
+            entry['calls'] += 1
+            entry['total_ms'] += elapsed_ms
+            entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+            entry['rows'] += max(rows, 0)
+            entry['bytes_sent'] += bytes_sent
+        return key
+
+    def record_received(self, key, nbytes):
+        with self._lock:
+            entry = self.statements.get(key)
+            if entry is not None:
+                entry['bytes_received'] += nbytes
+
+    def record_slow(self, key, elapsed_ms, plan=None):
+        with self._lock:
+            self.slow_queries.append({
+                'statement': key,
+                'ms': round(elapsed_ms, 2),
+                'plan': plan
+            })
+            del self.slow_queries[:-50]
+
+    def snapshot(self):
+        """Cópia dos agregados, com médias, ordenada por tempo total"""
+        with self._lock:
+            statements = []
+            for key, entry in self.statements.items():
+                item = dict(entry, statement=key)
+                item['avg_ms'] = round(entry['total_ms'] / entry['calls'], 3)
+                item['total_ms'] = round(entry['total_ms'], 3)
+                item['max_ms'] = round(entry['max_ms'], 3)
+                statements.append(item)
+            statements.sort(key=lambda item: item['total_ms'], reverse=True)
+
+            connects = dict(self.connects)
+            if connects['count']:
+                connects['avg_ms'] = round(connects['total_ms'] / connects['count'], 3)
+
+            return {
+                'statements': statements,
+                'connects': connects,
+                'slow_queries': list(self.slow_queries),
+                'slow_query_ms': self.slow_query_ms
+            }
+
+
+query_stats = QueryStats()
+
+
+def _estimate_size(rows):
+    """
+    Estimativa do volume recebido (bytes) a partir das linhas lidas;
+    valores JSON/JSONB são contados no typecaster da conexão
+    """
+    total = 0
+    for row in rows:
+        values = row.values() if isinstance(row, dict) else row
+        for value in values:
+            if isinstance(value, (str, bytes)):
+                total += len(value)
+            elif value is not None and not isinstance(value, (dict, list)):
+                total += len(str(value))
+    return total
+
+
+class TimingCursorMixin:
+    """Mede cada execute/copy do cursor e registra em query_stats"""
+
+    _stats_key = None
+
+    def _measure(self, query, run, transfer=None):
+        """
+        Executa run() medindo o tempo; transfer() retorna (bytes enviados,
+        bytes recebidos) e por padrão usa o tamanho do statement enviado
+        """
+        start = time.perf_counter()
+        succeeded = False
+        try:
+            result = run()
+            succeeded = True
+            return result
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            sent, received = transfer() if transfer else (len(self.query or b''), 0)
+            self._stats_key = query_stats.record_statement(
+                statement_key(query), elapsed_ms, self.rowcount, sent
+            )
+            if received:
+                query_stats.record_received(self._stats_key, received)
+            if elapsed_ms >= query_stats.slow_query_ms:
+                self._log_slow(query, elapsed_ms, explain=succeeded)
+
+    def _log_slow(self, query, elapsed_ms, explain=True):
+        plan = None
+        if explain and query_stats.explain_slow and _is_read_statement(query):
+            plan = self.connection.explain(self.query or query)
+        query_stats.record_slow(self._stats_key, elapsed_ms, plan)
+        logger.warning("[LENTA] %.1f ms: %s", elapsed_ms, self._stats_key)
+        if plan:
+            logger.warning("[LENTA] Plano:\n%s", plan)
+
+    def execute(self, query, vars=None):
+        return self._measure(query, lambda: super(TimingCursorMixin, self).execute(query, vars))
+
+    def executemany(self, query, vars_list):
+        return self._measure(
+            query, lambda: super(TimingCursorMixin, self).executemany(query, vars_list)
+        )
+
+    def copy_expert(self, sql, file, size=8192):
+        start_pos = file.tell() if hasattr(file, 'tell') else 0
+
+        def transfer():
+            moved = file.tell() - start_pos if hasattr(file, 'tell') else 0
+            if 'FROM STDIN' in sql.upper():
+                return moved, 0
+            return 0, moved
+
+        return self._measure(
+            sql, lambda: super(TimingCursorMixin, self).copy_expert(sql, file, size), transfer
+        )
+
+    def _record_fetch(self, rows):
+        if self._stats_key:
+            received = _estimate_size(rows)
+            if isinstance(self.connection, InstrumentedConnection):
+                received += self.connection.pop_json_bytes()
+            query_stats.record_received(self._stats_key, received)
+
+    def fetchone(self):
+        row = super().fetchone()
+        self._record_fetch([row] if row is not None else [])
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(size) if size is not None else super().fetchmany()
+        self._record_fetch(rows)
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        self._record_fetch(rows)
+        return rows
+
+
+def _is_read_statement(query):
+    """EXPLAIN ANALYZE reexecuta o statement: só consultas simples (SELECT/WITH)"""
+    text = query.decode('utf-8', 'replace') if isinstance(query, bytes) else str(query)
+    text = text.strip().rstrip(';')
+    first_word = text.split(None, 1)[0].upper() if text else ''
+    return ';' not in text and first_word in ('SELECT', 'WITH')
+
+
+_timed_factories = {}
+
+
+def timed_cursor_factory(factory):
+    """Subclasse instrumentada (em cache) de uma cursor_factory do psycopg2"""
+    timed = _timed_factories.get(factory)
+    if timed is None:
+        timed = type(f"Timed{factory.__name__}", (TimingCursorMixin, factory), {})
+        _timed_factories[factory] = timed
+    return timed
+
+
+class InstrumentedConnection(_connection):
+    """Conexão cujos cursores registram tempos em query_stats"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._json_bytes = 0
+        # Nomes dos prepared statements já preparados nesta sessão (database.prepared)
+        self.prepared_statements = set()
+        register_default_json(self, loads=self._counting_loads)
+        register_default_jsonb(self, loads=self._counting_loads)
+
+    def _counting_loads(self, text):
+        """Decodifica JSON/JSONB contando o tamanho do texto recebido"""
+        self._json_bytes += len(text)
+        return json.loads(text)
+
+    def pop_json_bytes(self):
+        """Bytes de JSON decodificados desde a última leitura"""
+        nbytes, self._json_bytes = self._json_bytes, 0
+        return nbytes
+
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.get('cursor_factory') or self.cursor_factory or _cursor
+        kwargs['cursor_factory'] = timed_cursor_factory(factory)
+        return super().cursor(*args, **kwargs)
+
+    def explain(self, statement):
+        """
+        EXPLAIN (ANALYZE, BUFFERS) de um statement já com os parâmetros,
+        com um cursor sem medição e dentro de um savepoint desfeito no final
+        """
+        if isinstance(statement, bytes):
+            statement = statement.decode('utf-8', 'replace')
+        try:
+            with super().cursor() as cur:
+                cur.execute("SAVEPOINT slow_query_explain")
+                try:
+                    cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + statement)
+                    return '\n'.join(row[0] for row in cur.fetchall())
+                finally:
+                    cur.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+        except Exception as e:
+            return f"[EXPLAIN indisponível: {e}]"
+
+
+def timed_connect(connect, *args, **kwargs):
+    """Abre uma conexão instrumentada medindo o tempo de conexão"""
+    kwargs.setdefault('connection_factory', InstrumentedConnection)
+    start = time.perf_counter()
+    conn = connect(*args, **kwargs)
+    query_stats.record_connect((time.perf_counter() - start) * 1000)
+    return conn
+
+
+def get_query_timings():
+    """Agregados de tempo por statement, conexões e queries lentas recentes"""
+    return query_stats.snapshot()
+
+
+def reset_query_timings():
+    """Zera os agregados de tempo"""
+    query_stats.reset()
@@ -0,0 +1,224 @@
+"""
+Leitura em streaming do all_sheets_data.json e checkpoint da migração
+
+O arquivo é lido incrementalmente, um record por vez, sem json.load do
+documento inteiro: scan_sheets faz uma passada coletando os dados de cada
+sheet (sem os records) e a posição do array de records no arquivo;
+iter_rows volta a essa posição e gera os records sob demanda, a partir de
+qualquer índice (retomada). MigrationCheckpoint guarda em disco a versão em
+construção de cada sheet entre execuções de migrate_to_neon.py.
+"""
+import os
+import json
+import codecs
+import hashlib
+import threading
+from .common import record_hash, fingerprint_records
+
+# Bytes lidos do arquivo por vez
+_CHUNK_SIZE = 1 << 20
+
+_WHITESPACE = ' \t\n\r'
+
+# Arquivo de checkpoint padrão de migrate_to_neon.py
+DEFAULT_CHECKPOINT_FILE = '.migration_checkpoint.json'
+
+
+class _JsonReader:
+    """Leitor incremental de JSON: percorre objetos e arrays sem carregá-los inteiros"""
+
+    def __init__(self, f, offset=0):
+        f.seek(offset)
+        self.f = f
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        # Posição em bytes, no arquivo, do início do buffer
+        self.offset = offset
+        self.eof = False
+
+    def _fill(self):
+        """Descarta o trecho já lido e lê mais um bloco; False no fim do arquivo"""
+        if self.pos:
+            self.offset += len(self.buffer[:self.pos].encode('utf-8'))
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        chunk = self.f.read(_CHUNK_SIZE)
+        self.eof = not chunk
+        self.buffer += self.decoder.decode(chunk, final=self.eof)
+        return not self.eof
+
+    def tell(self):
+        """Posição atual em bytes no arquivo"""
+        return self.offset + len(self.buffer[:self.pos].encode('utf-8'))
+
+    def peek(self):
+        """Próximo caractere depois de espaços ('' no fim do arquivo)"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"JSON inválido: esperado '{char}' na posição {self.tell()}")
+        self.pos += 1
+
+    def value(self):
+        """Decodifica o próximo valor completo (lendo mais blocos se preciso)"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.json.raw_decode(self.buffer, self.pos)
+                # Um número no fim do buffer pode continuar no próximo bloco
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def _separator(self, close):
+        """Consome ',' ou o fechamento; True se fechou"""
+        char = self.peek()
+        self.pos += 1
+        if char == close:
+            return True
+        if char != ',':
+            raise ValueError(f"JSON inválido: esperado ',' ou '{close}' na posição {self.tell()}")
+        return False
+
+    def items(self):
+        """Percorre um objeto: gera cada chave com o leitor posicionado no valor"""
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self._separator('}'):
+                return
+
+    def elements(self):
+        """Percorre um array: gera uma vez por elemento, com o leitor posicionado nele"""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield
+            if self._separator(']'):
+                return
+
+
+def scan_sheets(path):
+    """
+    Passada de leitura do all_sheets_data.json
+
+    Returns:
+        lista de dicts com os campos de cada sheet (exceto records) e:
+        records_offset (posição do array de records no arquivo),
+        record_count, checksum (md5 dos row_hash em ordem, como em
+        sheet_checksum) e use_key (se a coluna 'nome' do column_mapping
+        está preenchida em todos os records, como em fingerprint_records)
+    """
+    sheets = []
+    with open(path, 'rb') as f:
+        reader = _JsonReader(f)
+        for key in reader.items():
+            if key != 'sheets':
+                reader.value()
+                continue
+
+            for _ in reader.elements():
+                sheet = {'records_offset': None, 'record_count': 0}
+                checksum = hashlib.md5()
+                # Colunas preenchidas em todos os records lidos até aqui
+                filled = None
+
+                for field in reader.items():
+                    if field != 'records':
+                        sheet[field] = reader.value()
+                        continue
+
+                    sheet['records_offset'] = reader.tell()
+                    for _ in reader.elements():
+                        record = reader.value()
+                        checksum.update(record_hash(record).encode('ascii'))
+                        sheet['record_count'] += 1
+                        columns = {k for k, v in record.items() if v not in (None, '')}
+                        filled = columns if filled is None else filled & columns
+
+                key_column = (sheet.get('column_mapping') or {}).get('nome')
+                sheet['checksum'] = checksum.hexdigest()
+                sheet['use_key'] = bool(key_column) and (filled is None or key_column in filled)
+                sheets.append(sheet)
+    return sheets
+
+
+def iter_records(path, records_offset, start=0):
+    """Gera os records do array em records_offset, a partir do índice start"""
+    with open(path, 'rb') as f:
+        reader = _JsonReader(f, records_offset)
+        for index, _ in enumerate(reader.elements()):
+            record = reader.value()
+            if index >= start:
+                yield record
+
+
+def iter_rows(path, sheet, start=0):
+    """
+    (row_key, row_hash, record) dos records de uma sheet de scan_sheets,
+    a partir do índice start, com o mesmo row_key de uma carga completa
+    """
+    key_column = (sheet.get('column_mapping') or {}).get('nome')
+    for record in iter_records(path, sheet['records_offset'], start):
+        yield fingerprint_records([record], key_column, sheet['use_key'])[0]
+
+
+class MigrationCheckpoint:
+    """
+    Estado da migração em um arquivo JSON: a versão em construção de cada
+    sheet (sheet_id, version). Fica associado ao arquivo de origem (tamanho
+    e data de modificação); se ele mudar, a migração recomeça do zero.
+    """
+
+    def __init__(self, path, source_path):
+        self.path = path
+        stat = os.stat(source_path)
+        self.source = {'path': os.path.abspath(source_path), 'size': stat.st_size,
+                       'mtime': stat.st_mtime}
+        self._lock = threading.Lock()
+        self.sheets = {}
+
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('source') == self.source:
+                self.sheets = data.get('sheets', {})
+
+    def get(self, name):
+        return self.sheets.get(name)
+
+    def set(self, name, state):
+        """Atualiza o estado da sheet e grava o arquivo (substituição atômica)"""
+        with self._lock:
+            self.sheets[name] = state
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'source': self.source, 'sheets': self.sheets}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+    def clear(self):
+        """Remove o checkpoint (migração concluída)"""
+        with self._lock:
+            self.sheets = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
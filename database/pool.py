@@ -0,0 +1,188 @@
+"""
+Pool de conexões compartilhado entre invocações das funções serverless
+
+O pool vive no nível do módulo, então um container "quente" da Vercel
+reaproveita as conexões já abertas (e o handshake TLS com o Neon) entre
+requisições em vez de reconectar a cada chamada.
+"""
+import os
+import time
+import threading
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+from .instrumentation import InstrumentedConnection, query_stats
+
+# Tamanho padrão do pool (env vars DB_POOL_MIN / DB_POOL_MAX)
+DEFAULT_MIN_SIZE = 1
+DEFAULT_MAX_SIZE = 5
+
+# Conexões ociosas há mais que isso (segundos) são testadas antes do uso
+# (env var DB_POOL_HEALTH_CHECK)
+DEFAULT_HEALTH_CHECK_INTERVAL = 30
+
+# Segundos que acquire espera por uma conexão livre com o pool cheio
+# (env var DB_POOL_TIMEOUT)
+DEFAULT_ACQUIRE_TIMEOUT = 30
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool(ThreadedConnectionPool):
+    """
+    ThreadedConnectionPool com health check e contadores de uso
+
+    Com maxconn conexões em uso, acquire espera (até acquire_timeout
+    segundos) uma ser devolvida, em vez de falhar na hora com PoolError.
+    """
+
+    def __init__(self, minconn, maxconn, dsn, health_check_interval=DEFAULT_HEALTH_CHECK_INTERVAL,
+                 acquire_timeout=DEFAULT_ACQUIRE_TIMEOUT):
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.waits = 0
+        self._idle_since = {}
+        self._stats_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn)
+        super().__init__(minconn, maxconn, dsn, connection_factory=InstrumentedConnection)
+
+    def _connect(self, key=None):
+        """Cria uma nova conexão física (conta como miss e mede o connect)"""
+        with self._stats_lock:
+            self.misses += 1
+        start = time.perf_counter()
+        conn = super()._connect(key)
+        query_stats.record_connect((time.perf_counter() - start) * 1000)
+        return conn
+
+    def _getconn(self, key=None):
+        """
+        Conexão ociosa ou nova; chamado por getconn sob o lock do pool, então
+        a origem (reused) é decidida sem corrida com outras threads
+        """
+        reused = bool(self._pool) or key in self._used
+        conn = super()._getconn(key)
+        conn.reused = reused
+        return conn
+
+    def is_healthy(self, conn):
+        """Verifica se a conexão ainda está utilizável"""
+        if conn.closed:
+            return False
+
+        idle_since = self._idle_since.pop(id(conn), None)
+        if idle_since is None or time.monotonic() - idle_since < self.health_check_interval:
+            return True
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def acquire(self):
+        """
+        Retorna uma conexão saudável do pool, descartando as stale
+
+        Espera uma vaga se as maxconn conexões estão em uso; PoolError se
+        nenhuma for devolvida em acquire_timeout segundos.
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self.waits += 1
+            if not self._slots.acquire(timeout=self.acquire_timeout):
+                raise PoolError(
+                    f"Nenhuma conexão livre em {self.acquire_timeout}s ({self.maxconn} em uso)"
+                )
+        try:
+            while True:
+                conn = self.getconn()
+                if self.is_healthy(conn):
+                    if conn.reused:
+                        with self._stats_lock:
+                            self.hits += 1
+                    return conn
+
+                with self._stats_lock:
+                    self.stale += 1
+                self.putconn(conn, close=True)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn):
+        """Devolve a conexão ao pool (transações abertas sofrem rollback)"""
+        try:
+            if not conn.closed:
+                self._idle_since[id(conn)] = time.monotonic()
+            self.putconn(conn, close=bool(conn.closed))
+        finally:
+            self._slots.release()
+
+    def stats(self):
+        """Contadores de uso do pool"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale': self.stale,
+            'waits': self.waits,
+            'idle': len(self._pool),
+            'in_use': len(self._used),
+            'min_size': self.minconn,
+            'max_size': self.maxconn
+        }
+
+
+def get_pool(dsn, min_size=None, max_size=None):
+    """Retorna (criando se necessário) o pool associado à connection string"""
+    pool = _pools.get(dsn)
+    if pool is not None and not pool.closed:
+        return pool
+
+    with _pools_lock:
+        pool = _pools.get(dsn)
+        if pool is None or pool.closed:
+            min_size = int(min_size or os.getenv('DB_POOL_MIN') or DEFAULT_MIN_SIZE)
+            max_size = int(max_size or os.getenv('DB_POOL_MAX') or DEFAULT_MAX_SIZE)
+            if min_size < 0 or max_size < max(min_size, 1):
+                raise ValueError("Tamanho de pool inválido")
+
+            health_check_interval = float(
+                os.getenv('DB_POOL_HEALTH_CHECK') or DEFAULT_HEALTH_CHECK_INTERVAL
+            )
+            acquire_timeout = float(os.getenv('DB_POOL_TIMEOUT') or DEFAULT_ACQUIRE_TIMEOUT)
+            pool = ConnectionPool(min_size, max_size, dsn, health_check_interval, acquire_timeout)
+            _pools[dsn] = pool
+        return pool
+
+
+def get_pool_stats():
+    """Contadores de todos os pools ativos, por connection string (sem senha)"""
+    return {
+        _mask_dsn(dsn): pool.stats()
+        for dsn, pool in _pools.items()
+        if not pool.closed
+    }
+
+
+def close_all_pools():
+    """Fecha todos os pools (útil em scripts e testes)"""
+    with _pools_lock:
+        for pool in _pools.values():
+            if not pool.closed:
+                pool.closeall()
+        _pools.clear()
+
+
+def _mask_dsn(dsn):
+    """Esconde a senha da connection string"""
+    if '@' not in dsn or '://' not in dsn:
+        return dsn
+    scheme, rest = dsn.split('://', 1)
+    credentials, host = rest.rsplit('@', 1)
+    user = credentials.split(':', 1)[0]
+    return f"{scheme}://{user}:***@{host}"
@@ -0,0 +1,136 @@
+"""
+Prepared statements das queries mais frequentes do Database
+
+Cada statement do registro é preparado (PREPARE) uma vez por conexão, na
+primeira vez que é usado, e depois executado pelo nome (EXECUTE): o texto
+do SQL não trafega de novo e o Postgres reaproveita o parse e o plano.
+Como as conexões do pool vivem entre invocações, o custo do PREPARE é pago
+uma vez por conexão, não por chamada.
+
+Não funciona atrás de PgBouncer em modo transaction (endpoint "-pooler" do
+Neon), onde cada transação pode cair em outra sessão; por isso o uso é
+opcional (env var DB_PREPARED_STATEMENTS).
+"""
+import os
+import re
+from .common import TYPED_COLUMNS
+
+_PARAMETER = re.compile(r'\$(\d+)')
+
+# Versão publicada da sheet $1, no mesmo statement que os records
+_ACTIVE_VERSION = "(SELECT active_version FROM sheets WHERE id = $1)"
+
+# nome -> (tipos dos parâmetros, SQL com $1..$n)
+PREPARED_STATEMENTS = {
+    # Leitura
+    'sheet_by_name': (
+        ('text', 'text'),
+        """SELECT id, total_records FROM sheets
+           WHERE workbook = $1 AND name = $2 AND active_version IS NOT NULL"""
+    ),
+    'records_page_asc': (
+        ('integer', 'integer', 'integer'),
+        f"""SELECT id, data FROM records
+            WHERE sheet_id = $1 AND version = {_ACTIVE_VERSION} AND id > $2
+            ORDER BY id LIMIT $3"""
+    ),
+    'records_page_desc': (
+        ('integer', 'integer', 'integer'),
+        f"""SELECT id, data FROM records
+            WHERE sheet_id = $1 AND version = {_ACTIVE_VERSION} AND id < $2
+            ORDER BY id DESC LIMIT $3"""
+    ),
+    # Gravação
+    'reserve_sheet_version': (
+        ('text', 'text', 'integer', 'text'),
+        """INSERT INTO sheets (workbook, name, total_records, source_file, last_version)
+           VALUES ($1, $2, $3, $4, 1)
+           ON CONFLICT (workbook, name) DO UPDATE
+           SET last_version = sheets.last_version + 1
+           RETURNING id, active_version, last_version"""
+    ),
+    'insert_records': (
+        ('integer', 'integer', 'jsonb[]', 'text[]', 'text[]',
+         'text[]', 'text[]', 'text[]', 'date[]', 'boolean[]', 'text[]'),
+        f"""INSERT INTO records (sheet_id, version, data, row_key, row_hash, {', '.join(TYPED_COLUMNS)})
+            SELECT $1, $2, r.*
+            FROM unnest($3, $4, $5, $6, $7, $8, $9, $10, $11) AS r"""
+    ),
+    'upsert_statistics': (
+        ('integer', 'jsonb'),
+        """INSERT INTO statistics (sheet_id, stats_data)
+           VALUES ($1, $2)
+           ON CONFLICT (sheet_id) DO UPDATE
+           SET stats_data = EXCLUDED.stats_data,
+               created_at = CURRENT_TIMESTAMP"""
+    ),
+    'insert_statistics_history': (
+        ('integer', 'integer', 'integer', 'integer', 'integer', 'integer', 'integer'),
+        """INSERT INTO statistics_history (sheet_id, version, total_records, com_contrato,
+                                            sem_contrato, contatos_realizados, contatos_pendentes)
+           VALUES ($1, $2, $3, $4, $5, $6, $7)"""
+    ),
+    'upsert_column_mapping': (
+        ('integer', 'jsonb'),
+        """INSERT INTO column_mappings (sheet_id, mapping)
+           VALUES ($1, $2)
+           ON CONFLICT (sheet_id) DO UPDATE
+           SET mapping = EXCLUDED.mapping,
+               created_at = CURRENT_TIMESTAMP"""
+    ),
+    'publish_sheet_version': (
+        ('integer', 'integer', 'integer'),
+        """UPDATE sheets
+           SET active_version = $1, total_records = $2,
+               last_updated = CURRENT_TIMESTAMP
+           WHERE id = $3"""
+    ),
+}
+
+
+def prepared_enabled(connection_string):
+    """
+    Uso de prepared statements para uma connection string: env var
+    DB_PREPARED_STATEMENTS (1/0); por padrão desligado no pooler do Neon
+    """
+    flag = os.getenv('DB_PREPARED_STATEMENTS', '').lower()
+    if flag:
+        return flag in ('1', 'true', 'sim', 'yes')
+    return '-pooler' not in (connection_string or '')
+
+
+def register_statement(name, sql, types=()):
+    """Adiciona um statement ao registro (SQL com $1..$n e seus tipos)"""
+    PREPARED_STATEMENTS[name] = (tuple(types), sql)
+
+
+def _positional(sql, types):
+    """SQL do registro com $n trocado por %s::tipo, para execução sem PREPARE"""
+    sql = sql.replace('%', '%%')
+    return _PARAMETER.sub(lambda m: f"%s::{types[int(m.group(1)) - 1]}", sql)
+
+
+def execute_prepared(cur, name, params=(), enabled=True, prefix=''):
+    """
+    Executa o statement `name` do registro no cursor
+
+    Prepara na conexão do cursor se ainda não foi preparado nela. Com
+    enabled=False (ou conexão sem registro) executa o SQL diretamente.
+    prefix: SQL enviado antes, no mesmo round trip (ex: "SELECT f();")
+    """
+    types, sql = PREPARED_STATEMENTS[name]
+    prepared = getattr(cur.connection, 'prepared_statements', None)
+
+    if not enabled or prepared is None:
+        # $n pode se repetir no SQL: expande os parâmetros na ordem de uso
+        order = [int(n) - 1 for n in _PARAMETER.findall(sql)]
+        cur.execute(prefix + _positional(sql, types), [params[i] for i in order])
+        return
+
+    if name not in prepared:
+        arguments = f" ({', '.join(types)})" if types else ''
+        cur.execute(f"PREPARE {name}{arguments} AS {sql}")
+        prepared.add(name)
+
+    placeholders = ', '.join(f"%s::{type_name}" for type_name in types)
+    cur.execute(prefix + (f"EXECUTE {name} ({placeholders})" if types else f"EXECUTE {name}"), params)
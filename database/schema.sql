@@ -4,28 +4,115 @@
 -- Tabela de Sheets (abas da planilha)
 CREATE TABLE IF NOT EXISTS sheets (
     id SERIAL PRIMARY KEY,
-    name VARCHAR(255) NOT NULL UNIQUE,
+    -- Workbook (planilha) a que a sheet pertence; o nome é único dentro dele
+    workbook VARCHAR(255) NOT NULL DEFAULT 'default',
+    name VARCHAR(255) NOT NULL,
     total_records INTEGER NOT NULL,
     last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     source_file VARCHAR(500),
+    -- Versão publicada dos records (NULL até o primeiro upload terminar)
+    active_version INTEGER,
+    -- Última versão alocada por um upload (publicada ou não)
+    last_version INTEGER NOT NULL DEFAULT 0,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Versionamento dos records (bancos criados antes)
+ALTER TABLE sheets ADD COLUMN IF NOT EXISTS active_version INTEGER;
+ALTER TABLE sheets ADD COLUMN IF NOT EXISTS last_version INTEGER NOT NULL DEFAULT 0;
+
+-- Vários workbooks lado a lado (bancos criados antes: tudo no workbook 'default')
+ALTER TABLE sheets ADD COLUMN IF NOT EXISTS workbook VARCHAR(255) NOT NULL DEFAULT 'default';
+ALTER TABLE sheets DROP CONSTRAINT IF EXISTS sheets_name_key;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_sheets_workbook_name ON sheets(workbook, name);
+
+-- Extensão de trigramas (busca por substring indexada)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Normalização para busca: minúsculas e sem acentos ("Prospecção" -> "prospeccao").
+-- unaccent() não é IMMUTABLE e não pode ser usada em coluna gerada, por isso
+-- o mapeamento de acentos do português é feito com translate().
+CREATE OR REPLACE FUNCTION search_normalize(input TEXT) RETURNS TEXT
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT translate(
+        lower(input),
+        'áàâãäåéèêëíìîïóòôõöúùûüçñý',
+        'aaaaaaeeeeiiiiooooouuuucny'
+    )
+$$;
+
+-- Texto pesquisável de um record: todos os valores concatenados e normalizados
+CREATE OR REPLACE FUNCTION records_search_text(data JSONB) RETURNS TEXT
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT search_normalize(string_agg(value, ' '))
+    FROM jsonb_each_text(data)
+$$;
+
 -- Tabela de Records (registros individuais de cada sheet)
 CREATE TABLE IF NOT EXISTS records (
     id SERIAL PRIMARY KEY,
     sheet_id INTEGER REFERENCES sheets(id) ON DELETE CASCADE,
+    -- Snapshot a que o record pertence (o default cobre records gravados
+    -- antes do versionamento)
+    version INTEGER NOT NULL DEFAULT 1,
     data JSONB NOT NULL,
+    row_key TEXT,
+    row_hash CHAR(32),
+    search_text TEXT GENERATED ALWAYS AS (records_search_text(data)) STORED,
+    -- Colunas tipadas preenchidas no upload a partir do column_mapping
+    nome TEXT,
+    tipo TEXT,
+    cidade TEXT,
+    data_contato DATE,
+    tem_contrato BOOLEAN,
+    grupo TEXT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Versão dos records (bancos criados antes): tudo o que já existe é a versão 1
+ALTER TABLE records ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;
+UPDATE sheets SET active_version = 1, last_version = 1
+WHERE active_version IS NULL AND last_version = 0;
+
+-- Fingerprints usados na sincronização diferencial (bancos criados antes)
+ALTER TABLE records ADD COLUMN IF NOT EXISTS row_key TEXT;
+ALTER TABLE records ADD COLUMN IF NOT EXISTS row_hash CHAR(32);
+
+-- Colunas tipadas (bancos criados antes)
+ALTER TABLE records ADD COLUMN IF NOT EXISTS nome TEXT;
+ALTER TABLE records ADD COLUMN IF NOT EXISTS tipo TEXT;
+ALTER TABLE records ADD COLUMN IF NOT EXISTS cidade TEXT;
+ALTER TABLE records ADD COLUMN IF NOT EXISTS data_contato DATE;
+ALTER TABLE records ADD COLUMN IF NOT EXISTS tem_contrato BOOLEAN;
+ALTER TABLE records ADD COLUMN IF NOT EXISTS grupo TEXT;
+
+-- Coluna de busca sem acentos (bancos criados antes)
+ALTER TABLE records ADD COLUMN IF NOT EXISTS search_text TEXT
+    GENERATED ALWAYS AS (records_search_text(data)) STORED;
+
 -- Índice para busca rápida por sheet
 CREATE INDEX IF NOT EXISTS idx_records_sheet_id ON records(sheet_id);
 
+-- Índice para paginação keyset na versão publicada
+-- (WHERE sheet_id = ? AND version = ? AND id > ?)
+DROP INDEX IF EXISTS idx_records_sheet_id_id;
+CREATE INDEX IF NOT EXISTS idx_records_sheet_version_id ON records(sheet_id, version, id);
+
+-- Índices btree das colunas tipadas (filtros e agregações do dashboard)
+CREATE INDEX IF NOT EXISTS idx_records_sheet_tipo ON records(sheet_id, tipo);
+CREATE INDEX IF NOT EXISTS idx_records_sheet_cidade ON records(sheet_id, cidade);
+CREATE INDEX IF NOT EXISTS idx_records_sheet_grupo ON records(sheet_id, grupo);
+CREATE INDEX IF NOT EXISTS idx_records_sheet_data_contato ON records(sheet_id, data_contato);
+CREATE INDEX IF NOT EXISTS idx_records_sheet_tem_contrato ON records(sheet_id, tem_contrato);
+CREATE INDEX IF NOT EXISTS idx_records_sheet_nome ON records(sheet_id, nome);
+
 -- Índice para busca em campos JSONB comuns
 -- GIN index for JSONB data (full document search)
 CREATE INDEX IF NOT EXISTS idx_records_data ON records USING GIN (data);
 
+-- Índice de trigramas para busca por substring sem acentos (LIKE '%termo%')
+CREATE INDEX IF NOT EXISTS idx_records_search_trgm ON records USING GIN (search_text gin_trgm_ops);
+
 -- Tabela de Estatísticas (dados agregados por sheet)
 CREATE TABLE IF NOT EXISTS statistics (
     id SERIAL PRIMARY KEY,
@@ -44,6 +131,68 @@ CREATE TABLE IF NOT EXISTS column_mappings (
     UNIQUE(sheet_id)
 );
 
+-- Histórico das estatísticas: uma linha por upload de cada sheet, só com
+-- os totais (compacta), para séries de tendência sem ler records.
+-- Somente inserção: UPDATE é rejeitado pelo trigger abaixo.
+CREATE TABLE IF NOT EXISTS statistics_history (
+    id BIGSERIAL PRIMARY KEY,
+    sheet_id INTEGER NOT NULL REFERENCES sheets(id) ON DELETE CASCADE,
+    version INTEGER NOT NULL,
+    total_records INTEGER NOT NULL,
+    com_contrato INTEGER,
+    sem_contrato INTEGER,
+    contatos_realizados INTEGER,
+    contatos_pendentes INTEGER,
+    recorded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_statistics_history_sheet_recorded
+    ON statistics_history(sheet_id, recorded_at);
+
+CREATE OR REPLACE FUNCTION reject_statistics_history_update() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    RAISE EXCEPTION 'statistics_history é somente inserção';
+END
+$$;
+
+DROP TRIGGER IF EXISTS trg_statistics_history_append_only ON statistics_history;
+CREATE TRIGGER trg_statistics_history_append_only
+    BEFORE UPDATE ON statistics_history
+    FOR EACH ROW EXECUTE FUNCTION reject_statistics_history_update();
+
+-- Índices de expressão criados automaticamente por Database.sync_record_indexes
+-- (ordenação por data->>chave nas colunas do column_mapping de sheets grandes)
+CREATE TABLE IF NOT EXISTS record_key_indexes (
+    index_name TEXT PRIMARY KEY,
+    sheet_id INTEGER NOT NULL REFERENCES sheets(id) ON DELETE CASCADE,
+    column_key TEXT NOT NULL,
+    total_records INTEGER NOT NULL,
+    distinct_values INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (sheet_id, column_key)
+);
+
+-- Documento do dashboard de cada workbook já serializado (e comprimido),
+-- gravado a cada upload por Database.store_dashboard_payload; /api/data só o
+-- usa quando data_version é a versão atual dos dados do workbook
+CREATE TABLE IF NOT EXISTS dashboard_payloads (
+    workbook TEXT PRIMARY KEY,
+    data_version TEXT NOT NULL,
+    body BYTEA NOT NULL,
+    body_gzip BYTEA,
+    body_br BYTEA,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Records da versão publicada de cada sheet (o que os leitores enxergam).
+-- Uploads gravam em uma versão nova e só então trocam sheets.active_version.
+CREATE OR REPLACE VIEW active_records AS
+SELECT r.*
+FROM records r
+JOIN sheets s ON s.id = r.sheet_id AND r.version = s.active_version;
+
 -- View para facilitar queries (join de sheet + statistics)
 CREATE OR REPLACE VIEW sheet_summary AS
 SELECT
@@ -53,13 +202,507 @@ SELECT
     s.last_updated,
     s.source_file,
     st.stats_data,
-    cm.mapping as column_mapping
+    cm.mapping as column_mapping,
+    s.workbook
 FROM sheets s
 LEFT JOIN statistics st ON s.id = st.sheet_id
 LEFT JOIN column_mappings cm ON s.id = cm.sheet_id;
 
+-- ===== Estatísticas calculadas no Postgres =====
+-- Derivadas dos records + column_mappings, sem reler o Excel
+
+-- Converte texto em data (ISO "AAAA-MM-DD..." ou "DD/MM/AAAA"); NULL se inválido
+CREATE OR REPLACE FUNCTION safe_to_date(input TEXT) RETURNS DATE
+LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE AS $$
+DECLARE
+    parts TEXT[];
+BEGIN
+    IF input IS NULL THEN
+        RETURN NULL;
+    END IF;
+    parts := regexp_match(input, '^\s*(\d{4})-(\d{1,2})-(\d{1,2})');
+    IF parts IS NOT NULL THEN
+        RETURN make_date(parts[1]::INT, parts[2]::INT, parts[3]::INT);
+    END IF;
+    parts := regexp_match(input, '^\s*(\d{1,2})/(\d{1,2})/(\d{4})');
+    IF parts IS NOT NULL THEN
+        RETURN make_date(parts[3]::INT, parts[2]::INT, parts[1]::INT);
+    END IF;
+    RETURN NULL;
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END
+$$;
+
+-- Contagem de valores de uma coluna (equivalente ao value_counts do pandas)
+CREATE OR REPLACE FUNCTION sheet_value_counts(p_sheet_id INTEGER, p_column TEXT, p_top INTEGER DEFAULT NULL)
+RETURNS JSONB LANGUAGE sql STABLE AS $$
+    SELECT COALESCE(jsonb_object_agg(value, total), '{}'::jsonb)
+    FROM (
+        SELECT data->>p_column AS value, count(*) AS total
+        FROM active_records
+        WHERE sheet_id = p_sheet_id AND data->>p_column IS NOT NULL
+        GROUP BY 1
+        ORDER BY total DESC, value
+        LIMIT p_top
+    ) counts
+$$;
+
+-- Recalcula as colunas tipadas a partir do column_mapping gravado
+-- (usado quando o mapeamento muda e para preencher bancos criados antes).
+-- Só reescreve as linhas cujo valor realmente muda; p_version restringe a
+-- uma versão (a que está sendo montada por um upload).
+DROP FUNCTION IF EXISTS refresh_record_typed_columns(INTEGER);
+CREATE OR REPLACE FUNCTION refresh_record_typed_columns(p_sheet_id INTEGER DEFAULT NULL,
+                                                        p_version INTEGER DEFAULT NULL)
+RETURNS INTEGER LANGUAGE plpgsql AS $$
+DECLARE
+    updated INTEGER;
+BEGIN
+    UPDATE records r
+    SET nome = t.nome, tipo = t.tipo, cidade = t.cidade,
+        data_contato = t.data_contato, tem_contrato = t.tem_contrato, grupo = t.grupo
+    FROM (
+        SELECT
+            rt.id,
+            rt.data->>(cm.mapping->>'nome') AS nome,
+            rt.data->>(cm.mapping->>'tipo') AS tipo,
+            rt.data->>(cm.mapping->>'cidade') AS cidade,
+            safe_to_date(rt.data->>(cm.mapping->>'data_contato')) AS data_contato,
+            CASE WHEN cm.mapping->>'contrato' IS NOT NULL
+                THEN rt.data->>(cm.mapping->>'contrato') IS NOT NULL END AS tem_contrato,
+            rt.data->>(cm.mapping->>'grupo') AS grupo
+        FROM records rt
+        JOIN column_mappings cm ON cm.sheet_id = rt.sheet_id
+        WHERE (p_sheet_id IS NULL OR rt.sheet_id = p_sheet_id)
+          AND (p_version IS NULL OR rt.version = p_version)
+    ) t
+    WHERE r.id = t.id
+      AND (r.nome, r.tipo, r.cidade, r.data_contato, r.tem_contrato, r.grupo)
+          IS DISTINCT FROM (t.nome, t.tipo, t.cidade, t.data_contato, t.tem_contrato, t.grupo);
+    GET DIAGNOSTICS updated = ROW_COUNT;
+    RETURN updated;
+END
+$$;
+
+-- Preenche as colunas tipadas de records gravados antes delas existirem
+SELECT refresh_record_typed_columns();
+
+-- Contagem de valores de uma coluna tipada (tipo, cidade ou grupo)
+CREATE OR REPLACE FUNCTION sheet_typed_value_counts(p_sheet_id INTEGER, p_field TEXT, p_top INTEGER DEFAULT NULL)
+RETURNS JSONB LANGUAGE plpgsql STABLE AS $$
+DECLARE
+    result JSONB;
+BEGIN
+    IF p_field NOT IN ('tipo', 'cidade', 'grupo') THEN
+        RAISE EXCEPTION 'Coluna tipada inválida: %', p_field;
+    END IF;
+    EXECUTE format($q$
+        SELECT COALESCE(jsonb_object_agg(value, total), '{}'::jsonb)
+        FROM (
+            SELECT %1$I AS value, count(*) AS total
+            FROM active_records
+            WHERE sheet_id = $1 AND %1$I IS NOT NULL
+            GROUP BY 1
+            ORDER BY total DESC, value
+            LIMIT $2
+        ) counts
+    $q$, p_field) INTO result USING p_sheet_id, p_top;
+    RETURN result;
+END
+$$;
+
+-- Contagem de contatos por período ('YYYY-MM' ou 'YYYY'), pela coluna data_contato
+CREATE OR REPLACE FUNCTION sheet_contact_periods(p_sheet_id INTEGER, p_format TEXT,
+                                                 p_since DATE DEFAULT NULL)
+RETURNS JSONB LANGUAGE sql STABLE AS $$
+    SELECT jsonb_object_agg(period, total)
+    FROM (
+        SELECT to_char(data_contato, p_format) AS period, count(*) AS total
+        FROM active_records
+        WHERE sheet_id = p_sheet_id
+          AND data_contato IS NOT NULL
+          AND (p_since IS NULL OR data_contato >= p_since)
+        GROUP BY 1
+    ) periods
+$$;
+
+-- Estatísticas por sheet, no mesmo formato de calculate_statistics (api/upload.py),
+-- calculadas na hora a partir da versão publicada. Recriada a cada init para
+-- acompanhar mudanças na definição.
+
+-- Migração única: cache antigo (materialized view + flag global de refresh)
+DROP MATERIALIZED VIEW IF EXISTS sheet_statistics_mv;
+DROP TABLE IF EXISTS statistics_refresh_state;
+
+DROP VIEW IF EXISTS sheet_statistics_live;
+DROP FUNCTION IF EXISTS sheet_filled_count(INTEGER, TEXT);
+DROP FUNCTION IF EXISTS sheet_date_counts(INTEGER, TEXT, TEXT, DATE);
+
+CREATE VIEW sheet_statistics_live AS
+SELECT
+    s.id AS sheet_id,
+    s.workbook,
+    s.active_version AS version,
+    cm.mapping,
+    jsonb_strip_nulls(jsonb_build_object(
+        'por_tipo', CASE WHEN m.tipo IS NOT NULL
+            THEN sheet_typed_value_counts(s.id, 'tipo') END,
+        'top_cidades', CASE WHEN m.cidade IS NOT NULL
+            THEN sheet_typed_value_counts(s.id, 'cidade', 10) END,
+        'contatos_realizados', CASE WHEN m.data_contato IS NOT NULL
+            THEN n.contatos END,
+        'contatos_pendentes', CASE WHEN m.data_contato IS NOT NULL
+            THEN n.total - n.contatos END,
+        'com_contrato', CASE WHEN m.contrato IS NOT NULL
+            THEN n.contratos END,
+        'sem_contrato', CASE WHEN m.contrato IS NOT NULL
+            THEN n.total - n.contratos END,
+        'top_grupos', CASE WHEN m.grupo IS NOT NULL
+            THEN sheet_typed_value_counts(s.id, 'grupo', 10) END,
+        'evolucao_temporal', CASE WHEN m.data_contato IS NOT NULL
+            THEN sheet_contact_periods(s.id, 'YYYY-MM') END,
+        'contatos_por_ano', CASE WHEN m.data_contato IS NOT NULL
+            THEN sheet_contact_periods(s.id, 'YYYY') END,
+        'ultimos_12_meses', CASE WHEN m.data_contato IS NOT NULL
+            THEN sheet_contact_periods(s.id, 'YYYY-MM', CURRENT_DATE - 365) END,
+        'operacao_estacionamento', CASE WHEN est.col IS NOT NULL
+            THEN sheet_value_counts(s.id, est.col) END
+    )) AS stats_data
+FROM sheets s
+JOIN column_mappings cm ON cm.sheet_id = s.id
+CROSS JOIN LATERAL (
+    SELECT
+        cm.mapping->>'tipo' AS tipo,
+        cm.mapping->>'cidade' AS cidade,
+        cm.mapping->>'data_contato' AS data_contato,
+        cm.mapping->>'contrato' AS contrato,
+        cm.mapping->>'grupo' AS grupo
+) m
+CROSS JOIN LATERAL (
+    -- contatos_realizados conta a célula preenchida (como o notna do pandas),
+    -- mesmo que o texto não seja uma data válida
+    SELECT
+        count(*)::INTEGER AS total,
+        (count(*) FILTER (WHERE data->>m.data_contato IS NOT NULL))::INTEGER AS contatos,
+        (count(*) FILTER (WHERE tem_contrato))::INTEGER AS contratos
+    FROM active_records
+    WHERE sheet_id = s.id
+) n
+LEFT JOIN LATERAL (
+    SELECT k.key AS col
+    FROM (SELECT data FROM active_records WHERE sheet_id = s.id ORDER BY id LIMIT 1) first_record,
+         jsonb_object_keys(first_record.data) WITH ORDINALITY AS k(key, ord)
+    WHERE lower(k.key) LIKE '%estacionamento%' AND lower(k.key) LIKE '%oper%'
+    ORDER BY k.ord
+    LIMIT 1
+) est ON true;
+
+-- Cache das estatísticas por sheet. Cada linha guarda a versão e o
+-- column_mapping de que foi calculada: fica desatualizada quando a sheet
+-- publica outra versão, muda o mapeamento ou tem records da versão
+-- calculada alterados por qualquer caminho (stale, ligado pelos triggers
+-- abaixo), e só essas sheets são recalculadas (por workbook), sem varrer os
+-- demais workbooks.
+CREATE TABLE IF NOT EXISTS sheet_statistics (
+    sheet_id INTEGER PRIMARY KEY REFERENCES sheets(id) ON DELETE CASCADE,
+    version INTEGER NOT NULL,
+    mapping JSONB NOT NULL,
+    stats_data JSONB NOT NULL,
+    stale BOOLEAN NOT NULL DEFAULT false,
+    refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Migração de bancos criados antes da coluna stale
+ALTER TABLE sheet_statistics ADD COLUMN IF NOT EXISTS stale BOOLEAN NOT NULL DEFAULT false;
+
+-- sheet_statistics_live acabou de ser recriada e a definição pode ter
+-- mudado: o cache existente é recalculado no próximo refresh
+UPDATE sheet_statistics SET stale = true WHERE NOT stale;
+
+DROP TRIGGER IF EXISTS trg_records_statistics_dirty ON records;
+DROP TRIGGER IF EXISTS trg_column_mappings_statistics_dirty ON column_mappings;
+DROP TRIGGER IF EXISTS trg_sheets_statistics_dirty ON sheets;
+DROP FUNCTION IF EXISTS mark_statistics_dirty();
+
+-- Marca como desatualizadas as estatísticas das sheets cujos records da
+-- versão calculada foram alterados no statement (tabela de transição
+-- changed_rows). Escritas em versões ainda não publicadas (carga de um
+-- upload) ou já substituídas não casam com sheet_statistics.version.
+CREATE OR REPLACE FUNCTION mark_records_statistics_stale() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE sheet_statistics st SET stale = true
+    FROM (SELECT DISTINCT sheet_id, version FROM changed_rows) c
+    WHERE st.sheet_id = c.sheet_id AND st.version = c.version AND NOT st.stale;
+    RETURN NULL;
+END
+$$;
+
+-- Mesmo, para o column_mapping das sheets: só quando difere do usado no
+-- cálculo (o upload regrava o mapeamento mesmo sem mudança)
+CREATE OR REPLACE FUNCTION mark_mapping_statistics_stale() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE sheet_statistics st SET stale = true
+    FROM changed_rows c
+    WHERE st.sheet_id = c.sheet_id AND st.mapping IS DISTINCT FROM c.mapping AND NOT st.stale;
+    RETURN NULL;
+END
+$$;
+
+-- TRUNCATE não tem tabela de transição: todas ficam desatualizadas
+CREATE OR REPLACE FUNCTION mark_all_statistics_stale() RETURNS TRIGGER
+LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE sheet_statistics SET stale = true WHERE NOT stale;
+    RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS trg_records_statistics_insert ON records;
+CREATE TRIGGER trg_records_statistics_insert
+    AFTER INSERT ON records REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION mark_records_statistics_stale();
+DROP TRIGGER IF EXISTS trg_records_statistics_update ON records;
+CREATE TRIGGER trg_records_statistics_update
+    AFTER UPDATE ON records REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION mark_records_statistics_stale();
+DROP TRIGGER IF EXISTS trg_records_statistics_delete ON records;
+CREATE TRIGGER trg_records_statistics_delete
+    AFTER DELETE ON records REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION mark_records_statistics_stale();
+DROP TRIGGER IF EXISTS trg_records_statistics_truncate ON records;
+CREATE TRIGGER trg_records_statistics_truncate
+    AFTER TRUNCATE ON records
+    FOR EACH STATEMENT EXECUTE FUNCTION mark_all_statistics_stale();
+DROP TRIGGER IF EXISTS trg_column_mappings_statistics_insert ON column_mappings;
+CREATE TRIGGER trg_column_mappings_statistics_insert
+    AFTER INSERT ON column_mappings REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION mark_mapping_statistics_stale();
+DROP TRIGGER IF EXISTS trg_column_mappings_statistics_update ON column_mappings;
+CREATE TRIGGER trg_column_mappings_statistics_update
+    AFTER UPDATE ON column_mappings REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION mark_mapping_statistics_stale();
+
+-- Recalcula as estatísticas desatualizadas (ou todas, se forçado) de um
+-- workbook, ou de todos com p_workbook NULL. Retorna true se houve
+-- recálculo; um recálculo do mesmo workbook já em andamento é respeitado.
+DROP FUNCTION IF EXISTS refresh_sheet_statistics(BOOLEAN);
+CREATE OR REPLACE FUNCTION refresh_sheet_statistics(p_force BOOLEAN DEFAULT false,
+                                                    p_workbook TEXT DEFAULT NULL)
+RETURNS BOOLEAN LANGUAGE plpgsql AS $$
+DECLARE
+    stale INTEGER[];
+BEGIN
+    SELECT array_agg(s.id) INTO stale
+    FROM sheets s
+    JOIN column_mappings cm ON cm.sheet_id = s.id
+    LEFT JOIN sheet_statistics st ON st.sheet_id = s.id
+    WHERE (p_workbook IS NULL OR s.workbook = p_workbook)
+      AND s.active_version IS NOT NULL
+      AND (p_force
+           OR st.sheet_id IS NULL
+           OR st.stale
+           OR st.version IS DISTINCT FROM s.active_version
+           OR st.mapping IS DISTINCT FROM cm.mapping);
+
+    IF stale IS NULL THEN
+        RETURN false;
+    END IF;
+    IF NOT pg_try_advisory_xact_lock(hashtext('sheet_statistics:' || COALESCE(p_workbook, ''))) THEN
+        RETURN false;
+    END IF;
+
+    INSERT INTO sheet_statistics (sheet_id, version, mapping, stats_data, stale, refreshed_at)
+    SELECT sheet_id, version, mapping, stats_data, false, CURRENT_TIMESTAMP
+    FROM sheet_statistics_live
+    WHERE sheet_id = ANY(stale)
+    ON CONFLICT (sheet_id) DO UPDATE
+    SET version = EXCLUDED.version,
+        mapping = EXCLUDED.mapping,
+        stats_data = EXCLUDED.stats_data,
+        stale = false,
+        refreshed_at = EXCLUDED.refreshed_at;
+    RETURN true;
+END
+$$;
+
+-- ===== Layout particionado (opcional) =====
+-- Com init_database(partitioned=True), records vira uma tabela particionada
+-- por LIST (sheet_id), e cada sheet por LIST (version): uma tabela
+-- records_s<sheet>_v<versão> por snapshot. Leituras por sheet/versão usam
+-- partition pruning, e a versão substituída sai com DROP TABLE (sem DELETE,
+-- dead tuples ou vacuum, e sem tocar nos índices das outras sheets).
+
+CREATE OR REPLACE FUNCTION records_is_partitioned() RETURNS BOOLEAN
+LANGUAGE sql STABLE AS $$
+    SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'records'::regclass)
+$$;
+
+-- Cria (se faltarem) a partição da sheet e a da versão; não faz nada no
+-- layout sem partições. As tabelas são criadas soltas e anexadas com
+-- ATTACH PARTITION, que não bloqueia leitores do pai (CREATE TABLE ...
+-- PARTITION OF exigiria ACCESS EXCLUSIVE nele).
+CREATE OR REPLACE FUNCTION prepare_records_partition(p_sheet_id INTEGER, p_version INTEGER)
+RETURNS VOID LANGUAGE plpgsql AS $$
+DECLARE
+    sheet_partition TEXT := format('records_s%s', p_sheet_id);
+    version_partition TEXT := format('records_s%s_v%s', p_sheet_id, p_version);
+BEGIN
+    IF NOT records_is_partitioned() THEN
+        RETURN;
+    END IF;
+    IF to_regclass(sheet_partition) IS NULL THEN
+        EXECUTE format(
+            'CREATE TABLE %I (LIKE records INCLUDING DEFAULTS INCLUDING GENERATED) PARTITION BY LIST (version)',
+            sheet_partition);
+        EXECUTE format('ALTER TABLE records ATTACH PARTITION %I FOR VALUES IN (%s)',
+            sheet_partition, p_sheet_id);
+    END IF;
+    IF to_regclass(version_partition) IS NULL THEN
+        EXECUTE format('CREATE TABLE %I (LIKE records INCLUDING DEFAULTS INCLUDING GENERATED)',
+            version_partition);
+        EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES IN (%s)',
+            sheet_partition, version_partition, p_version);
+    END IF;
+END
+$$;
+
+-- Migra records do layout sem partições para o particionado (cópia dentro
+-- do banco, com records travada até o fim). Retorna false se já estava
+-- particionada. Views, materialized view e triggers de records são
+-- removidos junto com a tabela antiga: o schema deve ser reaplicado em
+-- seguida (Database.init_database faz isso).
+CREATE OR REPLACE FUNCTION partition_records() RETURNS BOOLEAN
+LANGUAGE plpgsql AS $$
+DECLARE
+    part RECORD;
+BEGIN
+    IF records_is_partitioned() THEN
+        RETURN false;
+    END IF;
+
+    LOCK TABLE records IN ACCESS EXCLUSIVE MODE;
+    ALTER TABLE records RENAME TO records_unpartitioned;
+    ALTER INDEX records_pkey RENAME TO records_unpartitioned_pkey;
+    ALTER SEQUENCE records_id_seq OWNED BY NONE;
+
+    -- A chave primária precisa conter as chaves de partição
+    CREATE TABLE records (
+        LIKE records_unpartitioned INCLUDING DEFAULTS INCLUDING GENERATED,
+        PRIMARY KEY (sheet_id, version, id),
+        FOREIGN KEY (sheet_id) REFERENCES sheets(id) ON DELETE CASCADE
+    ) PARTITION BY LIST (sheet_id);
+
+    FOR part IN
+        SELECT DISTINCT sheet_id, version FROM records_unpartitioned WHERE sheet_id IS NOT NULL
+    LOOP
+        PERFORM prepare_records_partition(part.sheet_id, part.version);
+    END LOOP;
+
+    INSERT INTO records (id, sheet_id, version, data, row_key, row_hash,
+                         nome, tipo, cidade, data_contato, tem_contrato, grupo, created_at)
+    SELECT id, sheet_id, version, data, row_key, row_hash,
+           nome, tipo, cidade, data_contato, tem_contrato, grupo, created_at
+    FROM records_unpartitioned
+    WHERE sheet_id IS NOT NULL;
+
+    DROP TABLE records_unpartitioned CASCADE;
+    ALTER SEQUENCE records_id_seq OWNED BY records.id;
+    RETURN true;
+END
+$$;
+
+-- Remove os records de versões que não estão publicadas (substituídas ou de
+-- uploads interrompidos). Sheets com upload em andamento (advisory lock de
+-- escrita, chave (1, hashtext(workbook/nome)) como em Database.save_sheet_data) ficam
+-- para a próxima coleta. No layout particionado a versão sai com DROP TABLE
+-- da sua partição; se leitores seguram a partição por mais que lock_timeout,
+-- ela fica para a próxima coleta. Retorna a quantidade de records removidos.
+CREATE OR REPLACE FUNCTION collect_sheet_versions() RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    sheet RECORD;
+    part RECORD;
+    partitioned BOOLEAN := records_is_partitioned();
+    removed INTEGER;
+    total INTEGER := 0;
+BEGIN
+    PERFORM set_config('lock_timeout', '2s', true);
+
+    FOR sheet IN SELECT id, workbook, name FROM sheets LOOP
+        CONTINUE WHEN NOT pg_try_advisory_xact_lock(1, hashtext(sheet.workbook || '/' || sheet.name));
+        -- active_version é relido depois do lock: uma publicação concluída
+        -- entre o início do loop e o lock já é vista aqui
+        IF partitioned THEN
+            FOR part IN
+                SELECT c.relname
+                FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                JOIN sheets s ON s.id = sheet.id
+                WHERE i.inhparent = to_regclass(format('records_s%s', sheet.id))
+                  AND substring(c.relname FROM '_v(\d+)$')::INTEGER IS DISTINCT FROM s.active_version
+            LOOP
+                BEGIN
+                    EXECUTE format('SELECT count(*) FROM %I', part.relname) INTO removed;
+                    EXECUTE format('DROP TABLE %I', part.relname);
+                    total := total + removed;
+                EXCEPTION WHEN lock_not_available THEN
+                    NULL;
+                END;
+            END LOOP;
+        ELSE
+            DELETE FROM records r
+            USING sheets s
+            WHERE s.id = sheet.id
+              AND r.sheet_id = s.id
+              AND r.version IS DISTINCT FROM s.active_version;
+            GET DIAGNOSTICS removed = ROW_COUNT;
+            total := total + removed;
+        END IF;
+    END LOOP;
+
+    -- Partições de sheets que não existem mais (ex: depois de delete_all_data)
+    IF partitioned THEN
+        FOR part IN
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'records'::regclass
+              AND NOT EXISTS (
+                  SELECT 1 FROM sheets s
+                  WHERE s.id = substring(c.relname FROM '^records_s(\d+)$')::INTEGER
+              )
+        LOOP
+            BEGIN
+                EXECUTE format('DROP TABLE %I', part.relname);
+            EXCEPTION WHEN lock_not_available THEN
+                NULL;
+            END;
+        END LOOP;
+    END IF;
+
+    RETURN total;
+END
+$$;
+
 -- Comentários para documentação
 COMMENT ON TABLE sheets IS 'Armazena informações sobre cada aba da planilha Excel';
 COMMENT ON TABLE records IS 'Armazena os registros individuais de cada sheet em formato JSONB';
 COMMENT ON TABLE statistics IS 'Armazena estatísticas agregadas por sheet (contatos, contratos, etc)';
 COMMENT ON TABLE column_mappings IS 'Armazena o mapeamento de colunas detectadas automaticamente';
+COMMENT ON VIEW sheet_statistics_live IS 'Estatísticas por sheet calculadas a partir de records + column_mappings';
+COMMENT ON TABLE sheet_statistics IS 'Cache de sheet_statistics_live por sheet (versão e mapeamento de origem)';
+COMMENT ON COLUMN sheets.workbook IS 'Workbook (planilha de origem) da sheet; nomes de sheet são únicos por workbook';
+COMMENT ON VIEW active_records IS 'Records da versão publicada (sheets.active_version) de cada sheet';
+COMMENT ON COLUMN sheets.active_version IS 'Versão dos records visível aos leitores';
+COMMENT ON COLUMN records.version IS 'Versão (snapshot) da sheet a que o record pertence';
+COMMENT ON COLUMN records.row_key IS 'Chave do record na sincronização (coluna nome detectada ou hash)';
+COMMENT ON COLUMN records.row_hash IS 'MD5 do conteúdo canônico do record';
+COMMENT ON COLUMN records.data_contato IS 'Data do contato (coluna data_contato do column_mapping)';
+COMMENT ON COLUMN records.tem_contrato IS 'Coluna contrato do column_mapping preenchida';
+COMMENT ON COLUMN records.search_text IS 'Valores do record em minúsculas e sem acentos, para busca';
+COMMENT ON TABLE record_key_indexes IS 'Índices de expressão por sheet/chave do JSONB mantidos automaticamente';
+COMMENT ON TABLE dashboard_payloads IS 'JSON do dashboard por workbook, pronto para envio (data_version de origem)';
+COMMENT ON TABLE statistics_history IS 'Totais das estatísticas de cada upload por sheet (somente inserção)';
@@ -0,0 +1,171 @@
+-- Schema para Dashboard Comercial
+-- SQLite (backend local/offline, DATABASE_URL=sqlite:///caminho.db)
+-- Mesmas tabelas do schema.sql; JSON guardado como TEXT (funções JSON1)
+
+-- Bancos criados antes dos workbooks são migrados por SQLiteDatabase.init_database
+CREATE TABLE IF NOT EXISTS sheets (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    workbook TEXT NOT NULL DEFAULT 'default',
+    name TEXT NOT NULL,
+    total_records INTEGER NOT NULL,
+    last_updated TEXT DEFAULT CURRENT_TIMESTAMP,
+    source_file TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (workbook, name)
+);
+
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sheet_id INTEGER NOT NULL REFERENCES sheets(id) ON DELETE CASCADE,
+    data TEXT NOT NULL CHECK (json_valid(data)),
+    row_key TEXT,
+    row_hash TEXT,
+    -- Valores do record em minúsculas e sem acentos (preenchido na gravação)
+    search_text TEXT,
+    nome TEXT,
+    tipo TEXT,
+    cidade TEXT,
+    data_contato TEXT,
+    tem_contrato INTEGER,
+    grupo TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_records_sheet_id_id ON records(sheet_id, id);
+CREATE INDEX IF NOT EXISTS idx_records_sheet_tipo ON records(sheet_id, tipo);
+CREATE INDEX IF NOT EXISTS idx_records_sheet_cidade ON records(sheet_id, cidade);
+CREATE INDEX IF NOT EXISTS idx_records_sheet_grupo ON records(sheet_id, grupo);
+CREATE INDEX IF NOT EXISTS idx_records_sheet_data_contato ON records(sheet_id, data_contato);
+CREATE INDEX IF NOT EXISTS idx_records_sheet_tem_contrato ON records(sheet_id, tem_contrato);
+CREATE INDEX IF NOT EXISTS idx_records_sheet_nome ON records(sheet_id, nome);
+
+CREATE TABLE IF NOT EXISTS statistics (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sheet_id INTEGER NOT NULL UNIQUE REFERENCES sheets(id) ON DELETE CASCADE,
+    stats_data TEXT NOT NULL,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS column_mappings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sheet_id INTEGER NOT NULL UNIQUE REFERENCES sheets(id) ON DELETE CASCADE,
+    mapping TEXT NOT NULL,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Histórico das estatísticas: uma linha por upload de cada sheet (somente
+-- inserção; version fica NULL, o SQLite não guarda versões dos records)
+CREATE TABLE IF NOT EXISTS statistics_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sheet_id INTEGER NOT NULL REFERENCES sheets(id) ON DELETE CASCADE,
+    version INTEGER,
+    total_records INTEGER NOT NULL,
+    com_contrato INTEGER,
+    sem_contrato INTEGER,
+    contatos_realizados INTEGER,
+    contatos_pendentes INTEGER,
+    recorded_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_statistics_history_sheet_recorded
+    ON statistics_history(sheet_id, recorded_at);
+
+CREATE TRIGGER IF NOT EXISTS trg_statistics_history_append_only
+BEFORE UPDATE ON statistics_history
+BEGIN
+    SELECT RAISE(ABORT, 'statistics_history é somente inserção');
+END;
+
+-- Cache das estatísticas por sheet (equivale a sheet_statistics do PostgreSQL)
+CREATE TABLE IF NOT EXISTS sheet_statistics (
+    sheet_id INTEGER PRIMARY KEY REFERENCES sheets(id) ON DELETE CASCADE,
+    stats_data TEXT NOT NULL,
+    refreshed_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Marca de "estatísticas desatualizadas" por workbook, ligada por escritas
+-- em records/column_mappings das sheets dele
+DROP TABLE IF EXISTS statistics_refresh_state;
+CREATE TABLE IF NOT EXISTS workbook_statistics_state (
+    workbook TEXT PRIMARY KEY,
+    dirty INTEGER NOT NULL DEFAULT 1,
+    refreshed_at TEXT
+);
+INSERT OR IGNORE INTO workbook_statistics_state (workbook) SELECT DISTINCT workbook FROM sheets;
+
+-- Contador de alterações das sheets, records e column_mappings de cada
+-- workbook (versão dos dados do dashboard, ETag de /api/data); só cresce,
+-- inclusive quando sheets são removidas
+CREATE TABLE IF NOT EXISTS workbook_data_version (
+    workbook TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
+
+-- Triggers recriados a cada init (a definição pode mudar)
+DROP TRIGGER IF EXISTS trg_sheets_insert_state;
+DROP TRIGGER IF EXISTS trg_sheets_update_version;
+DROP TRIGGER IF EXISTS trg_sheets_delete_version;
+DROP TRIGGER IF EXISTS trg_records_insert_dirty;
+DROP TRIGGER IF EXISTS trg_records_update_dirty;
+DROP TRIGGER IF EXISTS trg_records_delete_dirty;
+DROP TRIGGER IF EXISTS trg_column_mappings_insert_dirty;
+DROP TRIGGER IF EXISTS trg_column_mappings_update_dirty;
+DROP TRIGGER IF EXISTS trg_column_mappings_delete_dirty;
+
+CREATE TRIGGER trg_sheets_insert_state AFTER INSERT ON sheets
+BEGIN
+    INSERT OR IGNORE INTO workbook_statistics_state (workbook) VALUES (NEW.workbook);
+    INSERT INTO workbook_data_version (workbook, version) VALUES (NEW.workbook, 1)
+    ON CONFLICT (workbook) DO UPDATE SET version = version + 1;
+END;
+-- Cada gravação de uma sheet atualiza total_records/last_updated dela
+CREATE TRIGGER trg_sheets_update_version AFTER UPDATE ON sheets
+BEGIN
+    UPDATE workbook_data_version SET version = version + 1 WHERE workbook = NEW.workbook;
+END;
+CREATE TRIGGER trg_sheets_delete_version AFTER DELETE ON sheets
+BEGIN
+    UPDATE workbook_data_version SET version = version + 1 WHERE workbook = OLD.workbook;
+END;
+CREATE TRIGGER trg_records_insert_dirty AFTER INSERT ON records
+BEGIN
+    UPDATE workbook_statistics_state SET dirty = 1
+    WHERE dirty = 0 AND workbook = (SELECT workbook FROM sheets WHERE id = NEW.sheet_id);
+    UPDATE workbook_data_version SET version = version + 1
+    WHERE workbook = (SELECT workbook FROM sheets WHERE id = NEW.sheet_id);
+END;
+CREATE TRIGGER trg_records_update_dirty AFTER UPDATE ON records
+BEGIN
+    UPDATE workbook_statistics_state SET dirty = 1
+    WHERE dirty = 0 AND workbook = (SELECT workbook FROM sheets WHERE id = NEW.sheet_id);
+    UPDATE workbook_data_version SET version = version + 1
+    WHERE workbook = (SELECT workbook FROM sheets WHERE id = NEW.sheet_id);
+END;
+CREATE TRIGGER trg_records_delete_dirty AFTER DELETE ON records
+BEGIN
+    UPDATE workbook_statistics_state SET dirty = 1
+    WHERE dirty = 0 AND workbook = (SELECT workbook FROM sheets WHERE id = OLD.sheet_id);
+    UPDATE workbook_data_version SET version = version + 1
+    WHERE workbook = (SELECT workbook FROM sheets WHERE id = OLD.sheet_id);
+END;
+CREATE TRIGGER trg_column_mappings_insert_dirty AFTER INSERT ON column_mappings
+BEGIN
+    UPDATE workbook_statistics_state SET dirty = 1
+    WHERE dirty = 0 AND workbook = (SELECT workbook FROM sheets WHERE id = NEW.sheet_id);
+    UPDATE workbook_data_version SET version = version + 1
+    WHERE workbook = (SELECT workbook FROM sheets WHERE id = NEW.sheet_id);
+END;
+CREATE TRIGGER trg_column_mappings_update_dirty AFTER UPDATE ON column_mappings
+BEGIN
+    UPDATE workbook_statistics_state SET dirty = 1
+    WHERE dirty = 0 AND workbook = (SELECT workbook FROM sheets WHERE id = NEW.sheet_id);
+    UPDATE workbook_data_version SET version = version + 1
+    WHERE workbook = (SELECT workbook FROM sheets WHERE id = NEW.sheet_id);
+END;
+CREATE TRIGGER trg_column_mappings_delete_dirty AFTER DELETE ON column_mappings
+BEGIN
+    UPDATE workbook_statistics_state SET dirty = 1
+    WHERE dirty = 0 AND workbook = (SELECT workbook FROM sheets WHERE id = OLD.sheet_id);
+    UPDATE workbook_data_version SET version = version + 1
+    WHERE workbook = (SELECT workbook FROM sheets WHERE id = OLD.sheet_id);
+END;
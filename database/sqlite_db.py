@@ -0,0 +1,873 @@
+"""
+Backend SQLite embutido, com a mesma interface do Database (PostgreSQL)
+
+Selecionado com DATABASE_URL=sqlite:///caminho.db (ou sqlite:///:memory:).
+Usa as funções JSON1 e journal em modo WAL; permite rodar upload, dashboard
+e benchmarks localmente, sem uma instância do Neon.
+"""
+import os
+import io
+import csv
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from itertools import chain
+from datetime import datetime
+from .base import StorageBackend
+from .export import EXPORT_FORMATS, CSV_BOM, write_xlsx
+from .common import (
+    DEFAULT_BATCH_SIZE, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, SAVE_MODES, DEFAULT_WORKBOOK,
+    HISTORY_METRICS, history_metrics, iso_date_param, DOCUMENT_SECTIONS, document_projection,
+    ndjson_line, ndjson_record,
+    fingerprint_records, diff_records, typed_values, typed_filters_sql,
+    search_normalize, json_text, encode_cursor, decode_cursor, decode_id_cursor, escape_like
+)
+
+SQLITE_SCHEMA_FILE = os.path.join(os.path.dirname(__file__), 'schema_sqlite.sql')
+
+# Colunas gravadas por record no SQLite (search_text é calculada na gravação)
+_INSERT_RECORD = """
+    INSERT INTO records (sheet_id, data, row_key, row_hash, search_text,
+                         nome, tipo, cidade, data_contato, tem_contrato, grupo)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Recria sheets com a coluna workbook e UNIQUE (workbook, name) em bancos
+# criados antes dos workbooks (o SQLite não remove um UNIQUE com ALTER TABLE)
+_MIGRATE_SHEETS = """
+    CREATE TABLE sheets_workbooks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        workbook TEXT NOT NULL DEFAULT 'default',
+        name TEXT NOT NULL,
+        total_records INTEGER NOT NULL,
+        last_updated TEXT DEFAULT CURRENT_TIMESTAMP,
+        source_file TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (workbook, name)
+    );
+    INSERT INTO sheets_workbooks (id, name, total_records, last_updated, source_file, created_at)
+    SELECT id, name, total_records, last_updated, source_file, created_at FROM sheets;
+    DROP TABLE sheets;
+    ALTER TABLE sheets_workbooks RENAME TO sheets;
+"""
+
+
+def is_sqlite_url(url):
+    """True se a connection string aponta para um arquivo SQLite"""
+    return bool(url) and url.startswith('sqlite:')
+
+
+def sqlite_path(url):
+    """Caminho do arquivo em sqlite:///relativo.db ou sqlite:////absoluto.db"""
+    path = url.split(':', 1)[1]
+    if path.startswith('///'):
+        path = path[3:]
+    elif path.startswith('//'):
+        path = path[2:]
+    return path or ':memory:'
+
+
+def _json_path(column):
+    """Caminho JSON1 para uma chave qualquer do record"""
+    return '$."' + column.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _search_text(record):
+    values = [json_text(value) for value in record.values() if value is not None]
+    return search_normalize(' '.join(values))
+
+
+def _record_row(sheet_id, row_key, row_hash, record, column_mapping):
+    """Parâmetros do INSERT de um record"""
+    nome, tipo, cidade, data_contato, tem_contrato, grupo = typed_values(record, column_mapping)
+    return (
+        sheet_id, json.dumps(record, default=str, ensure_ascii=False), row_key, row_hash,
+        _search_text(record), nome, tipo, cidade,
+        data_contato.isoformat() if data_contato else None,
+        None if tem_contrato is None else int(tem_contrato), grupo
+    )
+
+
+class SQLiteDatabase(StorageBackend):
+    def __init__(self, connection_string=None, batch_size=None, **kwargs):
+        """
+        Inicializa o backend SQLite
+        connection_string: sqlite:///caminho.db (env var DATABASE_URL)
+        batch_size: registros por executemany na gravação (env var DB_BATCH_SIZE)
+        Demais argumentos do Database (pool, load_method) são ignorados.
+        """
+        self.connection_string = connection_string or os.getenv('DATABASE_URL')
+        if not is_sqlite_url(self.connection_string):
+            raise ValueError("DATABASE_URL não é uma URL sqlite:///")
+        self.path = sqlite_path(self.connection_string)
+
+        self.batch_size = int(batch_size or os.getenv('DB_BATCH_SIZE') or DEFAULT_BATCH_SIZE)
+        if self.batch_size <= 0:
+            raise ValueError("batch_size deve ser maior que zero")
+
+        self.last_load_stats = None
+        self.last_sync_stats = None
+
+        # Uma conexão por instância (obrigatório para :memory:), serializada por lock
+        self._conn = None
+        self._lock = threading.RLock()
+
+    def get_connection(self):
+        """Retorna a conexão da instância, abrindo-a em modo WAL na primeira vez"""
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute("PRAGMA foreign_keys = ON")
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        """Fecha a conexão"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def init_database(self, schema_file=None):
+        """Inicializa o banco com o schema SQLite"""
+        with open(schema_file or SQLITE_SCHEMA_FILE, 'r', encoding='utf-8') as f:
+            schema = f.read()
+
+        with self._lock:
+            conn = self.get_connection()
+            columns = [row['name'] for row in conn.execute("PRAGMA table_info(sheets)")]
+            if columns and 'workbook' not in columns:
+                # Sem checagem de FK durante a troca: records apontam para o mesmo nome
+                conn.execute("PRAGMA foreign_keys = OFF")
+                try:
+                    conn.executescript(f"BEGIN; {_MIGRATE_SHEETS} COMMIT;")
+                finally:
+                    conn.execute("PRAGMA foreign_keys = ON")
+                print("[OK] Tabela sheets migrada para workbooks")
+            conn.executescript(schema)
+            print("[OK] Database inicializado com sucesso!")
+
+    def execute_query(self, query, params=None, fetch=False):
+        """Executa uma query SQL (placeholders '?' do sqlite3)"""
+        with self._lock:
+            conn = self.get_connection()
+            try:
+                cur = conn.execute(query, params or ())
+                if fetch:
+                    return [dict(row) for row in cur.fetchall()]
+                conn.commit()
+                return cur.rowcount
+            except Exception:
+                conn.rollback()
+                raise
+
+    def _insert_rows(self, conn, sheet_id, rows, batch_size=None, column_mapping=None):
+        """Insere em lotes uma lista de (row_key, row_hash, record)"""
+        batch_size = batch_size or self.batch_size
+        start = time.perf_counter()
+        batches = 0
+
+        for offset in range(0, len(rows), batch_size):
+            batch = rows[offset:offset + batch_size]
+            conn.executemany(_INSERT_RECORD, [
+                _record_row(sheet_id, row_key, row_hash, record, column_mapping)
+                for row_key, row_hash, record in batch
+            ])
+            batches += 1
+
+        seconds = time.perf_counter() - start
+        return {
+            'rows': len(rows),
+            'batches': batches,
+            'seconds': round(seconds, 4),
+            'rows_per_sec': round(len(rows) / seconds, 1) if seconds > 0 else None
+        }
+
+    def _sync_records(self, conn, sheet_id, records, batch_size=None, column_mapping=None):
+        """Aplica apenas o diff dos records (mesma lógica do Database.sync_records)"""
+        key_column = (column_mapping or {}).get('nome')
+        rows = fingerprint_records(records, key_column)
+
+        existing = [
+            (row['id'], row['row_key'], row['row_hash'],
+             json.loads(row['data']) if row['data'] is not None else None)
+            for row in conn.execute("""
+                SELECT id, row_key, row_hash,
+                       CASE WHEN row_hash IS NULL THEN data END AS data
+                FROM records
+                WHERE sheet_id = ?
+                ORDER BY id
+            """, (sheet_id,))
+        ]
+        added, changed, removed, unchanged = diff_records(rows, existing, key_column)
+
+        if removed:
+            conn.executemany("DELETE FROM records WHERE id = ?", [(record_id,) for record_id in removed])
+
+        if changed:
+            conn.executemany("""
+                UPDATE records
+                SET sheet_id = ?, data = ?, row_key = ?, row_hash = ?, search_text = ?,
+                    nome = ?, tipo = ?, cidade = ?, data_contato = ?, tem_contrato = ?, grupo = ?
+                WHERE id = ?
+            """, [
+                _record_row(sheet_id, row_key, row_hash, record, column_mapping) + (record_id,)
+                for record_id, row_key, row_hash, record in changed
+            ])
+
+        self.last_load_stats = self._insert_rows(conn, sheet_id, added, batch_size, column_mapping)
+
+        return {
+            'added': len(added),
+            'changed': len(changed),
+            'removed': len(removed),
+            'unchanged': unchanged
+        }
+
+    def _refresh_typed_columns(self, conn, sheet_id, column_mapping):
+        """Recalcula as colunas tipadas de uma sheet (equivale a refresh_record_typed_columns)"""
+        rows = conn.execute(
+            "SELECT id, data FROM records WHERE sheet_id = ?", (sheet_id,)
+        ).fetchall()
+        updates = []
+        for row in rows:
+            typed = _record_row(sheet_id, None, None, json.loads(row['data']), column_mapping)[5:]
+            updates.append(typed + (row['id'],))
+        conn.executemany("""
+            UPDATE records
+            SET nome = ?, tipo = ?, cidade = ?, data_contato = ?, tem_contrato = ?, grupo = ?
+            WHERE id = ?
+        """, updates)
+        return len(updates)
+
+    def save_sheet_data(self, sheet_data, batch_size=None, mode='replace', refresh_stats=True,
+                        workbook=DEFAULT_WORKBOOK):
+        """
+        Salva dados de uma sheet completa no banco (mesma semântica do Database)
+
+        Returns:
+            sheet_id: ID da sheet salva
+        """
+        if mode not in SAVE_MODES:
+            raise ValueError(f"mode inválido: {mode}")
+
+        with self._lock:
+            conn = self.get_connection()
+            try:
+                saved = self._save_sheet(conn, sheet_data, batch_size, mode, workbook)
+                conn.commit()
+                self.last_load_stats = saved['load_stats']
+                self.last_sync_stats = saved['sync_stats']
+            except Exception:
+                conn.rollback()
+                raise
+
+        if refresh_stats:
+            self.refresh_statistics(workbook=workbook)
+        return saved['sheet_id']
+
+    def save_workbook(self, sheets, batch_size=None, mode='replace', refresh_stats=True,
+                      max_workers=None, workbook=DEFAULT_WORKBOOK):
+        """
+        Salva várias sheets com tudo ou nada (mesmo retorno do Database)
+
+        O SQLite tem um único escritor: as sheets são gravadas em sequência,
+        em uma única transação; max_workers é ignorado.
+        """
+        if mode not in SAVE_MODES:
+            raise ValueError(f"mode inválido: {mode}")
+
+        with self._lock:
+            conn = self.get_connection()
+            try:
+                results = []
+                for sheet_data in sheets:
+                    saved = self._save_sheet(conn, sheet_data, batch_size, mode, workbook)
+                    results.append(dict(saved, name=sheet_data['name']))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+        if refresh_stats:
+            self.refresh_statistics(workbook=workbook)
+        return results
+
+    def _save_sheet(self, conn, sheet_data, batch_size=None, mode='replace', workbook=DEFAULT_WORKBOOK):
+        """Grava uma sheet na transação corrente (sem commit)"""
+        column_mapping = sheet_data.get('column_mapping') or {}
+
+        # 1. Inserir ou atualizar sheet
+        sheet_id = conn.execute("""
+            INSERT INTO sheets (workbook, name, total_records, source_file)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (workbook, name) DO UPDATE
+            SET total_records = excluded.total_records,
+                last_updated = CURRENT_TIMESTAMP
+            RETURNING id
+        """, (
+            workbook,
+            sheet_data['name'],
+            sheet_data['total_records'],
+            sheet_data.get('source_file', '')
+        )).fetchone()[0]
+
+        if mode == 'sync':
+            previous = conn.execute(
+                "SELECT mapping FROM column_mappings WHERE sheet_id = ?", (sheet_id,)
+            ).fetchone()
+            mapping_changed = previous is not None and json.loads(previous[0]) != column_mapping
+
+            # 2/3. Aplicar apenas o diff dos records
+            sync_stats = self._sync_records(
+                conn, sheet_id, sheet_data.get('records', []), batch_size, column_mapping
+            )
+            load_stats = self.last_load_stats
+        else:
+            # 2. Deletar records antigos
+            conn.execute("DELETE FROM records WHERE sheet_id = ?", (sheet_id,))
+
+            # 3. Inserir novos records em lotes
+            key_column = column_mapping.get('nome')
+            load_stats = self._insert_rows(
+                conn, sheet_id, fingerprint_records(sheet_data.get('records', []), key_column),
+                batch_size, column_mapping
+            )
+            sync_stats = None
+            mapping_changed = False
+
+        # 4. Salvar/atualizar statistics
+        if sheet_data.get('statistics'):
+            conn.execute("""
+                INSERT INTO statistics (sheet_id, stats_data)
+                VALUES (?, ?)
+                ON CONFLICT (sheet_id) DO UPDATE
+                SET stats_data = excluded.stats_data,
+                    created_at = CURRENT_TIMESTAMP
+            """, (sheet_id, json.dumps(sheet_data['statistics'], default=str)))
+
+        # 4b. Uma linha de histórico por upload, com os totais
+        conn.execute(f"""
+            INSERT INTO statistics_history (sheet_id, total_records, {', '.join(HISTORY_METRICS)})
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (sheet_id, sheet_data['total_records'], *history_metrics(sheet_data.get('statistics'))))
+
+        # 5. Salvar/atualizar column_mapping
+        if sheet_data.get('column_mapping'):
+            conn.execute("""
+                INSERT INTO column_mappings (sheet_id, mapping)
+                VALUES (?, ?)
+                ON CONFLICT (sheet_id) DO UPDATE
+                SET mapping = excluded.mapping,
+                    created_at = CURRENT_TIMESTAMP
+            """, (sheet_id, json.dumps(sheet_data['column_mapping'])))
+
+        # 6. Recalcular as colunas tipadas dos records mantidos pelo sync
+        if mapping_changed:
+            self._refresh_typed_columns(conn, sheet_id, column_mapping)
+
+        return {'sheet_id': sheet_id, 'load_stats': load_stats, 'sync_stats': sync_stats}
+
+    def _sheet_statistics(self, conn, sheet_id, mapping):
+        """Estatísticas de uma sheet, no formato de calculate_statistics"""
+        def value_counts(column, top=None):
+            rows = conn.execute(f"""
+                SELECT {column} AS value, count(*) AS total
+                FROM records
+                WHERE sheet_id = ? AND {column} IS NOT NULL
+                GROUP BY 1
+                ORDER BY total DESC, value
+                LIMIT ?
+            """, (sheet_id, top if top is not None else -1))
+            return {row['value']: row['total'] for row in rows}
+
+        def periods(length, since=None):
+            rows = conn.execute(f"""
+                SELECT substr(data_contato, 1, {length}) AS period, count(*) AS total
+                FROM records
+                WHERE sheet_id = ? AND data_contato IS NOT NULL
+                  AND (? IS NULL OR data_contato >= ?)
+                GROUP BY 1
+                ORDER BY 1
+            """, (sheet_id, since, since))
+            return {row['period']: row['total'] for row in rows}
+
+        def filled(column):
+            return conn.execute(
+                "SELECT count(*) FROM records WHERE sheet_id = ? AND json_extract(data, ?) IS NOT NULL",
+                (sheet_id, _json_path(column))
+            ).fetchone()[0]
+
+        total = conn.execute(
+            "SELECT count(*) FROM records WHERE sheet_id = ?", (sheet_id,)
+        ).fetchone()[0]
+        stats = {}
+
+        if mapping.get('tipo'):
+            stats['por_tipo'] = value_counts('tipo')
+        if mapping.get('cidade'):
+            stats['top_cidades'] = value_counts('cidade', 10)
+        if mapping.get('data_contato'):
+            stats['contatos_realizados'] = filled(mapping['data_contato'])
+            stats['contatos_pendentes'] = total - stats['contatos_realizados']
+        if mapping.get('contrato'):
+            stats['com_contrato'] = conn.execute(
+                "SELECT count(*) FROM records WHERE sheet_id = ? AND tem_contrato = 1", (sheet_id,)
+            ).fetchone()[0]
+            stats['sem_contrato'] = total - stats['com_contrato']
+        if mapping.get('grupo'):
+            stats['top_grupos'] = value_counts('grupo', 10)
+
+        if mapping.get('data_contato'):
+            monthly = periods(7)
+            if monthly:
+                stats['evolucao_temporal'] = monthly
+                stats['contatos_por_ano'] = periods(4)
+                since = conn.execute("SELECT date('now', '-365 days')").fetchone()[0]
+                last_12 = periods(7, since)
+                if last_12:
+                    stats['ultimos_12_meses'] = last_12
+
+        first = conn.execute(
+            "SELECT data FROM records WHERE sheet_id = ? ORDER BY id LIMIT 1", (sheet_id,)
+        ).fetchone()
+        if first:
+            for column in json.loads(first['data']):
+                if 'estacionamento' in column.lower() and 'oper' in column.lower():
+                    rows = conn.execute("""
+                        SELECT json_extract(data, ?) AS value, count(*) AS total
+                        FROM records
+                        WHERE sheet_id = ? AND json_extract(data, ?) IS NOT NULL
+                        GROUP BY 1
+                        ORDER BY total DESC, value
+                    """, (_json_path(column), sheet_id, _json_path(column)))
+                    stats['operacao_estacionamento'] = {
+                        str(row['value']): row['total'] for row in rows
+                    }
+                    break
+
+        return stats
+
+    def sheet_checksum(self, sheet_name, workbook=DEFAULT_WORKBOOK):
+        """
+        Contagem e checksum (md5 dos row_hash em ordem de id) dos records de
+        uma sheet; None se ela não existe
+        """
+        with self._lock:
+            conn = self.get_connection()
+            sheet = conn.execute(
+                "SELECT id, total_records FROM sheets WHERE workbook = ? AND name = ?",
+                (workbook, sheet_name)
+            ).fetchone()
+            if not sheet:
+                return None
+
+            checksum = hashlib.md5()
+            count = 0
+            for row in conn.execute(
+                "SELECT row_hash FROM records WHERE sheet_id = ? ORDER BY id", (sheet['id'],)
+            ):
+                checksum.update((row['row_hash'] or '').encode('ascii'))
+                count += 1
+            return {'total_records': sheet['total_records'], 'count': count, 'checksum': checksum.hexdigest()}
+
+    def refresh_statistics(self, force=False, workbook=None):
+        """
+        Recalcula a tabela sheet_statistics dos workbooks desatualizados
+
+        Com workbook, só ele é verificado; None verifica todos.
+
+        Returns:
+            True se as estatísticas de algum workbook foram recalculadas
+        """
+        with self._lock:
+            conn = self.get_connection()
+            try:
+                workbooks = [row['workbook'] for row in conn.execute("""
+                    SELECT workbook FROM workbook_statistics_state
+                    WHERE (? OR dirty = 1) AND (? IS NULL OR workbook = ?)
+                """, (force, workbook, workbook))]
+                if not workbooks:
+                    return False
+
+                for name in workbooks:
+                    conn.execute(
+                        "DELETE FROM sheet_statistics WHERE sheet_id IN (SELECT id FROM sheets WHERE workbook = ?)",
+                        (name,)
+                    )
+                    for row in conn.execute("""
+                        SELECT cm.sheet_id, cm.mapping
+                        FROM column_mappings cm
+                        JOIN sheets s ON s.id = cm.sheet_id
+                        WHERE s.workbook = ?
+                    """, (name,)).fetchall():
+                        stats = self._sheet_statistics(conn, row['sheet_id'], json.loads(row['mapping']))
+                        conn.execute(
+                            "INSERT INTO sheet_statistics (sheet_id, stats_data) VALUES (?, ?)",
+                            (row['sheet_id'], json.dumps(stats, ensure_ascii=False))
+                        )
+                    conn.execute("""
+                        UPDATE workbook_statistics_state
+                        SET dirty = 0, refreshed_at = CURRENT_TIMESTAMP
+                        WHERE workbook = ?
+                    """, (name,))
+                conn.commit()
+                return True
+            except Exception:
+                conn.rollback()
+                raise
+
+    def get_all_sheets_data(self, workbook=DEFAULT_WORKBOOK, sheets=None, include=None, fields=None):
+        """
+        Retorna os dados de um workbook em formato compatível com o dashboard
+        (mesmo formato do all_sheets_data.json), com a mesma projeção do
+        Database: records só são lidos se pedidos, das sheets pedidas.
+        Só leitura: as estatísticas vêm de sheet_statistics como estão
+        """
+        selected, include, fields = document_projection(sheets, include, fields) or (None, DOCUMENT_SECTIONS, None)
+
+        # json_each devolve os nomes como text: sheets pedidas em um array JSON
+        params = {'workbook': workbook, 'sheets': json.dumps(selected) if selected is not None else None}
+        selected_sql = "(:sheets IS NULL OR s.name IN (SELECT value FROM json_each(:sheets)))"
+
+        with self._lock:
+            conn = self.get_connection()
+            version, last_updated = self._data_version(conn, workbook)
+            sheets = self._document_sheets(conn, params, selected_sql)
+
+            # Todos os records das sheets em uma única leitura, agrupados por sheet
+            records_by_sheet = {}
+            if 'records' in include or 'columns' in include:
+                for row in conn.execute(f"""
+                    SELECT r.sheet_id, r.data FROM records r
+                    WHERE r.sheet_id IN (
+                        SELECT s.id FROM sheets s WHERE s.workbook = :workbook AND {selected_sql}
+                    )
+                    ORDER BY r.sheet_id, r.id
+                """, params):
+                    record = json.loads(row['data'])
+                    if fields is not None:
+                        record = {key: value for key, value in record.items() if key in fields}
+                    records_by_sheet.setdefault(row['sheet_id'], []).append(record)
+            conn.commit()
+
+        result = {
+            'sheets': [],
+            'last_updated': datetime.fromisoformat(last_updated).isoformat() if last_updated else None,
+            'data_version': version
+        }
+        for sheet in sheets:
+            records = records_by_sheet.get(sheet['id'], [])
+            document = {
+                'name': sheet['name'],
+                'total_records': sheet['total_records'],
+                'columns': list(records[0].keys()) if records else [],
+                'records': records,
+                'statistics': json.loads(sheet['statistics']) if sheet['statistics'] else {},
+                'column_mapping': json.loads(sheet['column_mapping']) if sheet['column_mapping'] else {}
+            }
+            result['sheets'].append({
+                key: value for key, value in document.items()
+                if key in ('name', 'total_records') + include
+            })
+        return result
+
+    def _document_sheets(self, conn, params, selected_sql):
+        """Sheets do documento do dashboard (sem records), na ordem do nome"""
+        return conn.execute(f"""
+            SELECT
+                s.id,
+                s.name,
+                s.total_records,
+                COALESCE(ss.stats_data, st.stats_data) AS statistics,
+                cm.mapping AS column_mapping
+            FROM sheets s
+            LEFT JOIN statistics st ON s.id = st.sheet_id
+            LEFT JOIN sheet_statistics ss ON s.id = ss.sheet_id
+            LEFT JOIN column_mappings cm ON s.id = cm.sheet_id
+            WHERE s.workbook = :workbook AND {selected_sql}
+            ORDER BY s.name
+        """, params).fetchall()
+
+    def stream_sheets_data(self, workbook=DEFAULT_WORKBOOK, sheets=None, include=None, fields=None):
+        """
+        O documento de get_all_sheets_data em NDJSON, em blocos de bytes (mesmo
+        formato do Database), lendo os records pelo cursor do sqlite3 em vez
+        de carregar o workbook inteiro; o lock da instância fica com o gerador
+        até ele terminar ou ser fechado
+        """
+        selected, include, fields = document_projection(sheets, include, fields) or (None, DOCUMENT_SECTIONS, None)
+
+        params = {'workbook': workbook, 'sheets': json.dumps(selected) if selected is not None else None}
+        selected_sql = "(:sheets IS NULL OR s.name IN (SELECT value FROM json_each(:sheets)))"
+
+        def project(data):
+            """Record decodificado, só com as chaves em fields (se houver)"""
+            record = json.loads(data)
+            if fields is None:
+                return record
+            return {key: value for key, value in record.items() if key in fields}
+
+        with self._lock:
+            conn = self.get_connection()
+            try:
+                version, last_updated = self._data_version(conn, workbook)
+                sheets = self._document_sheets(conn, params, selected_sql)
+                yield ndjson_line('workbook', {
+                    'name': workbook,
+                    'last_updated': datetime.fromisoformat(last_updated).isoformat() if last_updated else None,
+                    'data_version': version
+                })
+
+                for sheet in sheets:
+                    rows, first = None, None
+                    if 'records' in include or 'columns' in include:
+                        rows = conn.execute(
+                            "SELECT data FROM records WHERE sheet_id = ? ORDER BY id", (sheet['id'],)
+                        )
+                        first = rows.fetchone()
+                    document = {
+                        'name': sheet['name'],
+                        'total_records': sheet['total_records'],
+                        'columns': list(project(first['data'])) if first else [],
+                        'statistics': json.loads(sheet['statistics']) if sheet['statistics'] else {},
+                        'column_mapping': json.loads(sheet['column_mapping']) if sheet['column_mapping'] else {}
+                    }
+                    yield ndjson_line('sheet', {
+                        key: value for key, value in document.items()
+                        if key in ('name', 'total_records') + include
+                    })
+                    if 'records' not in include or first is None:
+                        continue
+
+                    lines = []
+                    for row in chain([first], rows):
+                        data = row['data'] if fields is None else json.dumps(project(row['data']))
+                        lines.append(ndjson_record(data))
+                        if len(lines) == self.batch_size:
+                            yield b''.join(lines)
+                            lines = []
+                    if lines:
+                        yield b''.join(lines)
+            finally:
+                conn.commit()
+
+    def _data_version(self, conn, workbook):
+        """(versão dos dados, última gravação) do workbook, a partir de workbook_data_version"""
+        row = conn.execute("""
+            SELECT (SELECT version FROM workbook_data_version WHERE workbook = :workbook) AS version,
+                   count(*) AS sheets, max(id) AS max_id, max(last_updated) AS last_updated
+            FROM sheets WHERE workbook = :workbook
+        """, {'workbook': workbook}).fetchone()
+        # Com as sheets junto do contador: um banco recriado não repete versões
+        key = f"{row['version'] or 0}:{row['sheets']}:{row['max_id']}:{row['last_updated']}"
+        return hashlib.md5(key.encode('utf-8')).hexdigest(), row['last_updated']
+
+    def data_version(self, workbook=DEFAULT_WORKBOOK):
+        """Versão dos dados de um workbook (mesmo data_version de get_all_sheets_data)"""
+        with self._lock:
+            conn = self.get_connection()
+            version, _ = self._data_version(conn, workbook)
+            conn.commit()
+            return version
+
+    def get_statistics_history(self, workbook=DEFAULT_WORKBOOK, sheet_name=None, since=None):
+        """Séries de tendência das estatísticas por sheet (mesmo retorno do Database)"""
+        since = iso_date_param(since)
+        metrics = ', '.join(f"h.{name}" for name in HISTORY_METRICS)
+        rows = self.execute_query(f"""
+            SELECT s.name AS sheet, h.recorded_at, h.version, h.total_records, {metrics}
+            FROM sheets s
+            JOIN statistics_history h ON h.sheet_id = s.id
+            WHERE s.workbook = :workbook
+              AND (:sheet IS NULL OR s.name = :sheet)
+              AND (:since IS NULL OR h.recorded_at >= :since)
+            ORDER BY s.name, h.recorded_at, h.id
+        """, {'workbook': workbook, 'sheet': sheet_name, 'since': since}, fetch=True)
+
+        series = {}
+        for point in rows:
+            series.setdefault(point.pop('sheet'), []).append(point)
+        return [{'sheet': name, 'history': history} for name, history in series.items()]
+
+    def get_sheet_records(self, sheet_name, after=None, limit=DEFAULT_PAGE_SIZE,
+                          sort=None, descending=False, filters=None, workbook=DEFAULT_WORKBOOK):
+        """Página de records de uma sheet (mesma semântica do Database)"""
+        limit = max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+        direction = 'DESC' if descending else 'ASC'
+        comparison = '<' if descending else '>'
+
+        with self._lock:
+            conn = self.get_connection()
+            sheet = conn.execute(
+                "SELECT id, total_records FROM sheets WHERE workbook = ? AND name = ?",
+                (workbook, sheet_name)
+            ).fetchone()
+            if not sheet:
+                return None
+
+            where, params = typed_filters_sql(filters, placeholder=':{}', date_cast='')
+            if 'filter_tem_contrato' in params:
+                params['filter_tem_contrato'] = int(params['filter_tem_contrato'])
+            params.update({'sheet_id': sheet['id'], 'limit': limit + 1})
+
+            if sort:
+                sort_expr = "COALESCE(CAST(json_extract(data, :sort) AS TEXT), '')"
+                params['sort'] = _json_path(sort)
+                if after:
+                    params['after_value'], params['after_id'] = decode_cursor(after)
+                    where += f" AND ({sort_expr}, id) {comparison} (:after_value, :after_id)"
+                query = f"""
+                    SELECT id, data, {sort_expr} AS sort_value
+                    FROM records
+                    WHERE sheet_id = :sheet_id {where}
+                    ORDER BY {sort_expr} {direction}, id {direction}
+                    LIMIT :limit
+                """
+            else:
+                if after:
+                    params['after_id'] = decode_id_cursor(after)
+                    where += f" AND id {comparison} :after_id"
+                query = f"""
+                    SELECT id, data
+                    FROM records
+                    WHERE sheet_id = :sheet_id {where}
+                    ORDER BY id {direction}
+                    LIMIT :limit
+                """
+
+            rows = conn.execute(query, params).fetchall()
+            conn.commit()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        next_after = None
+        if has_more:
+            last = rows[-1]
+            next_after = encode_cursor(last['sort_value'], last['id']) if sort else str(last['id'])
+
+        return {
+            'sheet': sheet_name,
+            'total_records': sheet['total_records'],
+            'records': [json.loads(row['data']) for row in rows],
+            'next_after': next_after,
+            'has_more': has_more
+        }
+
+    def search_records(self, sheet_name, query, limit=DEFAULT_PAGE_SIZE, offset=0,
+                       workbook=DEFAULT_WORKBOOK):
+        """
+        Busca sem acentos nos records de uma sheet (mesma semântica do
+        Database; a relevância é a posição do termo no texto)
+        """
+        limit = max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+        offset = max(0, int(offset or 0))
+        term = search_normalize(query)
+
+        with self._lock:
+            conn = self.get_connection()
+            sheet = conn.execute(
+                "SELECT id FROM sheets WHERE workbook = ? AND name = ?", (workbook, sheet_name)
+            ).fetchone()
+            if not sheet:
+                return None
+
+            rows = conn.execute("""
+                SELECT data
+                FROM records
+                WHERE sheet_id = ? AND search_text LIKE ? ESCAPE '\\'
+                ORDER BY instr(search_text, ?), id
+                LIMIT ? OFFSET ?
+            """, (sheet['id'], '%' + escape_like(term) + '%', term, limit + 1, offset)).fetchall()
+            conn.commit()
+
+        return {
+            'sheet': sheet_name,
+            'query': query,
+            'records': [json.loads(row['data']) for row in rows[:limit]],
+            'offset': offset,
+            'has_more': len(rows) > limit
+        }
+
+    def export_records(self, sheet_name, out, export_format='csv', filters=None,
+                       workbook=DEFAULT_WORKBOOK):
+        """
+        Exporta os records de uma sheet em CSV ou XLSX (mesma semântica do
+        Database), lendo pelo cursor do sqlite3 sem carregar a sheet inteira
+
+        Returns:
+            quantidade de records exportados, ou None se a sheet não existe
+        """
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Formato inválido: {export_format}")
+        where, params = typed_filters_sql(filters, placeholder=':{}', date_cast='')
+        if 'filter_tem_contrato' in params:
+            params['filter_tem_contrato'] = int(params['filter_tem_contrato'])
+
+        with self._lock:
+            conn = self.get_connection()
+            try:
+                sheet = conn.execute(
+                    "SELECT id FROM sheets WHERE workbook = ? AND name = ?", (workbook, sheet_name)
+                ).fetchone()
+                if not sheet:
+                    return None
+                params['sheet_id'] = sheet['id']
+
+                first = conn.execute(
+                    "SELECT data FROM records WHERE sheet_id = ? ORDER BY id LIMIT 1", (sheet['id'],)
+                ).fetchone()
+                columns = list(json.loads(first['data'])) if first else []
+                records = (
+                    json.loads(row['data']) for row in conn.execute(
+                        f"SELECT data FROM records WHERE sheet_id = :sheet_id {where} ORDER BY id",
+                        params
+                    )
+                )
+
+                if export_format == 'xlsx':
+                    return write_xlsx(out, sheet_name, columns, records)
+
+                out.write(CSV_BOM)
+                if not columns:
+                    return 0
+                # Linhas acumuladas em lotes de batch_size e enviadas em UTF-8
+                buffer = io.StringIO()
+                writer = csv.writer(buffer, lineterminator='\n')
+                writer.writerow(columns)
+                count = 0
+                for record in records:
+                    writer.writerow([json_text(record.get(column)) for column in columns])
+                    count += 1
+                    if count % self.batch_size == 0:
+                        out.write(buffer.getvalue().encode('utf-8'))
+                        buffer.seek(0)
+                        buffer.truncate()
+                out.write(buffer.getvalue().encode('utf-8'))
+                return count
+            finally:
+                conn.commit()
+
+    def list_workbooks(self):
+        """Workbooks com ao menos uma sheet (mesmo retorno do Database)"""
+        return self.execute_query("""
+            SELECT workbook, count(*) AS sheets, sum(total_records) AS total_records,
+                   max(last_updated) AS last_updated
+            FROM sheets
+            GROUP BY workbook
+            ORDER BY workbook
+        """, fetch=True)
+
+    def delete_all_data(self, workbook=None):
+        """Limpa todos os dados, ou só os de um workbook (útil para testes)"""
+        with self._lock:
+            conn = self.get_connection()
+            if workbook is None:
+                conn.execute("DELETE FROM sheets")
+            else:
+                conn.execute("DELETE FROM sheets WHERE workbook = ?", (workbook,))
+            conn.commit()
@@ -1,9 +1,19 @@
 """
 Script para migrar dados do JSON local para o banco Neon
+
+O JSON é lido em streaming e as sheets são carregadas em paralelo, em
+lotes; o checkpoint (.migration_checkpoint.json) permite retomar uma
+execução interrompida a partir do último lote gravado.
 """
-import json
 import os
-from database.db import Database
+import time
+from functools import partial
+from database.backends import get_database
+from database.migration import (
+    DEFAULT_CHECKPOINT_FILE, MigrationCheckpoint, scan_sheets, iter_rows
+)
+
+SOURCE_FILE = 'all_sheets_data.json'
 
 # Carregar variáveis do arquivo .env
 def load_env():
@@ -36,7 +46,7 @@ def migrate_data():
         return False
 
     # Verificar se arquivo JSON existe
-    if not os.path.exists('all_sheets_data.json'):
+    if not os.path.exists(SOURCE_FILE):
         print("\n[ERRO] Arquivo 'all_sheets_data.json' não encontrado!")
         print("Execute 'python process_excel_dynamic.py' primeiro")
         return False
@@ -47,7 +57,7 @@ def migrate_data():
     # Conectar ao banco
     print("\n[1/3] Conectando ao banco Neon...")
     try:
-        db = Database()
+        db = get_database()
         print("[OK] Conexão estabelecida!")
     except Exception as e:
         print(f"[ERRO] Falha ao conectar: {e}")
@@ -61,43 +71,109 @@ def migrate_data():
     except Exception as e:
         print(f"[AVISO] Erro ao criar schema (pode já existir): {e}")
 
-    # Carregar dados do JSON
+    # Ler o JSON em streaming: uma passada para os dados de cada sheet,
+    # contagens e checksums; os records são relidos sob demanda na carga
     print("\n[3/3] Migrando dados do JSON...")
-    with open('all_sheets_data.json', 'r', encoding='utf-8') as f:
-        data = json.load(f)
-
-    sheets = data.get('sheets', [])
+    sheets = scan_sheets(SOURCE_FILE)
     print(f"[OK] {len(sheets)} sheets encontradas no JSON")
 
-    # Migrar cada sheet
-    success_count = 0
+    checkpoint = MigrationCheckpoint(DEFAULT_CHECKPOINT_FILE, SOURCE_FILE)
+    if checkpoint.sheets:
+        print(f"[OK] Checkpoint encontrado: retomando {len(checkpoint.sheets)} sheets")
+
+    workbook = []
     for sheet in sheets:
-        try:
-            print(f"\n  -> Migrando '{sheet['name']}'...")
-            print(f"     Total de registros: {sheet['total_records']}")
+        print(f"  -> '{sheet['name']}': {sheet['record_count']} registros")
+        workbook.append({
+            'name': sheet['name'],
+            'total_records': sheet['record_count'],
+            'statistics': sheet.get('statistics'),
+            'column_mapping': sheet.get('column_mapping'),
+            'read_rows': partial(iter_rows, SOURCE_FILE, sheet)
+        })
+
+    totals = {sheet['name']: sheet['record_count'] for sheet in sheets}
+    reported = {}
+
+    def progress(name, loaded):
+        """Mostra o avanço de cada sheet a cada 10%"""
+        step = loaded * 10 // max(totals[name], 1)
+        if step > reported.get(name, 0):
+            reported[name] = step
+            print(f"     '{name}': {loaded}/{totals[name]} registros")
+
+    # Sheets em paralelo, com commit e checkpoint por lote; a publicação
+    # continua sendo tudo ou nada
+    try:
+        start = time.perf_counter()
+        results = db.load_workbook_stream(workbook, checkpoint, on_batch=progress)
+        elapsed = time.perf_counter() - start
+    except Exception as e:
+        print(f"     [ERRO] Falha ao migrar (nenhuma sheet foi publicada): {e}")
+        print("     Execute o script novamente para retomar do último lote gravado")
+        return False
 
-            sheet_id = db.save_sheet_data(sheet)
+    for result in results:
+        stats = result['load_stats']
+        resumed = f", retomada do registro {result['resumed_from']}" if result.get('resumed_from') else ''
+        print(f"     [OK] '{result['name']}' salva com ID {result['sheet_id']}: "
+              f"{stats['rows']} registros em {stats['seconds']}s "
+              f"({stats['rows_per_sec']} registros/s, {stats['batches']} lotes{resumed})")
+    print(f"\n[OK] {len(results)} sheets gravadas em {elapsed:.2f}s")
 
-            print(f"     [OK] Sheet salva com ID: {sheet_id}")
-            success_count += 1
-        except Exception as e:
-            print(f"     [ERRO] Falha ao migrar: {e}")
+    # Recalcular estatísticas no banco uma vez, após todas as sheets
+    try:
+        db.refresh_statistics(force=True)
+        print("\n[OK] Estatísticas recalculadas no banco")
+    except Exception as e:
+        print(f"\n[AVISO] Falha ao recalcular estatísticas: {e}")
 
-    print("\n" + "="*60)
-    print(f"MIGRAÇÃO CONCLUÍDA: {success_count}/{len(sheets)} sheets migradas")
-    print("="*60)
+    # Documento do dashboard pronto para envio em /api/data, por workbook
+    try:
+        for item in db.list_workbooks():
+            db.store_dashboard_payload(item['workbook'])
+        print("[OK] Documentos do dashboard gravados")
+    except Exception as e:
+        print(f"[AVISO] Falha ao gravar os documentos do dashboard: {e}")
+
+    # Remover os records das versões substituídas pela migração
+    try:
+        removed = db.collect_old_versions()
+        print(f"[OK] {removed} registros de versões antigas removidos")
+    except Exception as e:
+        print(f"[AVISO] Falha ao remover versões antigas: {e}")
 
-    # Verificar dados migrados
-    print("\n[VERIFICAÇÃO] Buscando dados do banco...")
+    # Índices por chave do JSONB para as colunas mapeadas das sheets grandes
     try:
-        all_data = db.get_all_sheets_data()
-        print(f"[OK] {len(all_data['sheets'])} sheets no banco")
-        for sheet in all_data['sheets']:
-            print(f"  - {sheet['name']}: {sheet['total_records']} registros")
+        actions = db.sync_record_indexes()
+        print(f"[OK] {sum(a['action'] == 'created' for a in actions)} índices por chave criados")
     except Exception as e:
-        print(f"[ERRO] Falha ao verificar: {e}")
+        print(f"[AVISO] Falha ao atualizar os índices por chave: {e}")
+
+    print("\n" + "="*60)
+    print(f"MIGRAÇÃO CONCLUÍDA: {len(results)}/{len(sheets)} sheets migradas")
+    print("="*60)
+
+    # Verificar por contagem e checksum calculados no banco (sem reler os records)
+    print("\n[VERIFICAÇÃO] Comparando contagens e checksums...")
+    failures = 0
+    for sheet in sheets:
+        stored = db.sheet_checksum(sheet['name'])
+        if not stored:
+            print(f"  [ERRO] {sheet['name']}: sheet não encontrada no banco")
+            failures += 1
+        elif stored['count'] != sheet['record_count'] or stored['checksum'] != sheet['checksum']:
+            print(f"  [ERRO] {sheet['name']}: {stored['count']}/{sheet['record_count']} registros, "
+                  f"checksum {stored['checksum']} (esperado {sheet['checksum']})")
+            failures += 1
+        else:
+            print(f"  - {sheet['name']}: {stored['count']} registros, checksum OK")
+
+    if failures:
+        print(f"\n[ERRO] {failures} sheets divergentes")
         return False
 
+    checkpoint.clear()
     print("\n[OK] Migração concluída com sucesso!")
     return True
 